@@ -3,7 +3,9 @@ import json
 import boto3
 import time
 import re
-from typing import Dict, Optional, List
+from typing import Dict
+
+from services.msc_parser import iter_msc_records, MSCCell
 
 class MappingAgent:
     """
@@ -85,41 +87,33 @@ class MappingAgent:
         cells = {}
         merged_cells = {}
         
-        lines = msc_code.split('\n')
-        
-        for line in lines:
-            line = line.strip()
+        # Stream cell records; style tables and sheet layout are not needed here
+        for cell in iter_msc_records(msc_code):
+            if type(cell) is not MSCCell:
+                continue
             
             # Parse cell lines: cell:B2:t:Company Name:f:1
-            if line.startswith('cell:'):
-                parts = line.split(':')
-                if len(parts) >= 3:
-                    cell_ref = parts[1]
-                    cell_data = {'ref': cell_ref}
-                    
-                    # Parse cell properties
-                    i = 2
-                    while i < len(parts):
-                        key = parts[i]
-                        if i + 1 < len(parts):
-                            value = parts[i + 1]
-                            if key == 't':  # text
-                                cell_data['text'] = value
-                            elif key == 'v':  # value
-                                cell_data['value'] = value
-                            elif key == 'f':  # font
-                                cell_data['font'] = value
-                            elif key == 'c':  # color
-                                cell_data['color'] = value
-                            elif key == 'bg':  # background
-                                cell_data['background'] = value
-                            elif key == 'colspan':
-                                cell_data['colspan'] = int(value)
-                            elif key == 'rowspan':
-                                cell_data['rowspan'] = int(value)
-                        i += 2
-                    
-                    cells[cell_ref] = cell_data
+            cell_ref = cell.ref
+            cell_data = {'ref': cell_ref}
+            
+            if cell.datatype == 't':  # text
+                cell_data['text'] = cell.value
+            elif cell.datatype:  # value, formula result or constant
+                cell_data['value'] = cell.value
+            if cell.formula:
+                cell_data['formula'] = cell.formula
+            if cell.font:
+                cell_data['font'] = str(cell.font)
+            if cell.color:
+                cell_data['color'] = str(cell.color)
+            if cell.bgcolor:
+                cell_data['background'] = str(cell.bgcolor)
+            if cell.colspan > 1 or cell.rowspan > 1:
+                cell_data['colspan'] = cell.colspan
+                cell_data['rowspan'] = cell.rowspan
+                merged_cells[cell_ref] = {'colspan': cell.colspan, 'rowspan': cell.rowspan}
+            
+            cells[cell_ref] = cell_data
         
         return {'cells': cells, 'merged_cells': merged_cells}
 
@@ -8,8 +8,12 @@ def register_blueprints(app):
     from api.agent import agent_bp
     from api.pdf import pdf_bp
     from api.storage import storage_bp
+    from api.jobs import jobs_bp
+    from api.preview import preview_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(agent_bp)
     app.register_blueprint(pdf_bp)
     app.register_blueprint(storage_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(preview_bp)
@@ -0,0 +1,166 @@
+"""
+Render Job API routes - background PDF renders.
+"""
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import json
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api')
+
+
+def job_accepted(job: dict):
+    """202 response for a newly queued job, with the URLs to follow it"""
+    base = f"/api/jobs/{job['id']}"
+    return jsonify({
+        'success': True,
+        'data': {
+            **job,
+            'statusUrl': base,
+            'eventsUrl': f'{base}/events',
+            'resultUrl': f'{base}/result',
+        }
+    }), 202
+
+
+def submit_job(job_type: str, payload: dict):
+    """Queue a job and build the response (202, or 503 when the queue is full)"""
+    from services.render_jobs import render_jobs, QueueFullError
+    try:
+        return job_accepted(render_jobs.submit(job_type, payload))
+    except QueueFullError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Render queue is full: {str(e)}'
+        }), 503
+
+
+@jobs_bp.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Queue a PDF render
+
+    Body: {type: 'pdf' | 'html-pdf', sheetData | sheetHTML, settings}
+    """
+    try:
+        data = request.get_json()
+        job_type = (data or {}).get('type', 'pdf')
+        source = 'sheetHTML' if job_type == 'html-pdf' else 'sheetData'
+
+        if not data or not data.get(source):
+            return jsonify({
+                'success': False,
+                'error': f'Missing {source} in request body'
+            }), 400
+
+        if not isinstance(data[source], str) or not data[source].strip():
+            return jsonify({
+                'success': False,
+                'error': f'{source} must be a non-empty string'
+            }), 400
+
+        from services.render_jobs import JOB_TYPES
+        if job_type not in JOB_TYPES:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown job type: {job_type}"
+            }), 400
+
+        return submit_job(job_type, {source: data[source].strip(), 'settings': data.get('settings', {})})
+
+    except Exception as e:
+        print(f"Error in create_job endpoint: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+
+@jobs_bp.route('/jobs/stats', methods=['GET'])
+def job_stats():
+    """Job counts by status and worker configuration"""
+    from services.render_jobs import render_jobs
+    return jsonify({
+        'success': True,
+        'data': render_jobs.stats()
+    })
+
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a job's status"""
+    from services.render_jobs import render_jobs
+    job = render_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    return jsonify({
+        'success': True,
+        'data': job
+    })
+
+
+@jobs_bp.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    from services.render_jobs import render_jobs
+    job = render_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    return jsonify({
+        'success': True,
+        'data': job
+    })
+
+
+@jobs_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-sent events: one event per status change, named after the
+    status, until the job finishes
+    """
+    from services.render_jobs import render_jobs
+    if render_jobs.get(job_id) is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+
+    def stream():
+        for job in render_jobs.events(job_id):
+            if job is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@jobs_bp.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Download the PDF of a finished job"""
+    from services.render_jobs import render_jobs
+    from api.pdf import pdf_response
+
+    job = render_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+
+    pdf_file = render_jobs.result_file(job_id)
+    if pdf_file is None:
+        return jsonify({
+            'success': False,
+            'error': f"Job is {job['status']}",
+            'data': job
+        }), 409 if job['status'] in ('queued', 'running') else 410
+
+    return pdf_response(pdf_file, job['result']['filename'])
@@ -1,18 +1,125 @@
 """
 PDF Generation API routes.
 """
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, send_file
+from io import BytesIO
+import base64
+import gzip
+import hashlib
+import itertools
 import os
-import json
 import time
+import zlib
 
 pdf_bp = Blueprint('pdf', __name__, url_prefix='/api')
 
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+
+
+def accepts_gzip() -> bool:
+    return 'gzip' in request.accept_encodings
+
+
+def gzip_response(response: Response) -> Response:
+    """Compress a buffered response body when the client accepts gzip and it is worth it"""
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or not accepts_gzip():
+        return response
+    body = response.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(body, GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def gzip_stream(chunks):
+    """gzip a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def wants_pdf_stream(data: dict = None) -> bool:
+    """
+    Whether to answer with application/pdf instead of base64 in JSON:
+    ?format=pdf, "format": "pdf" in the body, or an Accept header that
+    prefers application/pdf. JSON stays the default for older clients.
+    """
+    fmt = request.args.get('format') or (data or {}).get('format')
+    if fmt:
+        return fmt == 'pdf'
+    return request.accept_mimetypes.best_match(['application/json', 'application/pdf']) == 'application/pdf'
+
+
+def pdf_response(pdf, filename: str, headers: dict = None):
+    """
+    Stream a PDF (bytes or a file path) with Content-Length, ETag and
+    Range / If-None-Match handling
+    """
+    if isinstance(pdf, bytes):
+        etag = hashlib.blake2b(pdf, digest_size=16).hexdigest()
+        pdf = BytesIO(pdf)
+    else:
+        etag = True
+    response = send_file(pdf, mimetype='application/pdf', download_name=filename,
+                         etag=etag, conditional=True, max_age=0)
+    if headers:
+        response.headers.update(headers)
+    return response
+
+
+def png_response(png: bytes, max_age: int = 0):
+    """Send a PNG with an ETag so unchanged thumbnails revalidate with a 304"""
+    etag = hashlib.blake2b(png, digest_size=16).hexdigest()
+    return send_file(BytesIO(png), mimetype='image/png', etag=etag,
+                     conditional=True, max_age=max_age)
+
+
+def dispatched_pdf_response(data: dict, sheet_data, sheet_html, settings: dict):
+    """
+    Render through the renderer registry (data.engine, default 'auto';
+    data.fallback) and answer like /generate-pdf, naming the engine used
+    """
+    from services.renderers import render_pdf, renderer_registry
+    engine = data.get('engine') or 'auto'
+    if engine != 'auto' and renderer_registry.get(engine) is None:
+        return jsonify({
+            'success': False,
+            'error': f"engine must be auto or one of {', '.join(renderer_registry.names())}"
+        }), 400
+
+    if data.get('async'):
+        from api.jobs import submit_job
+        return submit_job('render-pdf', {'sheetData': sheet_data, 'sheetHTML': sheet_html, 'settings': settings,
+                                         'engine': engine, 'fallback': data.get('fallback')})
+
+    stream = wants_pdf_stream(data)
+    result = render_pdf(sheet_data, settings, sheet_html, engine, data.get('fallback'), raw=stream)
+
+    if result['success'] and stream:
+        return pdf_response(result['data']['pdf'], result['data']['filename'],
+                            {'X-Renderer': result['data']['engine']})
+    elif result['success']:
+        return jsonify(result)
+    elif result.pop('invalid', False):
+        return jsonify(result), 400
+    else:
+        return jsonify(result), 503 if result.pop('busy', False) else 500
+
 
 @pdf_bp.route('/generate-preview', methods=['POST'])
 def generate_preview():
     """
-    Generate a preview image from SocialCalc sheet data
+    Generate an HTML preview from SocialCalc sheet data
+
+    Answers with base64 HTML in JSON; ?format=html (or "format": "html")
+    streams the document itself. Both are gzip-encoded for clients that
+    accept it.
     """
     try:
         data = request.get_json()
@@ -32,12 +139,27 @@ def generate_preview():
                 'error': 'sheetData cannot be empty'
             }), 400
 
+        if (request.args.get('format') or data.get('format')) == 'html':
+            # Current sheet only, streamed as it is built
+            from services.html_preview import iter_sheet_html
+            from services.sheet_cache import load_sheet
+            chunks = iter_sheet_html(load_sheet(sheet_data), settings)
+            # Build the head now so parse and size errors still get a JSON 500
+            chunks = itertools.chain([next(chunks)], chunks)
+            if accepts_gzip():
+                response = Response(gzip_stream(chunks), mimetype='text/html')
+                response.headers['Content-Encoding'] = 'gzip'
+            else:
+                response = Response((chunk.encode('utf-8') for chunk in chunks), mimetype='text/html')
+            response.vary.add('Accept-Encoding')
+            return response
+
         # Generate preview HTML
         from services.html_preview import generate_html_preview
         result = generate_html_preview(sheet_data, settings)
 
         if result['success']:
-            return jsonify(result)
+            return gzip_response(jsonify(result))
         else:
             return jsonify(result), 500
 
@@ -51,10 +173,53 @@ def generate_preview():
         }), 500
 
 
+@pdf_bp.route('/generate-thumbnail', methods=['POST'])
+def generate_thumbnail():
+    """
+    Generate a PNG thumbnail of the first page of SocialCalc sheet data
+    (settings.width/height in pixels); ?format=png streams the image
+    """
+    try:
+        data = request.get_json()
+
+        if not data or 'sheetData' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Missing sheetData in request body'
+            }), 400
+
+        sheet_data = data.get('sheetData', '').strip()
+        settings = data.get('settings', {})
+
+        if not sheet_data:
+            return jsonify({
+                'success': False,
+                'error': 'sheetData cannot be empty'
+            }), 400
+
+        from services.pdf_generator import generate_preview_image
+        result = generate_preview_image(sheet_data, settings)
+
+        if not result['success']:
+            return jsonify(result), 500
+        if (request.args.get('format') or data.get('format')) == 'png':
+            return png_response(base64.b64decode(result['data']['preview']))
+        return jsonify(result)
+
+    except Exception as e:
+        print(f"Error in generate_thumbnail endpoint: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+
 @pdf_bp.route('/generate-pdf', methods=['POST'])
 def generate_pdf():
     """
-    Generate PDF from SocialCalc sheet data
+    Generate PDF from SocialCalc sheet data ("async": true queues a render job)
     """
     try:
         data = request.get_json()
@@ -67,6 +232,9 @@ def generate_pdf():
 
         sheet_data = data.get('sheetData', '').strip()
         settings = data.get('settings', {})
+        if data.get('appMapping'):
+            # Table header rows in the mapping are repeated on each page of long sheets
+            settings = {**settings, 'appMapping': data['appMapping']}
 
         if not sheet_data:
             return jsonify({
@@ -74,11 +242,24 @@ def generate_pdf():
                 'error': 'sheetData cannot be empty'
             }), 400
 
+        # A named engine (or "auto") goes through the renderer registry;
+        # whole workbooks (allSheets) always render with ReportLab
+        if data.get('engine') and not settings.get('allSheets'):
+            return dispatched_pdf_response(data, sheet_data, data.get('sheetHTML'), settings)
+
+        # Render in the background and answer with a job ID
+        if data.get('async'):
+            from api.jobs import submit_job
+            return submit_job('pdf', {'sheetData': sheet_data, 'settings': settings})
+
         # Generate PDF
         from services.pdf_generator import generate_pdf_from_socialcalc
-        result = generate_pdf_from_socialcalc(sheet_data, settings)
+        stream = wants_pdf_stream(data)
+        result = generate_pdf_from_socialcalc(sheet_data, settings, raw=stream)
 
-        if result['success']:
+        if result['success'] and stream:
+            return pdf_response(result['data']['pdf'], result['data']['filename'])
+        elif result['success']:
             return jsonify(result)
         else:
             return jsonify(result), 500
@@ -93,10 +274,267 @@ def generate_pdf():
         }), 500
 
 
+@pdf_bp.route('/page-layout', methods=['POST'])
+def page_layout_endpoint():
+    """
+    Page breaks, page count and fit scale of SocialCalc sheet data, without
+    rendering
+
+    Body: {sheetData, settings (paper, margins, scale, fitToPage, fitPages),
+    engine: 'pdf' (default) | 'html', appMapping?}
+    """
+    try:
+        data = request.get_json()
+
+        if not data or 'sheetData' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Missing sheetData in request body'
+            }), 400
+
+        sheet_data = data.get('sheetData', '').strip()
+        settings = data.get('settings', {})
+        if data.get('appMapping'):
+            settings = {**settings, 'appMapping': data['appMapping']}
+
+        if not sheet_data:
+            return jsonify({
+                'success': False,
+                'error': 'sheetData cannot be empty'
+            }), 400
+
+        from services.page_layout import get_page_layout, LAYOUT_ENGINES
+        engine = data.get('engine', 'pdf')
+        if engine not in LAYOUT_ENGINES:
+            return jsonify({
+                'success': False,
+                'error': f"engine must be one of {', '.join(LAYOUT_ENGINES)}"
+            }), 400
+
+        result = get_page_layout(sheet_data, settings, engine)
+
+        if result['success']:
+            return gzip_response(jsonify(result))
+        else:
+            return jsonify(result), 500
+
+    except Exception as e:
+        print(f"Error in page_layout endpoint: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+
+@pdf_bp.route('/render-pdf', methods=['POST'])
+def render_pdf_endpoint():
+    """
+    Generate a PDF with the cheapest installed engine that renders the
+    sheet's features, falling back to the next one when it fails
+
+    Body: {sheetData and/or sheetHTML, settings, engine: 'auto' | 'reportlab'
+    | 'wkhtmltopdf' | 'xhtml2pdf', fallback?, appMapping?, async?, format?}
+    """
+    try:
+        data = request.get_json() or {}
+        sheet_data = str(data.get('sheetData') or '').strip() or None
+        sheet_html = str(data.get('sheetHTML') or '').strip() or None
+        if not sheet_data and not sheet_html:
+            return jsonify({
+                'success': False,
+                'error': 'Missing sheetData or sheetHTML in request body'
+            }), 400
+
+        settings = data.get('settings', {})
+        if data.get('appMapping'):
+            settings = {**settings, 'appMapping': data['appMapping']}
+        return dispatched_pdf_response(data, sheet_data, sheet_html, settings)
+
+    except Exception as e:
+        print(f"Error in render_pdf endpoint: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+
+@pdf_bp.route('/renderers', methods=['GET'])
+def renderer_stats():
+    """Registered PDF engines: availability, capabilities, cost model, latency and counters"""
+    from services.renderers import renderer_registry
+    return jsonify({
+        'success': True,
+        'data': renderer_registry.stats()
+    })
+
+
+@pdf_bp.route('/render-bundle', methods=['POST'])
+def render_bundle_endpoint():
+    """
+    Render several artifacts of one sheet from a single parse
+
+    Body: {sheetData, settings, artifacts: ['html', 'png', 'pdf'],
+           thumbnail: {width, height}, output: 'inline' | 'keys'}
+    'inline' answers base64 artifacts; 'keys' answers cache keys with URLs
+    to fetch each artifact from /render-bundle/<artifact>/<key>
+    """
+    try:
+        data = request.get_json()
+
+        if not data or 'sheetData' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Missing sheetData in request body'
+            }), 400
+
+        sheet_data = data.get('sheetData', '').strip()
+        settings = data.get('settings', {})
+        if data.get('appMapping'):
+            settings = {**settings, 'appMapping': data['appMapping']}
+
+        if not sheet_data:
+            return jsonify({
+                'success': False,
+                'error': 'sheetData cannot be empty'
+            }), 400
+
+        from services.render_bundle import render_bundle, ARTIFACTS, OUTPUTS
+        artifacts = data.get('artifacts', list(ARTIFACTS))
+        output = data.get('output', 'inline')
+        if not isinstance(artifacts, list) or not all(isinstance(a, str) for a in artifacts) \
+                or output not in OUTPUTS:
+            return jsonify({
+                'success': False,
+                'error': f"artifacts must be a list of {', '.join(ARTIFACTS)}; output one of {', '.join(OUTPUTS)}"
+            }), 400
+
+        result = render_bundle(sheet_data, settings, artifacts, data.get('thumbnail'), output)
+
+        if 'data' in result:
+            result['data']['urls'] = {artifact: f'/api/render-bundle/{artifact}/{key}'
+                                      for artifact, key in result['data']['keys'].items()}
+        if result['success']:
+            return gzip_response(jsonify(result))
+        elif 'data' in result:
+            return jsonify(result), 503 if 'Renderer busy' in result['error'] else 500
+        else:
+            return jsonify(result), 400
+
+    except Exception as e:
+        print(f"Error in render_bundle endpoint: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+
+@pdf_bp.route('/render-bundle/<artifact>/<key>', methods=['GET'])
+def get_render_bundle_artifact(artifact, key):
+    """A rendered bundle artifact by cache key (404 once evicted)"""
+    from services.render_bundle import get_bundle_artifact, MIMETYPES
+    body = get_bundle_artifact(artifact, key)
+    if body is None:
+        return jsonify({
+            'success': False,
+            'error': 'Artifact not found or expired; render the bundle again'
+        }), 404
+    if artifact == 'pdf':
+        return pdf_response(body, request.args.get('filename', 'spreadsheet.pdf'),
+                            headers={'Cache-Control': 'private, max-age=3600'})
+    if artifact == 'png':
+        return png_response(body, max_age=3600)
+    response = gzip_response(Response(body, mimetype=MIMETYPES[artifact]))
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+@pdf_bp.route('/batch/generate-pdf', methods=['POST'])
+def batch_generate_pdf():
+    """
+    Render many sheets with shared settings into one merged PDF or a zip
+
+    Body: {items: [{id, sheetHTML | sheetData, settings?}], settings, output: 'merged' | 'zip'}
+    """
+    try:
+        data = request.get_json()
+
+        if not data or not isinstance(data.get('items'), list):
+            return jsonify({
+                'success': False,
+                'error': 'Missing items list in request body'
+            }), 400
+
+        from services.batch_render import render_batch
+        result = render_batch(data['items'], data.get('settings', {}), data.get('output', 'merged'))
+
+        if result['success']:
+            return jsonify(result)
+        elif 'data' in result:
+            return jsonify(result), 500
+        else:
+            return jsonify(result), 400
+
+    except Exception as e:
+        print(f"Error in batch_generate_pdf endpoint: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+
+@pdf_bp.route('/render-cache/stats', methods=['GET'])
+def render_cache_stats():
+    """
+    Hit/miss counters and memory use of the parsed sheet cache and the
+    rendered PDF and thumbnail caches, plus the wkhtmltopdf renderer pool
+    (null until the pool has been used) and the ReportLab render processes
+    """
+    from services.sheet_cache import sheet_cache
+    from services.pdf_cache import pdf_cache
+    from services.thumbnails import thumbnail_cache
+    from services.html_pdf_pool import pool_stats
+    from services.render_executor import render_executor
+    return jsonify({
+        'success': True,
+        'data': {
+            'sheets': sheet_cache.stats(),
+            'pdfs': pdf_cache.stats(),
+            'thumbnails': thumbnail_cache.stats(),
+            'htmlRenderers': pool_stats(),
+            'reportlabRenderers': render_executor.stats()
+        }
+    })
+
+
+@pdf_bp.route('/pdf-store/stats', methods=['GET'])
+def pdf_store_stats():
+    """
+    File count, bytes and sweep counters of the stored PDF directory
+    (?sweep=1 runs a janitor sweep first)
+    """
+    from services.pdf_store import pdf_store
+    if request.args.get('sweep') in ('1', 'true'):
+        pdf_store.sweep()
+    return jsonify({
+        'success': True,
+        'data': pdf_store.stats()
+    })
+
+
 @pdf_bp.route('/generate-pdf-from-html', methods=['POST'])
 def generate_pdf_from_html_endpoint():
     """
-    Generate PDF from SocialCalc HTML (same as preview)
+    Generate PDF from SocialCalc HTML (same as preview; "async": true queues
+    a render job). With the sheet's sheetData as well, fitToPage/fitPages
+    use the scale from the page layout.
     """
     try:
         data = request.get_json()
@@ -116,11 +554,28 @@ def generate_pdf_from_html_endpoint():
                 'error': 'sheetHTML cannot be empty'
             }), 400
 
+        if str(data.get('sheetData') or '').strip():
+            from services.page_layout import html_layout_settings
+            settings = html_layout_settings(data['sheetData'].strip(), settings)
+
+        if data.get('engine'):
+            return dispatched_pdf_response(data, str(data.get('sheetData') or '').strip() or None,
+                                           sheet_html, settings)
+
+        # Render in the background and answer with a job ID
+        if data.get('async'):
+            from api.jobs import submit_job
+            return submit_job('html-pdf', {'sheetHTML': sheet_html, 'settings': settings})
+
         # Generate PDF from HTML
         from services.pdf_from_html import generate_pdf_from_html
-        result = generate_pdf_from_html(sheet_html, settings)
+        stream = wants_pdf_stream(data)
+        result = generate_pdf_from_html(sheet_html, settings, raw=stream)
 
-        if result['success']:
+        if result['success'] and stream:
+            return pdf_response(result['data']['pdf'], result['data']['filename'],
+                                {'X-Cache': 'HIT' if result['data']['cached'] else 'MISS'})
+        elif result['success']:
             return jsonify(result)
         else:
             return jsonify(result), 500
@@ -139,6 +594,8 @@ def generate_pdf_from_html_endpoint():
 def get_htmltopdf():
     """
     Retrieve a previously generated PDF by file ID
+
+    Streamed from disk with ETag and Range support.
     """
     try:
         fname = request.args.get('fname')
@@ -150,17 +607,18 @@ def get_htmltopdf():
                 'error': 'Missing fname parameter'
             }), 400
         
-        # Determine storage path
-        base_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tmp')
-        if action == 'preview':
-            storage_path = os.path.join(base_path, 'preview')
-        else:
-            storage_path = base_path
-        
-        pdf_file = os.path.join(storage_path, f"{fname}.pdf")
+        # Same storage location generate_pdf_from_html_with_storage writes to
+        from services.pdf_from_html import stored_pdf_path
+        try:
+            pdf_file = stored_pdf_path(fname, action)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
-        if os.path.exists(pdf_file):
-            return send_file(pdf_file, mimetype='application/pdf')
+        if pdf_file:
+            return pdf_response(pdf_file, f"{fname}.pdf")
         else:
             return jsonify({
                 'success': False,
@@ -190,6 +648,7 @@ def post_htmltopdf():
             appname = data.get('appname', None)
             filename = data.get('filename', None)
             settings = data.get('settings', {})
+            stream = wants_pdf_stream(data)
         else:
             content = request.form.get('content', '')
             action = request.form.get('action', None)
@@ -197,6 +656,7 @@ def post_htmltopdf():
             appname = request.form.get('appname', None)
             filename = request.form.get('filename', None)
             settings = {}
+            stream = wants_pdf_stream(request.form)
         
         if not content:
             return jsonify({
@@ -204,30 +664,35 @@ def post_htmltopdf():
                 'error': 'Missing content in request'
             }), 400
         
+        # Save metadata next to the PDF if action is 'send'
+        metadata = None
+        if action == 'send':
+            metadata = {
+                "uuid": uuid,
+                "appname": appname,
+                "filename": filename,
+                "created": time.strftime("%Y:%m:%d %H:%M:%S")
+            }
+
         # Generate PDF with storage
         from services.pdf_from_html import generate_pdf_from_html_with_storage
-        result = generate_pdf_from_html_with_storage(content, settings, action)
+        result = generate_pdf_from_html_with_storage(content, settings, action, raw=stream, metadata=metadata)
         
         if result['success']:
             file_id = result['data']['fileId']
             
-            # Save metadata if action is 'send'
-            if action == 'send':
-                base_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tmp')
-                metadata = {
-                    "uuid": uuid,
-                    "appname": appname,
-                    "filename": filename,
-                    "created": time.strftime("%Y:%m:%d %H:%M:%S")
-                }
-                json_file = os.path.join(base_path, f"{file_id}.json")
-                with open(json_file, 'w') as f:
-                    json.dump(metadata, f)
-            
             # Build PDF URL
             pdfurl = f"http://{request.host}/api/htmltopdf?fname={file_id}"
             if action:
                 pdfurl += f"&action={action}"
+
+            if stream:
+                # Stream the stored file rather than the in-memory copy
+                return pdf_response(result['data']['filePath'], result['data']['filename'], {
+                    'X-File-Id': file_id,
+                    'X-Pdf-Url': pdfurl,
+                    'X-Cache': 'HIT' if result['data']['cached'] else 'MISS',
+                })
             
             return jsonify({
                 'success': True,
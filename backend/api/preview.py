@@ -0,0 +1,181 @@
+"""
+Live Preview API routes - preview sessions with row-level patches.
+"""
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import base64
+import json
+
+preview_bp = Blueprint('preview', __name__, url_prefix='/api')
+
+
+def session_not_found(session_id: str):
+    return jsonify({
+        'success': False,
+        'error': f'Preview session not found: {session_id}'
+    }), 404
+
+
+def encode_patch(patch: dict) -> dict:
+    """Full documents travel base64-encoded like /generate-preview; row patches as plain HTML"""
+    if 'document' in patch:
+        return {
+            'version': patch['version'],
+            'preview': base64.b64encode(patch['document'].encode('utf-8')).decode('utf-8'),
+            'type': 'html'
+        }
+    return patch
+
+
+@preview_bp.route('/preview-sessions', methods=['POST'])
+def create_preview_session():
+    """
+    Open a preview session: parses the sheet once and returns the full
+    preview document (version 0) with the URLs for deltas and events
+
+    Body: {sheetData, settings}
+    """
+    try:
+        data = request.get_json()
+        sheet_data = str((data or {}).get('sheetData', '')).strip()
+        if not sheet_data:
+            return jsonify({
+                'success': False,
+                'error': 'Missing sheetData in request body'
+            }), 400
+
+        from services.msc_parser import extract_savestr
+        from services.preview_sessions import preview_sessions
+        from api.pdf import gzip_response
+        session = preview_sessions.create(extract_savestr(sheet_data), data.get('settings', {}))
+
+        base = f'/api/preview-sessions/{session.id}'
+        response = gzip_response(jsonify({
+            'success': True,
+            'data': {
+                'sessionId': session.id,
+                **encode_patch(session.snapshot()),
+                'cellsUrl': f'{base}/cells',
+                'eventsUrl': f'{base}/events',
+            }
+        }))
+        response.status_code = 201
+        return response
+
+    except Exception as e:
+        print(f"Error in create_preview_session endpoint: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+
+@preview_bp.route('/preview-sessions/stats', methods=['GET'])
+def preview_session_stats():
+    """Open sessions and patch counters"""
+    from services.preview_sessions import preview_sessions
+    return jsonify({
+        'success': True,
+        'data': preview_sessions.stats()
+    })
+
+
+@preview_bp.route('/preview-sessions/<session_id>', methods=['GET'])
+def get_preview_session(session_id):
+    """Full preview document at the session's current version (resync)"""
+    from services.preview_sessions import preview_sessions, SessionNotFoundError
+    from api.pdf import gzip_response
+    try:
+        session = preview_sessions.get(session_id)
+    except SessionNotFoundError:
+        return session_not_found(session_id)
+    return gzip_response(jsonify({
+        'success': True,
+        'data': encode_patch(session.snapshot())
+    }))
+
+
+@preview_bp.route('/preview-sessions/<session_id>/cells', methods=['POST'])
+def update_preview_cells(session_id):
+    """
+    Apply cell deltas and return the changed rows
+
+    Body: {cells: ['cell:B4:v:12:f:2', 'cell:C9', ...], baseVersion}
+    Answers {version, rows: [{row, html}], css: [...]}, or {version,
+    preview} when the edit changed the layout. 409 when baseVersion is
+    stale; the client should GET the session to resync.
+    """
+    from services.preview_sessions import preview_sessions, SessionNotFoundError, VersionConflictError
+    try:
+        data = request.get_json() or {}
+        cells = data.get('cells')
+        if not isinstance(cells, list) or not all(isinstance(line, str) for line in cells):
+            return jsonify({
+                'success': False,
+                'error': 'cells must be a list of savestr lines'
+            }), 400
+
+        patch = preview_sessions.apply(session_id, cells, data.get('baseVersion'))
+        return jsonify({
+            'success': True,
+            'data': encode_patch(patch)
+        })
+
+    except SessionNotFoundError:
+        return session_not_found(session_id)
+    except VersionConflictError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'data': {'version': e.version}
+        }), 409
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        print(f"Error in update_preview_cells endpoint: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+
+@preview_bp.route('/preview-sessions/<session_id>/events', methods=['GET'])
+def preview_session_events(session_id):
+    """
+    Server-sent events: a `patch` event per edit after ?after=<version>
+    (a `document` event when a full resync is needed) until the session
+    closes
+    """
+    from services.preview_sessions import preview_sessions, SessionNotFoundError
+    try:
+        session = preview_sessions.get(session_id)
+    except SessionNotFoundError:
+        return session_not_found(session_id)
+    after = request.args.get('after', str(session.version))
+    after = int(after) if after.isdigit() else session.version
+
+    def stream():
+        for patch in session.events(after):
+            if patch is None:
+                yield ': keep-alive\n\n'
+            else:
+                event = 'document' if 'document' in patch else 'patch'
+                yield f"event: {event}\ndata: {json.dumps(encode_patch(patch))}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@preview_bp.route('/preview-sessions/<session_id>', methods=['DELETE'])
+def close_preview_session(session_id):
+    """Close a session and end its event streams"""
+    from services.preview_sessions import preview_sessions
+    if not preview_sessions.close(session_id):
+        return session_not_found(session_id)
+    return jsonify({'success': True})
@@ -80,6 +80,49 @@ def update_template_meta(filename):
     return jsonify({'success': False, 'error': 'Failed to update template'}), 500
 
 
+@storage_bp.route('/templates/<path:filename>/thumbnail', methods=['GET'])
+def get_template_thumbnail(filename):
+    """
+    PNG thumbnail of a template. The default size is stored next to the
+    template metadata (rendered once on first request); ?width=&height=
+    render other sizes through the thumbnail cache.
+    """
+    from api.pdf import png_response
+    from services.thumbnails import render_thumbnail, template_savestr
+    from services.html_pdf_pool import RendererBusyError
+
+    template_type = request.args.get('type', 'user')
+    user_id = request.args.get('userId', 'default_user')
+    bucket_type = 'app' if template_type == 'global' else template_type
+    settings = {name: int(request.args[name]) for name in ('width', 'height')
+                if request.args.get(name, '').isdigit()}
+
+    if not settings:
+        stored = s3_store.get_template_thumbnail(filename, bucket_type=bucket_type, user_id=user_id)
+        if stored:
+            return png_response(stored, max_age=3600)
+
+    template = s3_store.get_template(filename, bucket_type=bucket_type, user_id=user_id)
+    if not template:
+        return jsonify({'success': False, 'error': 'Template not found'}), 404
+
+    try:
+        png_bytes = render_thumbnail(template_savestr(template), settings)
+    except RendererBusyError as e:
+        return jsonify({'success': False, 'error': f'Preview renderer busy: {str(e)}'}), 503
+    except Exception as e:
+        print(f"Error rendering thumbnail for template {filename}: {str(e)}")
+        return jsonify({'success': False, 'error': f'Failed to render thumbnail: {str(e)}'}), 500
+
+    if not settings and s3_store.save_template_thumbnail(filename, png_bytes, bucket_type=bucket_type,
+                                                         user_id=user_id):
+        from services.template_thumbnails import template_image_hash
+        _, key = s3_store.template_thumbnail_location(filename, bucket_type, user_id)
+        s3_store.set_template_image(filename, key, template_image_hash(template_savestr(template)),
+                                    bucket_type=bucket_type, user_id=user_id)
+    return png_response(png_bytes, max_age=3600)
+
+
 @storage_bp.route('/templates/import', methods=['POST'])
 def import_template():
     """Import a template to user bucket"""
@@ -94,6 +137,10 @@ def import_template():
     result = s3_store.import_template(filename, target_filename=target_filename, user_id=user_id)
     
     if result:
+        from services.template_thumbnails import import_template_thumbnail
+        thumbnail = import_template_thumbnail(s3_store, filename, target_filename, user_id=user_id)
+        if not thumbnail['success']:
+            print(f"Thumbnail not stored for imported template {filename}: {thumbnail['error']}")
         return jsonify({'success': True})
     return jsonify({'success': False, 'error': 'Import failed'}), 500
 
@@ -169,14 +216,21 @@ def seed_templates():
         }), 400
         
     results = []
+    saved = []
     for t in data['templates']:
         filename = t.get('filename')
         content = t.get('content')
         if filename and content:
             success = s3_store.save_template(filename, content)
             results.append({'filename': filename, 'success': success})
+            if success:
+                saved.append({'filename': filename, 'template': content, 'bucketType': 'app'})
+
+    from services.template_thumbnails import publish_template_thumbnails
+    thumbnails = publish_template_thumbnails(s3_store, saved, force=bool(data.get('forceThumbnails')))
             
     return jsonify({
         'success': True,
-        'results': results
+        'results': results,
+        'thumbnails': thumbnails['data']
     })
@@ -21,6 +21,12 @@ CORS(app, resources={r"/api/*": {"origins": "*", "supports_credentials": True}})
 from api import register_blueprints
 register_blueprints(app)
 
+# Start the ReportLab render processes before the first request (not in the
+# render processes themselves, which re-import this module as __mp_main__)
+if os.environ.get('RENDER_PREWARM', '1') == '1' and __name__ != '__mp_main__':
+    from services.render_executor import render_executor
+    render_executor.start()
+
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark the server-side formula engine: full evaluation of the template
+corpus, and full recalculation against dirty-cell recalculation after a
+single edit in a large synthetic item table
+
+Usage: python benchmarks/bench_formula_engine.py [rows] [repeat]
+"""
+
+import sys
+
+from corpus import load_corpus, best_of, report
+from services.msc_parser import parse_msc
+from services.formula_engine import FormulaEngine
+
+
+def item_table_savestr(rows: int) -> str:
+    """Item rows (qty x price = amount) with subtotal, tax and total formulas"""
+    lines = ['version:1.5']
+    for r in range(1, rows + 1):
+        lines.append(f'cell:A{r}:t:Item {r}')
+        lines.append(f'cell:B{r}:v:{r % 7 + 1}')
+        lines.append(f'cell:C{r}:v:{r % 13 + 0.5}')
+        lines.append(f'cell:D{r}:vtf:n:0:B{r}*C{r}')
+    lines.append(f'cell:D{rows + 1}:vtf:n:0:SUM(D1:D{rows})')
+    lines.append(f'cell:D{rows + 2}:vtf:n:0:ROUND(D{rows + 1}*0.1,2)')
+    lines.append(f'cell:D{rows + 3}:vtf:n:0:D{rows + 1}+D{rows + 2}')
+    lines.append(f'sheet:c:4:r:{rows + 3}')
+    return '\n'.join(lines)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    sheets = [parse_msc(s) for s in load_corpus().values()]
+    formula_cells = sum(len(FormulaEngine(sheet).formulas) for sheet in sheets)
+    print(f"Corpus: {len(sheets)} templates, {formula_cells} formula cells")
+
+    corpus_eval = best_of(lambda: [FormulaEngine(sheet) for sheet in sheets], repeat)
+
+    table = parse_msc(item_table_savestr(rows))
+    engine = FormulaEngine(table)
+    print(f"Item table: {rows} rows, {len(engine.formulas)} formula cells\n")
+
+    full = best_of(engine.recalculate, repeat)
+    edits = iter(range(repeat * 10))
+
+    def edit_one():
+        # Each edit re-evaluates one amount cell plus subtotal, tax and total
+        engine.set_value(f'B{rows // 2}', float(next(edits)))
+
+    dirty = best_of(edit_one, repeat)
+
+    report([
+        ('corpus, build graph + evaluate', corpus_eval, None),
+        ('item table, full recalculation', full, None),
+        ('item table, dirty recalculation', dirty, full),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Throughput of HTML-to-PDF conversion: one wkhtmltopdf process per PDF with
+temp files (the previous generate_pdf_from_html path) against the warm
+renderer pool, sequentially and with concurrent requests
+
+Requires wkhtmltopdf on PATH (or WKHTMLTOPDF_BIN).
+
+Usage: python benchmarks/bench_html_pdf.py [jobs] [concurrency]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from corpus import load_corpus
+from services.html_preview import render_sheet_html
+from services.html_pdf_pool import RendererPool, WKHTMLTOPDF_BIN
+from services.msc_parser import parse_msc
+from services.pdf_from_html import build_html_document, wkhtmltopdf_options
+
+
+def legacy_render(complete_html, options):
+    """Temp HTML file in, temp PDF file out, one process per call"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        html_file = os.path.join(tmp_dir, 'in.html')
+        pdf_file = os.path.join(tmp_dir, 'out.pdf')
+        with open(html_file, 'w', encoding='utf-8') as f:
+            f.write(complete_html)
+        cmd = [WKHTMLTOPDF_BIN, '--quiet', '--enable-local-file-access', '--encoding', 'UTF-8']
+        subprocess.run(cmd + options + [html_file, pdf_file], capture_output=True, timeout=60)
+        with open(pdf_file, 'rb') as f:
+            return f.read()
+
+
+def run(render, documents, concurrency):
+    options = wkhtmltopdf_options({})
+    start = time.perf_counter()
+    if concurrency == 1:
+        for html in documents:
+            render(html, options)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda html: render(html, options), documents))
+    return time.perf_counter() - start
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    if shutil.which(WKHTMLTOPDF_BIN) is None:
+        print(f"{WKHTMLTOPDF_BIN} not found; install wkhtmltopdf to run this benchmark")
+        return
+
+    sheets = list(load_corpus().values())
+    documents = [build_html_document(render_sheet_html(parse_msc(sheets[i % len(sheets)]), {}), {})
+                 for i in range(jobs)]
+    pool = RendererPool(size=concurrency, queue_size=jobs)
+    pool.render(documents[0], wkhtmltopdf_options({}))  # warm one worker
+
+    print(f"{jobs} invoice PDFs\n")
+    for label, workers in (('sequential', 1), (f'{concurrency} concurrent', concurrency)):
+        legacy = run(legacy_render, documents, workers)
+        pooled = run(pool.render, documents, workers)
+        print(f"  {label:<14} process per PDF {jobs / legacy:6.1f} PDF/s   "
+              f"warm pool {jobs / pooled:6.1f} PDF/s   {legacy / pooled:5.2f}x")
+
+    print(f"\n  pool: {pool.stats()}")
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
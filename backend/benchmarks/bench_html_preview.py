@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+HTML preview builder: time per document and payload size (raw, gzip and the
+base64 JSON field) over the template corpus and long synthetic item lists
+
+Usage: python benchmarks/bench_html_preview.py [templates] [repeat]
+"""
+
+import gzip
+import sys
+
+from corpus import load_corpus, best_of, report
+from services.html_preview import render_sheet_html
+from services.msc_parser import parse_msc
+
+
+def long_sheet(rows: int) -> str:
+    lines = ['version:1.5', 'font:1:normal bold 10pt Arial', 'border:1:1px solid rgb(0,0,0)',
+             'valueformat:1:#,##0.00']
+    for row in range(1, rows + 1):
+        lines.append(f'cell:A{row}:v:{row}:f:1')
+        lines.append(f'cell:B{row}:t:Item {row}:b:1:1:1:1')
+        lines.append(f'cell:C{row}:v:{row * 1.25}:ntvf:1')
+    lines.append(f'sheet:c:3:r:{rows}')
+    return '\n'.join(lines) + '\n'
+
+
+def sizes(documents):
+    raw = [document.encode('utf-8') for document in documents]
+    total = sum(len(body) for body in raw)
+    zipped = sum(len(gzip.compress(body, 6)) for body in raw)
+    return total, zipped, (total + 2) // 3 * 4
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 695
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    sheets = [parse_msc(savestr) for savestr in list(load_corpus().values())[:count]]
+    documents = [render_sheet_html(sheet, {}) for sheet in sheets]  # warm formula values
+    print(f"{len(sheets)} templates, best of {repeat}\n")
+
+    seconds = best_of(lambda: [render_sheet_html(sheet, {}) for sheet in sheets], repeat)
+    raw, zipped, encoded = sizes(documents)
+    report([('corpus', seconds, 0)])
+    print(f"\n  per document: {seconds / len(sheets) * 1000:.2f} ms, {raw / len(sheets) / 1024:.1f} KB "
+          f"raw, {zipped / len(sheets) / 1024:.1f} KB gzip, {encoded / len(sheets) / 1024:.1f} KB base64\n")
+
+    rows = []
+    for row_count in (1000, 5000, 20000):
+        sheet = parse_msc(long_sheet(row_count))
+        document = render_sheet_html(sheet, {})
+        seconds = best_of(lambda: render_sheet_html(sheet, {}), repeat)
+        raw, zipped, _ = sizes([document])
+        rows.append((f'{row_count} rows ({raw // 1024} KB, {zipped // 1024} KB gzip)', seconds,
+                     rows[0][1] * row_count / 1000 if rows else 0))
+    report(rows)
+    print("\n  (ratio: 1000-row time scaled linearly; 1.00x is linear in rows)")
+
+
+if __name__ == '__main__':
+    main()
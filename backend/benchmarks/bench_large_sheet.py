@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Generation time and peak memory for long item lists: one Table with
+repeatRows=1 (largeSheet=false) against page-sized LongTable chunks
+
+Usage: python benchmarks/bench_large_sheet.py [max_rows]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.pdf_generator import SocialCalcPDFGenerator
+
+MAPPING = {'sheet1': {'lineItems': {'type': 'table', 'rows': {'start': 4, 'end': 4}, 'col': {}}}}
+
+
+def item_sheet(rows: int) -> str:
+    """Invoice-style sheet: title, a bordered header row and `rows` priced line items"""
+    lines = [
+        'version:1.5',
+        'font:1:normal bold 10pt Arial',
+        'border:1:1px solid rgb(0,0,0)',
+        'valueformat:1:$#,##0.00',
+        'cell:A1:t:Item list:f:1',
+        'cell:A3:t:Item:f:1:b:1:1:1:1',
+        'cell:B3:t:Qty:f:1:b:1:1:1:1',
+        'cell:C3:t:Price:f:1:b:1:1:1:1',
+        'cell:D3:t:Amount:f:1:b:1:1:1:1',
+    ]
+    for row in range(4, 4 + rows):
+        lines += [
+            f'cell:A{row}:t:Item {row}',
+            f'cell:B{row}:v:{row % 7 + 1}',
+            f'cell:C{row}:v:{row * 1.5}:ntvf:1',
+            f'cell:D{row}:vtf:n:0:B{row}*C{row}:ntvf:1',
+        ]
+    lines += ['col:A:w:200', f'sheet:c:4:r:{rows + 3}']
+    return '\n'.join(lines) + '\n'
+
+
+def measure(generator, savestr, settings, trace):
+    """
+    (seconds, peak traced bytes or None)
+
+    Memory is traced in a second run, which reuses the cached parse, so the
+    peak covers table layout and drawing.
+    """
+    start = time.perf_counter()
+    generator.generate_pdf(savestr, settings)
+    seconds = time.perf_counter() - start
+    if not trace:
+        return seconds, None
+    tracemalloc.start()
+    generator.generate_pdf(savestr, settings)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def describe(seconds, peak):
+    memory = f"{peak / 2**20:6.1f} MB" if peak is not None else ' ' * 9
+    return f"{seconds * 1000:8.0f} ms {memory}"
+
+
+def main():
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    generator = SocialCalcPDFGenerator()
+    print(f"  {'rows':>6}  {'single table':>20}  {'chunked LongTable':>20}")
+    for rows in (1000, 2500, 5000, 10000, 20000):
+        if rows > max_rows:
+            break
+        savestr = item_sheet(rows)
+        trace = rows <= 2500  # tracing slows rendering ~10x
+        chunked = measure(generator, savestr, {'largeSheet': True, 'appMapping': MAPPING}, trace)
+        if rows <= 5000:
+            single_text = describe(*measure(generator, savestr, {'largeSheet': False}, trace))
+        else:
+            single_text = f"{'(skipped)':>20}"
+        print(f"  {rows:>6}  {single_text}  {describe(*chunked)}   {chunked[0] / rows * 1e6:5.0f} us/row")
+
+if __name__ == '__main__':
+    main()
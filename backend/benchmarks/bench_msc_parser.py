@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark the shared MSC parser against the per-consumer parse loops it replaced
+
+Usage: python benchmarks/bench_msc_parser.py [repeat]
+"""
+
+import re
+import sys
+
+from corpus import load_corpus, best_of, report
+from services.msc_parser import parse_msc
+
+
+def legacy_pdf_parse(msc_data):
+    """SocialCalcPDFGenerator.parse_msc_data before the shared parser"""
+    cells = {}
+    max_col = 0
+    max_row = 0
+    for line in msc_data.strip().split('\n'):
+        line = line.strip()
+        if line.startswith('cell:'):
+            parts = line.split(':')
+            if len(parts) >= 4:
+                cell_ref = parts[1]
+                format_info = {}
+                for i in range(4, len(parts), 2):
+                    if i + 1 < len(parts):
+                        format_info[parts[i]] = parts[i + 1]
+                match = re.match(r'([A-Z]+)(\d+)', cell_ref)
+                col = 0
+                for char in match.group(1):
+                    col = col * 26 + (ord(char) - ord('A'))
+                row = int(match.group(2)) - 1
+                cells[cell_ref] = {'value': parts[3], 'type': parts[2], 'format': format_info,
+                                   'row': row, 'col': col}
+                max_col = max(max_col, col)
+                max_row = max(max_row, row)
+        elif line.startswith('sheet:'):
+            match = re.search(r'c:(\d+):r:(\d+)', line)
+            if match:
+                max_col = max(max_col, int(match.group(1)))
+                max_row = max(max_row, int(match.group(2)))
+    return {'cells': cells, 'max_col': max_col, 'max_row': max_row}
+
+
+def legacy_preview_parse(msc_data):
+    """Inline loop from generate_html_preview before the shared parser"""
+    cells = {}
+    max_row = 0
+    max_col = 0
+    for line in msc_data.strip().split('\n'):
+        if line.startswith('cell:'):
+            parts = line.split(':')
+            if len(parts) >= 4:
+                is_bold = False
+                bg_color = ''
+                text_color = ''
+                for i in range(4, len(parts), 2):
+                    if i + 1 < len(parts):
+                        if parts[i] == 'f' and parts[i + 1] == '1':
+                            is_bold = True
+                        elif parts[i] == 'bg':
+                            bg_color = parts[i + 1]
+                        elif parts[i] == 'color':
+                            text_color = parts[i + 1]
+                match = re.match(r'([A-Z]+)(\d+)', parts[1])
+                if match:
+                    row_num = int(match.group(2))
+                    col = 0
+                    for char in match.group(1):
+                        col = col * 26 + (ord(char) - 65)
+                    max_row = max(max_row, row_num)
+                    max_col = max(max_col, col)
+                    cells[parts[1]] = {'value': parts[3], 'bold': is_bold, 'bg': bg_color,
+                                       'color': text_color, 'row': row_num - 1, 'col': col}
+    return cells, max_row, max_col
+
+
+def legacy_mapping_parse(msc_code):
+    """MappingAgent._parse_msc_code before the shared parser"""
+    cells = {}
+    keys = {'t': 'text', 'v': 'value', 'f': 'font', 'c': 'color', 'bg': 'background'}
+    for line in msc_code.split('\n'):
+        line = line.strip()
+        if line.startswith('cell:'):
+            parts = line.split(':')
+            if len(parts) >= 3:
+                cell_data = {'ref': parts[1]}
+                i = 2
+                while i < len(parts):
+                    if i + 1 < len(parts):
+                        key, value = parts[i], parts[i + 1]
+                        if key in keys:
+                            cell_data[keys[key]] = value
+                        elif key in ('colspan', 'rowspan'):
+                            try:
+                                cell_data[key] = int(value)
+                            except ValueError:
+                                pass
+                    i += 2
+                cells[parts[1]] = cell_data
+    return {'cells': cells, 'merged_cells': {}}
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sheets = list(load_corpus().values())
+    num_cells = sum(s.count('\ncell:') for s in sheets)
+    print(f"Corpus: {len(sheets)} templates, {num_cells} cells, best of {repeat}\n")
+
+    def run(fn):
+        return best_of(lambda: [fn(s) for s in sheets], repeat)
+
+    shared = run(parse_msc)
+    pdf = run(legacy_pdf_parse)
+    preview = run(legacy_preview_parse)
+    mapping = run(legacy_mapping_parse)
+
+    report([
+        ('legacy pdf_generator.parse_msc_data', pdf, None),
+        ('legacy html_preview inline loop', preview, None),
+        ('legacy MappingAgent._parse_msc_code', mapping, None),
+        ('legacy total (one parse per consumer)', pdf + preview + mapping, None),
+        ('msc_parser.parse_msc vs pdf loop', shared, pdf),
+        ('msc_parser.parse_msc vs preview loop', shared, preview),
+        ('msc_parser.parse_msc vs legacy total', shared, pdf + preview + mapping),
+    ])
+
+
+if __name__ == '__main__':
+    main()
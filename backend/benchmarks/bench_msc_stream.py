@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Peak-memory benchmark for streaming MSC parsing of large savestrs
+
+Builds a synthetic multi-megabyte sheet (embedded SVG logos plus an item
+table) and compares peak traced memory of the legacy split-based parser with
+parse_msc on the string and on a byte stream, and with consuming records
+incrementally without building a sheet.
+
+Usage: python benchmarks/bench_msc_stream.py [rows]
+"""
+
+import io
+import sys
+import tracemalloc
+
+from bench_msc_parser import legacy_pdf_parse  # also puts the backend on sys.path
+from services.msc_parser import parse_msc, iter_msc_records, MSCCell
+
+
+def synthetic_savestr(rows: int) -> str:
+    logo = '<svg width\\c200 height\\c200>' + '<path d="M0 0 L10 10 Z" fill="#008080"/>' * 2000 + '</svg>'
+    lines = ['version:1.5', 'font:1:normal normal 10pt Verdana', 'color:1:rgb(0,0,0)']
+    for i in range(40):
+        lines.append(f'cell:A{i + 1}:t:{logo}:tvf:1')
+    for r in range(41, 41 + rows):
+        lines.append(f'cell:B{r}:t:Item {r}:f:1:c:1:l:1')
+        lines.append(f'cell:C{r}:v:{r}:f:1:cf:3:ntvf:1')
+    lines.append(f'sheet:c:3:r:{40 + rows}')
+    return '\n'.join(lines)
+
+
+def peak(fn):
+    tracemalloc.start()
+    fn()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak_bytes
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    savestr = synthetic_savestr(rows)
+    payload = savestr.encode('utf-8')
+    print(f"Synthetic sheet: {len(payload) / 1024 / 1024:.1f} MiB, {rows} item rows\n")
+
+    # Warm module-level ref/style tables so they are not charged to the first run
+    parse_msc(savestr)
+
+    def count_cells(source):
+        return sum(1 for record in iter_msc_records(source) if type(record) is MSCCell)
+
+    results = [
+        ('legacy parse_msc_data', peak(lambda: legacy_pdf_parse(savestr))),
+        ('parse_msc(str)', peak(lambda: parse_msc(savestr))),
+        ('parse_msc(byte stream)', peak(lambda: parse_msc(io.BytesIO(payload)))),
+        ('iter_msc_records(byte stream)', peak(lambda: count_cells(io.BytesIO(payload)))),
+    ]
+    for label, peak_bytes in results:
+        print(f"  {label:<32} peak {peak_bytes / 1024 / 1024:8.2f} MiB")
+
+
+if __name__ == '__main__':
+    main()
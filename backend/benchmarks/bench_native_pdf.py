@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Latency of the in-process ReportLab renderer (SocialCalcPDFGenerator) against
+the HTML path used by generate_pdf_from_html (render_sheet_html + wkhtmltopdf)
+
+The HTML path is skipped when wkhtmltopdf is not on PATH (or WKHTMLTOPDF_BIN).
+The rendered-PDF cache is bypassed so every iteration renders.
+
+Usage: python benchmarks/bench_native_pdf.py [templates] [repeat]
+"""
+
+import shutil
+import sys
+
+from corpus import load_corpus, best_of, report
+from services.html_preview import render_sheet_html
+from services.html_pdf_pool import WKHTMLTOPDF_BIN
+from services.msc_parser import parse_msc
+from services.pdf_from_html import build_html_document, render_html_pdf, wkhtmltopdf_options
+from services.pdf_generator import SocialCalcPDFGenerator
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    sheets = list(load_corpus().values())[:count]
+    generator = SocialCalcPDFGenerator()
+    parsed = [parse_msc(savestr) for savestr in sheets]
+    settings = {}
+
+    def native():
+        for savestr in sheets:
+            generator.generate_pdf(savestr, settings)
+
+    print(f"{len(sheets)} templates, best of {repeat}\n")
+    native_time = best_of(native, repeat)
+
+    if shutil.which(WKHTMLTOPDF_BIN) is None:
+        print(f"  {WKHTMLTOPDF_BIN} not found; timing the native renderer only\n")
+        report([('native reportlab', native_time, 0)])
+        print(f"\n  {native_time / len(sheets) * 1000:.1f} ms per PDF")
+        return
+
+    options = wkhtmltopdf_options(settings)
+
+    def html_path():
+        for sheet in parsed:
+            document = build_html_document(render_sheet_html(sheet, settings), settings)
+            render_html_pdf(document, options)
+
+    html_time = best_of(html_path, repeat)
+    report([
+        ('html + wkhtmltopdf', html_time, html_time),
+        ('native reportlab', native_time, html_time),
+    ])
+    print(f"\n  per PDF: html {html_time / len(sheets) * 1000:.1f} ms, "
+          f"native {native_time / len(sheets) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
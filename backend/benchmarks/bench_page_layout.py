@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Page layout without rendering: time of a first layout (grid, display text
+and measurements) and of a re-layout for new settings, against rendering
+the PDF; and how often the predicted page count matches the rendered one
+
+Usage: python benchmarks/bench_page_layout.py [templates]
+"""
+
+import re
+import sys
+import time
+
+from corpus import load_corpus
+from bench_large_sheet import item_sheet, MAPPING
+from services import page_layout
+from services.page_layout import compute_layout
+from services.pdf_generator import SocialCalcPDFGenerator
+from services.sheet_cache import get_parsed_sheet
+
+SETTINGS = [
+    {},
+    {'fitToPage': True},
+    {'orientation': 'landscape', 'paperSize': 'letter'},
+    {'scale': 150, 'margins': {'top': 40, 'right': 10, 'bottom': 40, 'left': 10}},
+    {'fitPages': 1},
+]
+
+
+def first_layout(sheet, settings) -> float:
+    page_layout._metrics.clear()
+    start = time.perf_counter()
+    compute_layout(sheet, settings)
+    return time.perf_counter() - start
+
+
+def relayout(sheet, settings) -> float:
+    compute_layout(sheet, settings)
+    start = time.perf_counter()
+    compute_layout(sheet, {**settings, 'fitPages': 2})
+    return time.perf_counter() - start
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    generator = SocialCalcPDFGenerator()
+    templates = list(load_corpus().values())[:limit]
+
+    totals = {'first': 0.0, 'relayout': 0.0, 'pdf': 0.0}
+    matched = runs = 0
+    for savestr in templates:
+        sheet = get_parsed_sheet(savestr)
+        for settings in SETTINGS:
+            totals['first'] += first_layout(sheet, settings)
+            totals['relayout'] += relayout(sheet, settings)
+            start = time.perf_counter()
+            pdf = generator.generate_pdf(savestr, settings)
+            totals['pdf'] += time.perf_counter() - start
+            matched += compute_layout(sheet, settings).page_count == len(re.findall(rb'/Type /Page\b', pdf))
+            runs += 1
+
+    print(f"{len(templates)} templates x {len(SETTINGS)} settings; page count matched {matched}/{runs}")
+    for label, key in (('first layout', 'first'), ('re-layout', 'relayout'), ('render PDF', 'pdf')):
+        print(f"  {label:<14} {totals[key] / runs * 1000:8.2f} ms")
+
+    print(f"\n  {'rows':>6}  {'first layout':>13}  {'re-layout':>10}  {'render PDF':>11}  pages")
+    for rows in (1000, 5000, 15000):
+        savestr = item_sheet(rows)
+        sheet = get_parsed_sheet(savestr)
+        settings = {'appMapping': MAPPING}
+        first = first_layout(sheet, settings)
+        again = relayout(sheet, settings)
+        pdf_seconds = ''
+        if rows <= 5000:
+            start = time.perf_counter()
+            generator.generate_pdf(savestr, settings)
+            pdf_seconds = f"{(time.perf_counter() - start) * 1000:8.0f} ms"
+        pages = compute_layout(sheet, settings).page_count
+        print(f"  {rows:>6}  {first * 1000:10.1f} ms  {again * 1000:7.1f} ms  {pdf_seconds:>11}  {pages}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Preview sessions: time and bytes per single-cell edit (row patch) against
+re-rendering the whole preview, over the template corpus and a long
+invoice whose total depends on every line
+
+Usage: python benchmarks/bench_preview_sessions.py [templates] [repeat]
+"""
+
+import sys
+
+from corpus import load_corpus, best_of, report
+from services.html_preview import render_sheet_html
+from services.msc_parser import parse_msc
+from services.preview_sessions import PreviewSession
+
+
+def invoice_sheet(rows: int) -> str:
+    lines = ['version:1.5', 'valueformat:1:#,##0.00']
+    for row in range(1, rows + 1):
+        lines.append(f'cell:A{row}:t:Item {row}')
+        lines.append(f'cell:B{row}:v:{row}:ntvf:1')
+    lines.append(f'cell:B{rows + 1}:vtf:n:0:SUM(B1\\cB{rows}):ntvf:1')
+    lines.append(f'sheet:c:2:r:{rows + 1}')
+    return '\n'.join(lines) + '\n'
+
+
+def first_value_cell(session: PreviewSession):
+    for cell in session.sheet.cells.values():
+        if cell.datatype == 'v' and not cell.formula:
+            return cell.ref
+    return None
+
+
+def edit_cost(savestr: str, repeat: int):
+    """(patch seconds, patch bytes, full render seconds, full bytes) for one edit"""
+    session = PreviewSession('bench', savestr, {})
+    ref = first_value_cell(session)
+    if ref is None:
+        return None
+    counter = iter(range(10 ** 9))
+
+    def edit():
+        return session.apply([f'cell:{ref}:v:{next(counter)}'])
+
+    patch = edit()
+    patch_bytes = sum(len(row['html']) for row in patch['rows']) if 'rows' in patch else len(patch['document'])
+    sheet = parse_msc(savestr)
+    document = render_sheet_html(sheet, {})
+    return (best_of(edit, repeat), patch_bytes,
+            best_of(lambda: render_sheet_html(parse_msc(savestr), {}), repeat), len(document))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    costs = [cost for cost in (edit_cost(savestr, repeat) for savestr in list(load_corpus().values())[:count])
+             if cost]
+    print(f"{len(costs)} templates with a value cell, best of {repeat}\n")
+    patch_time, patch_bytes, full_time, full_bytes = (sum(column) for column in zip(*costs))
+    report([('full preview (parse + render)', full_time, 0), ('row patch', patch_time, full_time)])
+    print(f"\n  per edit: patch {patch_time / len(costs) * 1000:.3f} ms, {patch_bytes / len(costs):.0f} B; "
+          f"full {full_time / len(costs) * 1000:.2f} ms, {full_bytes / len(costs) / 1024:.1f} KB\n")
+
+    rows = []
+    for row_count in (100, 1000, 5000):
+        patch_time, patch_bytes, full_time, full_bytes = edit_cost(invoice_sheet(row_count), repeat)
+        rows.append((f'{row_count}-line invoice: full ({full_bytes // 1024} KB)', full_time, 0))
+        rows.append((f'{row_count}-line invoice: patch ({patch_bytes} B)', patch_time, full_time))
+    report(rows)
+
+
+if __name__ == '__main__':
+    main()
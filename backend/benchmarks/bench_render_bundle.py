@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Render bundle: HTML preview + PNG thumbnail + PDF from one render_bundle
+call against the three separate service calls the save-and-send flow makes
+(generate_html_preview, generate_preview_image, generate_pdf_from_socialcalc)
+
+Caches are disabled so every iteration renders; PNG and PDF run on the
+render processes in both cases.
+
+Usage: python benchmarks/bench_render_bundle.py [templates] [processes]
+"""
+
+import os
+import sys
+
+for name in ('SHEET_CACHE_MAX_BYTES', 'PDF_CACHE_MAX_BYTES', 'THUMBNAIL_CACHE_MAX_BYTES', 'HTML_CACHE_MAX_BYTES'):
+    os.environ[name] = '0'
+if len(sys.argv) > 2:
+    os.environ['RENDER_PROCESSES'] = sys.argv[2]
+
+import json
+
+from corpus import load_corpus, best_of, report
+from services.html_preview import generate_html_preview
+from services.pdf_generator import generate_pdf_from_socialcalc, generate_preview_image
+from services.render_bundle import render_bundle
+from services.render_executor import render_executor
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    # Requests carry workbook JSON, which each separate call unwraps again
+    sheets = [json.dumps({'currentid': 'sheet1', 'sheetArr': {'sheet1': {'sheetstr': {'savestr': savestr}}}})
+              for savestr in list(load_corpus().values())[:count]]
+    render_executor.start()
+    print(f"{len(sheets)} templates, {render_executor.processes} render processes\n")
+
+    def separate():
+        for sheet_data in sheets:
+            generate_html_preview(sheet_data, {})
+            generate_preview_image(sheet_data, {})
+            generate_pdf_from_socialcalc(sheet_data, {})
+
+    def bundled():
+        for sheet_data in sheets:
+            render_bundle(sheet_data, {}, ['html', 'png', 'pdf'])
+
+    separate_time = best_of(separate, 2)
+    bundle_time = best_of(bundled, 2)
+    report([('separate calls', separate_time, separate_time), ('render bundle', bundle_time, separate_time)])
+    print(f"\n  per sheet: separate {separate_time / len(sheets) * 1000:.1f} ms, "
+          f"bundle {bundle_time / len(sheets) * 1000:.1f} ms")
+    render_executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Multi-client throughput of SocialCalc PDF rendering: renders on the request
+threads (GIL-bound) against the pre-warmed process pool, at increasing
+client counts
+
+Usage: python benchmarks/bench_render_executor.py [jobs] [processes]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from corpus import load_corpus
+from services.render_executor import RenderExecutor
+
+
+def throughput(executor, sheets, clients):
+    """PDFs per second with `clients` threads each rendering one sheet at a time"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as threads:
+        list(threads.map(lambda savestr: executor.render_pdf(savestr, {}), sheets))
+    return len(sheets) / (time.perf_counter() - start)
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    corpus = list(load_corpus().values())
+    sheets = [corpus[i % len(corpus)] for i in range(jobs)]
+
+    inline = RenderExecutor(processes=0)
+    pool = RenderExecutor(processes=processes, queue_size=jobs)
+    start = time.perf_counter()
+    pool.start()
+    print(f"{jobs} PDFs, {processes} render processes (warm-up {time.perf_counter() - start:.2f}s)\n")
+
+    # Warm the parse caches on both sides so only rendering is compared
+    throughput(inline, sheets, 1)
+    throughput(pool, sheets, processes)
+
+    clients = 1
+    while clients <= max(processes * 2, 2):
+        threaded = throughput(inline, sheets, clients)
+        pooled = throughput(pool, sheets, clients)
+        print(f"  {clients:>3} clients   request threads {threaded:6.1f} PDF/s   "
+              f"process pool {pooled:6.1f} PDF/s   {pooled / threaded:5.2f}x")
+        clients *= 2
+
+    print(f"\n  pool: {pool.stats()}")
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Render pipeline benchmark suite: where render time goes, stage by stage
+
+Times each entry point separately over the template corpus
+(invoice_mapping_full.json), the migrated app templates
+(.agent/migration/output.json, when present) and synthetic long invoices:
+
+  parse          parse_msc
+  html_preview   generate_html_preview
+  pdf            SocialCalcPDFGenerator.generate_pdf
+  preview_image  generate_preview_image
+  pdf_from_html  generate_pdf_from_html (skipped without wkhtmltopdf)
+
+Every stage runs cold: the parsed-sheet, rendered-PDF and thumbnail caches
+are disabled and renders run in this process, so each sample pays for its
+own parse. Per stage it reports p50/p95 latency, peak Python heap
+(tracemalloc, measured in a separate pass so it does not skew the timings;
+wkhtmltopdf's own memory is not included) and output size.
+
+--json writes the results for diffing runs; --baseline compares this run
+against an earlier --json file.
+
+Usage: python benchmarks/bench_render_pipeline.py [--templates N] [--repeat R]
+           [--rows 1000,5000] [--stages parse,pdf] [--json out.json] [--baseline old.json]
+"""
+
+import os
+
+# Cold renders in-process: no cached sheets, PDFs or thumbnails, no worker pool
+for name in ('SHEET_CACHE_MAX_BYTES', 'PDF_CACHE_MAX_BYTES', 'THUMBNAIL_CACHE_MAX_BYTES', 'RENDER_PROCESSES'):
+    os.environ[name] = '0'
+
+import argparse
+import base64
+import gc
+import json
+import platform
+import shutil
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from corpus import BACKEND_DIR, load_corpus, load_migration_corpus
+from services.html_pdf_pool import WKHTMLTOPDF_BIN
+from services.html_preview import generate_html_preview, render_sheet_html
+from services.msc_parser import parse_msc
+from services.pdf_from_html import generate_pdf_from_html
+from services.pdf_generator import SocialCalcPDFGenerator, generate_preview_image
+
+
+RESULTS_VERSION = 1
+STAGES = ('parse', 'html_preview', 'pdf', 'preview_image', 'pdf_from_html')
+
+
+def synthetic_sheet(rows: int) -> str:
+    """Styled invoice with `rows` line items, merged header and SUM totals"""
+    lines = ['version:1.5', 'font:1:normal bold 14pt Arial', 'font:2:normal normal 10pt Verdana',
+             'color:1:rgb(0,128,128)', 'color:2:rgb(255,255,255)', 'border:1:1px solid rgb(0,128,128)',
+             'layout:1:padding:4px 5px 4px 5px;vertical-align:middle;', 'cellformat:1:right',
+             'valueformat:1:#,##0.00', 'col:A:w:60', 'col:B:w:260', 'col:C:w:80', 'col:D:w:100',
+             'cell:A1:t:INVOICE:f:1:c:2:bg:1:colspan:4']
+    for row in range(2, rows + 2):
+        lines.append(f'cell:A{row}:v:{row - 1}:f:2')
+        lines.append(f'cell:B{row}:t:Line item {row - 1}:f:2:b:1:1:1:1:l:1')
+        lines.append(f'cell:C{row}:v:{(row % 7) + 1}:f:2:cf:1')
+        lines.append(f'cell:D{row}:vtf:n:0:C{row}*{row % 13 + 0.5}:f:2:cf:1:ntvf:1')
+    total = rows + 2
+    lines.append(f'cell:C{total}:t:Total:f:1')
+    lines.append(f'cell:D{total}:vtf:n:0:SUM(D2\\cD{total - 1}):f:1:cf:1:ntvf:1')
+    lines.append(f'sheet:c:4:r:{total}')
+    return '\n'.join(lines) + '\n'
+
+
+def stage_runners(wkhtmltopdf: bool) -> Dict[str, Callable[[str], Optional[int]]]:
+    """Stage name -> fn(savestr) returning the output size in bytes (None: no output)"""
+    generator = SocialCalcPDFGenerator()
+
+    def checked(result: Dict[str, Any], field: str) -> bytes:
+        if not result.get('success'):
+            raise RuntimeError(result.get('error', 'render failed'))
+        data = result['data'][field]
+        return data if isinstance(data, bytes) else base64.b64decode(data)
+
+    def parse(savestr: str) -> None:
+        parse_msc(savestr)
+
+    def pdf_from_html(savestr: str) -> int:
+        sheet_html = render_sheet_html(parse_msc(savestr), {})
+        return len(checked(generate_pdf_from_html(sheet_html, {}, raw=True), 'pdf'))
+
+    runners = {
+        'parse': parse,
+        'html_preview': lambda savestr: len(checked(generate_html_preview(savestr, {}), 'preview')),
+        'pdf': lambda savestr: len(generator.generate_pdf(savestr, {})),
+        'preview_image': lambda savestr: len(checked(generate_preview_image(savestr, {}), 'preview')),
+    }
+    if wkhtmltopdf:
+        runners['pdf_from_html'] = pdf_from_html
+    return runners
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linearly interpolated percentile (q in 0..100) of unsorted values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize(values: List[float], digits: int = 3) -> Dict[str, Any]:
+    if not values:
+        return {}
+    return {
+        'p50': round(percentile(values, 50), digits),
+        'p95': round(percentile(values, 95), digits),
+        'mean': round(sum(values) / len(values), digits),
+        'max': round(max(values), digits),
+        'total': round(sum(values), digits),
+    }
+
+
+def measure(run: Callable[[str], Optional[int]], savestrs: List[str], repeat: int,
+            memory: bool) -> Dict[str, Any]:
+    """Latency samples (repeat per sheet), output sizes and, optionally, peak heap per sheet"""
+    times: List[float] = []
+    sizes: List[float] = []
+    errors: List[str] = []
+    for savestr in savestrs:
+        for attempt in range(repeat):
+            start = time.perf_counter()
+            try:
+                size = run(savestr)
+            except Exception as e:
+                errors.append(str(e) or e.__class__.__name__)
+                break
+            times.append((time.perf_counter() - start) * 1000)
+            if attempt == 0 and size is not None:
+                sizes.append(size)
+
+    peaks: List[float] = []
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        for savestr in savestrs:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            try:
+                run(savestr)
+            except Exception:
+                continue
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+
+    result = {
+        'samples': len(times),
+        'errors': len(errors),
+        'ms': summarize(times),
+        'peakBytes': {name: int(value) for name, value in summarize(peaks, 0).items() if name != 'total'},
+        'outputBytes': {name: int(value) for name, value in summarize(sizes, 0).items()},
+    }
+    if errors:
+        result['firstError'] = errors[0]
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_header() -> None:
+    header = f"  {'corpus':<16} {'stage':<14} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} " \
+             f"{'peak p95':>10} {'out p50':>10}"
+    print(header)
+    print('  ' + '-' * (len(header) - 2))
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    if 'skipped' in result:
+        print(f"  {result['corpus']:<16} {result['stage']:<14} skipped: {result['skipped']}")
+        return
+    peak = result['peakBytes'].get('p95')
+    output = result['outputBytes'].get('p50')
+    print(f"  {result['corpus']:<16} {result['stage']:<14} {result['samples']:>5} "
+          f"{result['ms'].get('p50', 0):>9.2f} {result['ms'].get('p95', 0):>9.2f} "
+          f"{(f'{peak / 1024:.0f} KB' if peak is not None else '-'):>10} "
+          f"{(f'{output / 1024:.1f} KB' if output is not None else '-'):>10}"
+          + (f"  ({result['errors']} errors: {result['firstError'][:60]})" if result['errors'] else ''))
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    """Print p50/p95 of this run against a previous --json run (ratio > 1 is slower now)"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['corpus'], r['stage']): r for r in baseline.get('results', []) if 'ms' in r}
+    print(f"\nAgainst {baseline_path} (commit {baseline.get('gitCommit')}, {baseline.get('createdAt')}):")
+    for result in results:
+        before = previous.get((result['corpus'], result['stage']))
+        if not before or not result.get('ms') or not before.get('ms'):
+            continue
+        ratios = ['{}: {:.2f}x'.format(name, result['ms'][name] / before['ms'][name])
+                  for name in ('p50', 'p95') if before['ms'].get(name)]
+        print(f"  {result['corpus']:<16} {result['stage']:<14} " + '  '.join(ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render pipeline benchmark suite')
+    parser.add_argument('--templates', type=int, default=0, help='limit corpus sheets (0: all)')
+    parser.add_argument('--repeat', type=int, default=1, help='samples per corpus sheet')
+    parser.add_argument('--synthetic-repeat', type=int, default=3, help='samples per synthetic sheet')
+    parser.add_argument('--rows', default='1000,5000,15000', help='synthetic sheet sizes ("" for none)')
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma-separated stages')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--json', help='write machine-readable results here')
+    parser.add_argument('--baseline', help='compare with an earlier --json file')
+    args = parser.parse_args()
+
+    wkhtmltopdf = shutil.which(WKHTMLTOPDF_BIN) is not None
+    runners = stage_runners(wkhtmltopdf)
+    stages = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    corpora: List[Tuple[str, List[str], int]] = []
+    templates = list(load_corpus().values())
+    migration = list(load_migration_corpus().values())
+    if args.templates:
+        templates, migration = templates[:args.templates], migration[:args.templates]
+    corpora.append(('templates', templates, args.repeat))
+    if migration:
+        corpora.append(('migration', migration, args.repeat))
+    synthetic_rows = [int(value) for value in args.rows.split(',') if value]
+    for rows in synthetic_rows:
+        corpora.append((f'synthetic-{rows}', [synthetic_sheet(rows)], args.synthetic_repeat))
+
+    print(f"{len(templates)} templates, {len(migration)} migrated sheets, "
+          f"{len(synthetic_rows)} synthetic sheets; stages: {', '.join(stages)}\n")
+
+    # Import-time and first-call costs (fonts, metrics) stay out of the samples
+    for stage in stages:
+        if stage in runners:
+            runners[stage](templates[0] if templates else synthetic_sheet(10))
+
+    results = []
+    print_header()
+    for corpus_name, savestrs, repeat in corpora:
+        for stage in stages:
+            entry = {'corpus': corpus_name, 'stage': stage}
+            if stage not in runners:
+                entry['skipped'] = f'{WKHTMLTOPDF_BIN} not found'
+            else:
+                entry.update(measure(runners[stage], savestrs, repeat, not args.no_memory))
+            results.append(entry)
+            print_result(entry)
+
+    document = {
+        'resultsVersion': RESULTS_VERSION,
+        'createdAt': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'gitCommit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpuCount': os.cpu_count(),
+        'settings': {
+            'templates': args.templates, 'repeat': args.repeat, 'syntheticRepeat': args.synthetic_repeat,
+            'rows': args.rows, 'stages': stages, 'memory': not args.no_memory, 'wkhtmltopdf': wkhtmltopdf,
+        },
+        'corpora': {name: {'sheets': len(savestrs), 'bytes': sum(len(s) for s in savestrs),
+                           'cells': sum(s.count('\ncell:') for s in savestrs)}
+                    for name, savestrs, _ in corpora},
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
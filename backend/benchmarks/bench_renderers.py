@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Renderer dispatch: cost of feature detection and engine ranking against the
+render itself, which engine 'auto' picks per template, and how far the
+fitted cost model of each installed engine ends up from the measured renders
+
+Usage: python benchmarks/bench_renderers.py [templates]
+"""
+
+import sys
+import time
+from collections import Counter
+
+from corpus import load_corpus
+from services.renderers import build_request, renderer_registry
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    templates = list(load_corpus().values())[:limit]
+
+    dispatch = render = 0.0
+    engines: Counter = Counter()
+    features: Counter = Counter()
+    errors = []
+    for savestr in templates:
+        start = time.perf_counter()
+        request = build_request(savestr, {})
+        ranked = renderer_registry.candidates(request)
+        dispatch += time.perf_counter() - start
+        features.update(request.features)
+
+        renderer, _, estimate = ranked[0]
+        start = time.perf_counter()
+        renderer.render(request)
+        ms = (time.perf_counter() - start) * 1000
+        render += ms / 1000
+        engines[renderer.name] += 1
+        errors.append(abs(ms - estimate))
+
+    runs = len(templates)
+    print(f"{runs} templates; installed: "
+          f"{', '.join(name for name in renderer_registry.names() if renderer_registry.get(name).available())}")
+    print(f"  dispatch  {dispatch / runs * 1000:8.3f} ms")
+    print(f"  render    {render / runs * 1000:8.2f} ms")
+    print(f"  estimate error (mean abs, last half) "
+          f"{sum(errors[runs // 2:]) / max(1, runs - runs // 2):.2f} ms")
+    print(f"  picked    {dict(engines)}")
+    print(f"  features  {dict(features)}")
+    for name in renderer_registry.names():
+        print(f"  {name:<12} cost {renderer_registry.get(name).model.to_dict()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark: dict-per-cell parse output vs the compact MSCSheet model
+
+Measures retained bytes (tracemalloc) for the whole template corpus held in
+memory at once, for the parsed model alone and for model + render table.
+
+Usage: python benchmarks/bench_sheet_memory.py
+"""
+
+import gc
+import tracemalloc
+
+from corpus import load_corpus
+from bench_msc_parser import legacy_pdf_parse
+from services.msc_parser import parse_msc
+from services.pdf_generator import SocialCalcPDFGenerator
+
+
+def legacy_table_data(parsed):
+    """SocialCalcPDFGenerator.create_table_data before the compact model"""
+    table_data = [['' for _ in range(parsed['max_col'] + 1)] for _ in range(parsed['max_row'] + 1)]
+    for cell_info in parsed['cells'].values():
+        table_data[cell_info['row']][cell_info['col']] = str(cell_info['value'])
+    return table_data
+
+
+def retained_bytes(build):
+    """Bytes still allocated after build() returns, with its result kept alive"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+    sheets = list(load_corpus().values())
+    num_cells = sum(s.count('\ncell:') for s in sheets)
+    generator = SocialCalcPDFGenerator()
+
+    # Warm up module-level tables (column labels, interned styles) so they are not counted
+    for s in sheets:
+        parse_msc(s)
+
+    rows = [
+        ('legacy dict-per-cell parse', lambda: [legacy_pdf_parse(s) for s in sheets]),
+        ('MSCSheet model', lambda: [parse_msc(s) for s in sheets]),
+        ('legacy parse + dense table', lambda: [(p, legacy_table_data(p))
+                                                for p in (legacy_pdf_parse(s) for s in sheets)]),
+        ('MSCSheet + table data', lambda: [(m, generator.create_table_data(generator.build_grid(m)))
+                                           for m in (parse_msc(s) for s in sheets)]),
+    ]
+
+    print(f"Corpus: {len(sheets)} templates, {num_cells} cells\n")
+    for label, build in rows:
+        size = retained_bytes(build)
+        print(f"  {label:<28} {size / 1024 / 1024:8.2f} MiB  {size / num_cells:7.0f} B/cell")
+
+
+if __name__ == '__main__':
+    main()
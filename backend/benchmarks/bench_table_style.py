@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-cell TableStyle commands against the merged output of
+TableStyleCompiler on the template corpus, plus a synthetic striped table
+
+Usage: python benchmarks/bench_table_style.py [repeat]
+"""
+
+import sys
+from io import BytesIO
+
+from corpus import load_corpus, best_of, report
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+from services.msc_parser import parse_msc
+from services.pdf_generator import SocialCalcPDFGenerator
+
+STRIPED_ROWS = 400
+
+
+def striped_savestr(rows: int) -> str:
+    lines = ['version:1.5', 'font:1:normal bold 10pt Verdana', 'color:1:rgb(224,255,255)']
+    for r in range(1, rows + 1):
+        tail = ':f:1:bg:1' if r % 2 else ''
+        for col in 'BCDE':
+            lines.append(f'cell:{col}{r}:t:Item {r}{tail}')
+    lines.append(f'sheet:c:5:r:{rows}')
+    return '\n'.join(lines)
+
+
+def captured_commands(generator, grid):
+    """TableStyle commands apply_table_style produces for a grid"""
+    captured = []
+
+    class CapturingTable(Table):
+        def setStyle(self, tblstyle):
+            captured.extend(tblstyle.getCommands())
+            super().setStyle(tblstyle)
+
+    generator.apply_table_style(CapturingTable([[''] * grid.num_cols] * grid.num_rows), grid, {})
+    return captured
+
+
+def build_inputs(savestr):
+    """Table data plus (per-cell, merged) command lists for one sheet"""
+    generator = SocialCalcPDFGenerator()
+    grid = generator.build_grid(parse_msc(savestr))
+    data = generator.create_table_data(grid)
+
+    merged = captured_commands(generator, grid)
+    per_cell = []
+    for command, (c0, r0), (c1, r1), *args in merged:
+        if (c1, r1) == (-1, -1):
+            per_cell.append((command, (c0, r0), (c1, r1), *args))
+            continue
+        # Expand merged ranges back into one command per cell (pre-compiler behaviour)
+        for row in range(r0, r1 + 1):
+            for col in range(c0, c1 + 1):
+                per_cell.append((command, (col, row), (col, row), *args))
+    return data, per_cell, merged
+
+
+def render(data, commands):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    table = Table(data, repeatRows=1)
+    table.setStyle(TableStyle(commands))
+    doc.build([table])
+    return len(buffer.getvalue())
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    sheets = list(load_corpus().values())[::5]
+    corpus_inputs = [build_inputs(s) for s in sheets]
+    striped = build_inputs(striped_savestr(STRIPED_ROWS))
+
+    cell_total = sum(len(per_cell) for _, per_cell, _ in corpus_inputs)
+    merged_total = sum(len(merged) for _, _, merged in corpus_inputs)
+    print(f"Corpus sample: {len(sheets)} templates, {cell_total} per-cell commands -> "
+          f"{merged_total} merged ({cell_total - merged_total} saved)")
+    print(f"Striped table: {STRIPED_ROWS} rows, {len(striped[1])} per-cell commands -> "
+          f"{len(striped[2])} merged\n")
+
+    corpus_cell = best_of(lambda: [render(d, c) for d, c, _ in corpus_inputs], repeat)
+    corpus_merged = best_of(lambda: [render(d, m) for d, _, m in corpus_inputs], repeat)
+    striped_cell = best_of(lambda: render(striped[0], striped[1]), repeat)
+    striped_merged = best_of(lambda: render(striped[0], striped[2]), repeat)
+
+    report([
+        ('corpus sample, per-cell commands', corpus_cell, None),
+        ('corpus sample, merged commands', corpus_merged, corpus_cell),
+        ('striped table, per-cell commands', striped_cell, None),
+        ('striped table, merged commands', striped_merged, striped_cell),
+    ])
+
+
+if __name__ == '__main__':
+    main()
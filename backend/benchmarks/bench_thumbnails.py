@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Thumbnail rendering: Pillow rasterizer per template and thumbnail size, the
+content-hash cache hit path, and row-count independence on long sheets
+(only rows inside the viewport are laid out)
+
+The cache writes to a temporary directory so the real cache is untouched.
+
+Usage: python benchmarks/bench_thumbnails.py [templates] [repeat]
+"""
+
+import sys
+import tempfile
+
+from corpus import load_corpus, best_of, report
+from services.msc_parser import parse_msc
+from services.pdf_cache import RenderedPDFCache
+from services.thumbnails import rasterize_sheet, thumbnail_key
+
+
+def long_sheet(rows: int) -> str:
+    lines = ['version:1.5']
+    for row in range(1, rows + 1):
+        lines.append(f'cell:A{row}:v:{row}')
+        lines.append(f'cell:B{row}:t:Item {row}')
+        lines.append(f'cell:C{row}:v:{row * 1.25}')
+    lines.append(f'sheet:c:3:r:{rows}')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    savestrs = list(load_corpus().values())[:count]
+    sheets = [parse_msc(savestr) for savestr in savestrs]
+    print(f"{len(sheets)} templates, best of {repeat}\n")
+
+    rows = []
+    for width in (160, 297, 600):
+        settings = {'width': width}
+        seconds = best_of(lambda: [rasterize_sheet(sheet, settings) for sheet in sheets], repeat)
+        rows.append((f'rasterize {width}px', seconds, rows[0][1] if rows else 0))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = RenderedPDFCache(cache_dir, 64 * 1024 * 1024, 3600, suffix='.png')
+        keys = [thumbnail_key(savestr, {}) for savestr in savestrs]
+        for key, sheet in zip(keys, sheets):
+            cache.put(key, rasterize_sheet(sheet, {}))
+        hit_time = best_of(lambda: [cache.get(thumbnail_key(savestr, {})) for savestr in savestrs], repeat)
+        rows.append(('cache hit (hash + read)', hit_time, rows[1][1]))
+    report(rows)
+    print(f"\n  per thumbnail: rasterize {rows[1][1] / len(sheets) * 1000:.2f} ms, "
+          f"cache hit {hit_time / len(sheets) * 1000:.3f} ms")
+
+    print("\nLong sheets (297px):")
+    long_rows = []
+    for row_count in (100, 1000, 10000):
+        sheet = parse_msc(long_sheet(row_count))
+        rasterize_sheet(sheet, {})  # formula values and parsed styles warm
+        seconds = best_of(lambda: rasterize_sheet(sheet, {}), repeat)
+        long_rows.append((f'{row_count} rows', seconds, long_rows[0][1] if long_rows else 0))
+    report(long_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Shared helpers for the render benchmarks: template corpus loading and timing
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+MAPPING_CORPUS = os.path.join(BACKEND_DIR, 'invoice_mapping_full.json')
+MIGRATION_CORPUS = os.path.join(BACKEND_DIR, '..', '.agent', 'migration', 'output.json')
+
+
+def load_corpus() -> Dict[str, str]:
+    """Load the template corpus as {description: savestr}"""
+    with open(MAPPING_CORPUS, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_migration_corpus() -> Dict[str, str]:
+    """
+    Load the migrated app templates (workbook JSON per template id) as
+    {"<id>/<sheet>": savestr}; empty when the migration output is absent
+    """
+    try:
+        with open(MIGRATION_CORPUS, 'r', encoding='utf-8') as f:
+            templates = json.load(f)
+    except FileNotFoundError:
+        return {}
+    sheets = {}
+    for template_id, template in templates.items():
+        workbook = template.get('msc', template)
+        for sheet_id, sheet in workbook.get('sheetArr', {}).items():
+            savestr = sheet.get('sheetstr', {}).get('savestr')
+            if savestr:
+                sheets[f'{template_id}/{sheet_id}'] = savestr
+    return sheets
+
+
+def best_of(fn: Callable[[], None], repeat: int = 5) -> float:
+    """Run fn `repeat` times and return the fastest wall time in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(rows: List[tuple]) -> None:
+    """Print (label, seconds, baseline_seconds) rows as an aligned table"""
+    width = max(len(row[0]) for row in rows)
+    for label, seconds, baseline in rows:
+        speedup = f"{baseline / seconds:5.2f}x" if baseline else ''
+        print(f"  {label:<{width}}  {seconds * 1000:9.1f} ms  {speedup}")
@@ -5,7 +5,8 @@ import sys
 # Add backend directory to sys.path to allow importing s3_store
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from s3_store import S3Store
+from services.s3_store import S3Store
+from services.template_thumbnails import publish_template_thumbnails
 
 def seed_templates():
     print("Initializing S3 Seed Process...")
@@ -54,6 +55,18 @@ def seed_templates():
 
     print(f"Found {len(all_templates_data)} templates to seed.")
 
+    # Render catalog thumbnails up front (in parallel, skipping templates whose
+    # content hash matches the stored thumbnail) so the metadata saved below
+    # already points at them
+    print("Rendering thumbnails...")
+    thumbnails = publish_template_thumbnails(store, [
+        {"filename": f"{template_id}.json", "template": template_data, "bucketType": "app"}
+        for template_id, template_data in all_templates_data.items()
+    ], update_meta=False)
+    summary = thumbnails['data']
+    print(f"Thumbnails: {summary['rendered']} rendered, {summary['skipped']} unchanged, {summary['failed']} failed")
+    images = {item['filename']: item for item in summary['items'] if item.get('image')}
+
     for template_id, template_data in all_templates_data.items():
         print(f"Seeding template {template_id}...")
         
@@ -85,6 +98,9 @@ def seed_templates():
         }
         
         filename = f"{template_id}.json"
+        if filename in images:
+            full_metadata["image"] = images[filename]["image"]
+            full_metadata["imageHash"] = images[filename]["imageHash"]
         
         if store.save_template_seed(filename, full_metadata, full_data):
             print(f"Successfully seeded {filename}")
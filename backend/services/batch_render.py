@@ -0,0 +1,216 @@
+"""
+Batch PDF Rendering
+Renders many sheets with shared settings in one call and returns either a
+single merged PDF (one bookmark per item) or a zip of separate PDFs, with a
+per-item success/failure report.
+
+HTML items (sheetHTML) go through the rendered PDF cache and the warm
+wkhtmltopdf pool, which already spreads work over separate processes.
+SocialCalc items (sheetData) are rendered with SocialCalcPDFGenerator on
+the shared render executor's process pool so the pure-Python ReportLab work
+is not serialized on the GIL.
+"""
+
+import base64
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.html_pdf_pool import get_renderer_pool
+from services.pdf_from_html import render_sheet_html_pdf
+from services.msc_parser import extract_savestr
+from services.render_executor import render_executor
+
+
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 500))
+BATCH_PROCESSES = int(os.environ.get('BATCH_PROCESSES', 0)) or os.cpu_count() or 1
+
+OUTPUT_FORMATS = ('merged', 'zip')
+
+
+def _item_label(item: Dict[str, Any], index: int) -> str:
+    label = str(item.get('id') or item.get('filename') or f'item-{index + 1}')
+    return label[:-4] if label.lower().endswith('.pdf') else label
+
+
+def _validate_item(item: Any) -> Optional[str]:
+    if not isinstance(item, dict):
+        return 'Item must be an object'
+    if not (item.get('sheetHTML') or item.get('sheetData')):
+        return 'Item needs sheetHTML or sheetData'
+    return None
+
+
+def _unique_names(labels: List[str]) -> List[str]:
+    """Zip entry names, suffixing duplicates"""
+    seen: Dict[str, int] = {}
+    names = []
+    for label in labels:
+        count = seen.get(label, 0)
+        seen[label] = count + 1
+        names.append(f'{label}.pdf' if count == 0 else f'{label}-{count + 1}.pdf')
+    return names
+
+
+def _render_html_item(sheet_html: str, settings: Dict[str, Any]) -> bytes:
+    """CreateSheetHTML() output -> PDF bytes, through the rendered PDF cache"""
+    pdf_bytes, _ = render_sheet_html_pdf(sheet_html, settings)
+    return pdf_bytes
+
+
+def merge_pdfs(parts: List[bytes], titles: List[str]) -> Tuple[bytes, Dict[int, str]]:
+    """
+    Concatenate PDFs into one document with a bookmark per part
+
+    Returns:
+        (merged PDF, {part index: error} for parts that could not be read)
+    """
+    from pypdf import PdfWriter, PdfReader
+    from pypdf.errors import PdfReadError
+
+    writer = PdfWriter()
+    errors = {}
+    for index, (pdf_bytes, title) in enumerate(zip(parts, titles)):
+        try:
+            writer.append(PdfReader(BytesIO(pdf_bytes)), outline_item=title)
+        except PdfReadError as e:
+            errors[index] = f'Invalid PDF output: {str(e)}'
+    buffer = BytesIO()
+    writer.write(buffer)
+    writer.close()
+    return buffer.getvalue(), errors
+
+
+def zip_pdfs(parts: List[bytes], names: List[str], manifest: List[Dict[str, Any]]) -> bytes:
+    """Store PDFs (already compressed) plus a manifest.json of per-item results"""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for pdf_bytes, name in zip(parts, names):
+            archive.writestr(name, pdf_bytes)
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+    return buffer.getvalue()
+
+
+def render_batch(items: List[Dict[str, Any]], settings: Dict[str, Any],
+                 output: str = 'merged') -> Dict[str, Any]:
+    """
+    Render a batch of sheets into one merged PDF or a zip of PDFs
+
+    Args:
+        items: [{id, sheetHTML | sheetData, settings?}]; per-item settings
+            override the shared ones
+        settings: Shared PDF generation settings
+        output: 'merged' or 'zip'
+
+    Returns:
+        Dictionary with success status, the encoded output and per-item results
+    """
+    if output not in OUTPUT_FORMATS:
+        return {'success': False, 'error': f"output must be one of {', '.join(OUTPUT_FORMATS)}"}
+    if not items:
+        return {'success': False, 'error': 'No items to render'}
+    if len(items) > BATCH_MAX_ITEMS:
+        return {'success': False, 'error': f'Batch exceeds {BATCH_MAX_ITEMS} items'}
+
+    try:
+        start = time.perf_counter()
+        results: List[Dict[str, Any]] = []
+        futures = []
+
+        # HTML jobs are submitted from threads sized to the wkhtmltopdf pool,
+        # so a batch never overflows the pool's bounded queue
+        pool = get_renderer_pool()
+        html_threads = ThreadPoolExecutor(max_workers=pool.size if pool else BATCH_PROCESSES)
+        try:
+            for index, item in enumerate(items):
+                label = _item_label(item if isinstance(item, dict) else {}, index)
+                results.append({'index': index, 'id': label})
+                error = _validate_item(item)
+                if error:
+                    futures.append((None, error, None))
+                    continue
+
+                item_settings = {**settings, **(item.get('settings') or {})}
+                submitted = time.perf_counter()
+                try:
+                    if item.get('sheetHTML'):
+                        future = html_threads.submit(_render_html_item, item['sheetHTML'], item_settings)
+                    else:
+                        # Waits for a free slot rather than overflowing the shared queue
+                        future = render_executor.submit_pdf(
+                            extract_savestr(item['sheetData']), item_settings, block=True)
+                except Exception as e:
+                    # A saturated executor (RendererBusyError) fails this item, not the batch
+                    futures.append((None, str(e) or e.__class__.__name__, None))
+                    continue
+                futures.append((future, None, submitted))
+
+            parts, titles, rendered = [], [], []
+            for result, (future, error, submitted) in zip(results, futures):
+                if future is not None:
+                    try:
+                        pdf_bytes = future.result()
+                        result['ms'] = round((time.perf_counter() - submitted) * 1000, 2)
+                    except Exception as e:
+                        error = str(e) or e.__class__.__name__
+                if error:
+                    result.update({'success': False, 'error': error})
+                    continue
+                result.update({'success': True, 'bytes': len(pdf_bytes)})
+                parts.append(pdf_bytes)
+                titles.append(result['id'])
+                rendered.append(result)
+        finally:
+            html_threads.shutdown(wait=False)
+
+        assemble_start = time.perf_counter()
+        payload = None
+        if output == 'merged' and parts:
+            payload, merge_errors = merge_pdfs(parts, titles)
+            for index, error in merge_errors.items():
+                rendered[index].update({'success': False, 'error': error})
+                rendered[index].pop('bytes', None)
+
+        succeeded = sum(1 for r in results if r['success'])
+        if not succeeded:
+            return {
+                'success': False,
+                'error': 'No item rendered successfully',
+                'data': {'items': results, 'succeeded': 0, 'failed': len(results)}
+            }
+
+        if output == 'merged':
+            data = {'pdf': base64.b64encode(payload).decode('utf-8'), 'filename': 'batch.pdf'}
+        else:
+            names = _unique_names(titles)
+            for result, name in zip(rendered, names):
+                result['filename'] = name
+            payload = zip_pdfs(parts, names, results)
+            data = {'zip': base64.b64encode(payload).decode('utf-8'), 'filename': 'batch.zip'}
+        done = time.perf_counter()
+
+        data.update({
+            'format': output,
+            'bytes': len(payload),
+            'items': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'timings': {
+                'renderMs': round((assemble_start - start) * 1000, 2),
+                'assembleMs': round((done - assemble_start) * 1000, 2),
+                'totalMs': round((done - start) * 1000, 2),
+            }
+        })
+        return {'success': True, 'data': data}
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {
+            'success': False,
+            'error': f'Failed to render batch: {str(e)}'
+        }
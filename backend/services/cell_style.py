@@ -0,0 +1,249 @@
+"""
+Cell Style Resolution
+Maps the MSC style model (font, color, border, layout and cellformat
+definitions, with the sheet-level defaults) onto ReportLab terms: standard
+font names, point sizes, colors, alignment, padding and border lines.
+Resolved styles are memoized per interned MSCStyle, so a sheet costs one
+resolution per distinct style rather than one per cell.
+"""
+
+import re
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from reportlab.lib import colors
+
+from services.msc_parser import MSCSheet, MSCCell, MSCStyle
+
+
+RGB_RE = re.compile(r'rgb\((\d+),\s*(\d+),\s*(\d+)\)')
+HEX_RE = re.compile(r'#([0-9a-fA-F]{3}|[0-9a-fA-F]{6})$')
+PADDING_RE = re.compile(r'padding:\s*([^;]*)')
+VALIGN_RE = re.compile(r'vertical-align:\s*([a-z*]+)')
+
+PX = 0.75  # points per CSS pixel
+
+# Base-14 families; no TrueType fonts ship with the backend
+FONT_FAMILIES = {
+    'sans': ('Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique', 'Helvetica-BoldOblique'),
+    'serif': ('Times-Roman', 'Times-Bold', 'Times-Italic', 'Times-BoldItalic'),
+    'mono': ('Courier', 'Courier-Bold', 'Courier-Oblique', 'Courier-BoldOblique'),
+}
+SERIF_NAMES = ('times', 'georgia', 'garamond', 'palatino', 'book antiqua', 'cambria', 'serif')
+MONO_NAMES = ('courier', 'consolas', 'monaco', 'lucida console', 'monospace')
+
+FONT_SIZE_KEYWORDS = {
+    'xx-small': 7, 'x-small': 7.5, 'small': 10, 'medium': 12,
+    'large': 13.5, 'x-large': 18, 'xx-large': 24,
+}
+
+ALIGNMENTS = {'left': 'LEFT', 'right': 'RIGHT', 'center': 'CENTER', 'justify': 'LEFT'}
+VALIGNMENTS = {'top': 'TOP', 'middle': 'MIDDLE', 'bottom': 'BOTTOM'}
+
+# Used where neither the cell nor the sheet defines a value
+DEFAULT_FONT = ('sans', False, False, 9.0)
+DEFAULT_PADDING = (3.0, 6.0, 3.0, 6.0)  # top, right, bottom, left in points
+DEFAULT_VALIGN = 'MIDDLE'
+
+
+def parse_css_color(value: str) -> Optional[colors.Color]:
+    """Convert an MSC color definition ('rgb(r,g,b)' or '#rrggbb') to a ReportLab color"""
+    color_match = RGB_RE.match(value)
+    if color_match:
+        r, g, b = map(int, color_match.groups())
+        return colors.Color(r/255, g/255, b/255)
+    hex_match = HEX_RE.match(value.strip())
+    if hex_match:
+        digits = hex_match.group(1)
+        if len(digits) == 3:
+            digits = ''.join(ch * 2 for ch in digits)
+        return colors.Color(*(int(digits[i:i + 2], 16) / 255 for i in (0, 2, 4)))
+    return None
+
+
+def parse_length(value: str) -> Optional[float]:
+    """CSS length in points ('10px', '8pt', '0'); None for '*', 'auto' or junk"""
+    value = value.strip().lower()
+    try:
+        if value.endswith('px'):
+            return float(value[:-2]) * PX
+        if value.endswith('pt'):
+            return float(value[:-2])
+        return float(value) * PX
+    except ValueError:
+        return None
+
+
+def parse_font(value: str) -> Tuple[Optional[str], Optional[bool], Optional[bool], Optional[float]]:
+    """
+    Split an MSC font definition ('normal bold 11pt Arial') into
+    (family, bold, italic, size in points); '*' parts are returned as None
+    """
+    parts = value.split(None, 3)
+    if len(parts) < 4:
+        return None, None, None, None
+    style, weight, size, family = parts
+    italic = None if style == '*' else style in ('italic', 'oblique')
+    bold = None if weight == '*' else (weight == 'bold' or weight.isdigit() and int(weight) >= 600)
+    if size == '*':
+        points = None
+    else:
+        points = FONT_SIZE_KEYWORDS.get(size) or parse_length(size)
+    if family == '*':
+        kind = None
+    else:
+        lowered = family.lower()
+        if any(name in lowered for name in MONO_NAMES):
+            kind = 'mono'
+        elif any(name in lowered for name in SERIF_NAMES) and 'sans-serif' not in lowered:
+            kind = 'serif'
+        else:
+            kind = 'sans'
+    return kind, bold, italic, points
+
+
+def font_name(family: str, bold: bool, italic: bool) -> str:
+    return FONT_FAMILIES[family][bold + 2 * italic]
+
+
+class Border(NamedTuple):
+    width: float
+    color: colors.Color
+    dash: Optional[Tuple[float, float]]
+
+
+def parse_border(value: str) -> Optional[Border]:
+    """'1px solid rgb(0,0,0)' -> Border; None for 'none'/zero-width borders"""
+    parts = value.split(None, 2)
+    if len(parts) < 3 or parts[1] in ('none', 'hidden'):
+        return None
+    width = parse_length(parts[0])
+    color = parse_css_color(parts[2])
+    if not width or color is None:
+        return None
+    if parts[1] == 'dashed':
+        dash = (3 * width, 2 * width)
+    elif parts[1] == 'dotted':
+        dash = (width, width)
+    else:
+        dash = None
+    return Border(width, color, dash)
+
+
+def parse_layout(value: str) -> Tuple[Optional[Tuple[Optional[float], ...]], Optional[str]]:
+    """
+    'padding:T R B L;vertical-align:middle;' -> ((top, right, bottom, left) in
+    points, 'MIDDLE'); missing or '*' parts are None
+    """
+    padding = None
+    padding_match = PADDING_RE.search(value)
+    if padding_match:
+        sides = padding_match.group(1).split()
+        if len(sides) == 1:
+            sides = sides * 4
+        elif len(sides) == 2:
+            sides = sides * 2
+        elif len(sides) == 3:
+            sides = sides + [sides[1]]
+        if len(sides) == 4:
+            padding = tuple(parse_length(side) for side in sides)
+    valign_match = VALIGN_RE.search(value)
+    valign = VALIGNMENTS.get(valign_match.group(1)) if valign_match else None
+    return padding, valign
+
+
+class CellStyle(NamedTuple):
+    font_name: str
+    font_size: float
+    color: Optional[colors.Color]
+    background: Optional[colors.Color]
+    align: str
+    valign: str
+    padding: Tuple[float, float, float, float]  # top, right, bottom, left
+    borders: Tuple[Optional[Border], ...]       # top, right, bottom, left
+
+
+class StyleResolver:
+    """
+    Resolve cells of one sheet to CellStyles at a given scale
+
+    Cell attributes fall back to the sheet defaults (sheet:font, color,
+    bgcolor, layout, cf) and then to the renderer defaults. Sizes, padding
+    and border widths are multiplied by `scale`.
+    """
+
+    def __init__(self, sheet: MSCSheet, scale: float = 1.0):
+        self.sheet = sheet
+        self.scale = scale
+        self._styles: Dict[Tuple[MSCStyle, bool], CellStyle] = {}
+        self._colors: Dict[int, Optional[colors.Color]] = {}
+        self._borders: Dict[int, Optional[Border]] = {}
+        attribs = sheet.attribs
+        self.default_font = self._to_int(attribs.get('font'))
+        self.default_color = self._to_int(attribs.get('color'))
+        self.default_bgcolor = self._to_int(attribs.get('bgcolor'))
+        self.default_layout = self._to_int(attribs.get('layout'))
+        self.default_cellformat = self._to_int(attribs.get('cf'))
+
+    @staticmethod
+    def _to_int(value: Optional[str]) -> int:
+        return int(value) if value and value.isdigit() else 0
+
+    def color(self, index: int) -> Optional[colors.Color]:
+        if index not in self._colors:
+            self._colors[index] = parse_css_color(self.sheet.color_of(index))
+        return self._colors[index]
+
+    def border(self, index: int) -> Optional[Border]:
+        if index not in self._borders:
+            border = parse_border(self.sheet.borders.get(index, '')) if index else None
+            if border is not None and self.scale != 1.0:
+                dash = border.dash and tuple(part * self.scale for part in border.dash)
+                border = Border(border.width * self.scale, border.color, dash)
+            self._borders[index] = border
+        return self._borders[index]
+
+    def resolve(self, cell: MSCCell) -> CellStyle:
+        """Effective style of a cell (numbers default to right alignment)"""
+        return self.resolve_style(cell.style, cell.is_numeric)
+
+    def resolve_style(self, style: MSCStyle, numeric: bool = False) -> CellStyle:
+        key = (style, numeric)
+        resolved = self._styles.get(key)
+        if resolved is None:
+            resolved = self._styles[key] = self._resolve(style, numeric)
+        return resolved
+
+    def _resolve(self, style: MSCStyle, numeric: bool) -> CellStyle:
+        sheet, scale = self.sheet, self.scale
+
+        family, bold, italic, size = DEFAULT_FONT
+        for index in (self.default_font, style.font):
+            if index:
+                parsed = parse_font(sheet.font_of(index))
+                family = parsed[0] or family
+                bold = bold if parsed[1] is None else parsed[1]
+                italic = italic if parsed[2] is None else parsed[2]
+                size = parsed[3] or size
+
+        padding, valign = DEFAULT_PADDING, DEFAULT_VALIGN
+        for index in (self.default_layout, style.layout):
+            if index:
+                sides, layout_valign = parse_layout(sheet.layouts.get(index, ''))
+                if sides:
+                    padding = tuple(new if new is not None else old for new, old in zip(sides, padding))
+                valign = layout_valign or valign
+
+        cellformat = sheet.cellformats.get(style.cellformat or self.default_cellformat, '')
+        align = ALIGNMENTS.get(cellformat) or ('RIGHT' if numeric else 'LEFT')
+
+        borders = style.borders or (0, 0, 0, 0)
+        return CellStyle(
+            font_name=font_name(family, bold, italic),
+            font_size=size * scale,
+            color=self.color(style.color or self.default_color),
+            background=self.color(style.bgcolor or self.default_bgcolor),
+            align=align,
+            valign=valign,
+            padding=tuple(side * scale for side in padding),
+            borders=tuple(self.border(index) for index in borders),
+        )
@@ -0,0 +1,857 @@
+"""
+Formula Engine
+Server-side evaluation of the SocialCalc formula subset used by the invoice
+templates (arithmetic, comparisons, ranges, SUM/IF/ROUND/SUMIF and friends).
+
+The engine builds a dependency graph from a parsed sheet, evaluates formula
+cells in topological order and, after an edit, recalculates only the cells
+downstream of the change. Formulas the engine cannot evaluate (cross-sheet
+references, unknown functions) keep the value SocialCalc last saved.
+"""
+
+import json
+import math
+import re
+import threading
+import weakref
+from datetime import date
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
+
+from services.msc_parser import MSCSheet, MSCCell, cell_ref_to_coords, coords_to_cell_ref
+from services.sheet_cache import load_sheet
+
+
+Value = Union[None, bool, float, str, 'FormulaError']
+
+# SocialCalc/Excel date serials count days from 1899-12-30
+DATE_EPOCH = date(1899, 12, 30).toordinal()
+
+
+class FormulaError(Exception):
+    """A spreadsheet error value (#VALUE!, #DIV/0!, ...) produced by evaluation"""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+    def __repr__(self) -> str:
+        return f'FormulaError({self.code})'
+
+
+class UnsupportedFormula(Exception):
+    """Raised at compile time for formulas outside the supported subset"""
+
+
+# ---------------------------------------------------------------------------
+# Tokenizer / parser
+# ---------------------------------------------------------------------------
+
+_TOKEN_RE = re.compile(r'''
+    \s*(?:
+      (?P<string>"(?:[^"]|"")*")
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<sheetref>[A-Za-z_][\w.]*!\$?[A-Za-z]{1,3}\$?\d+(?::\$?[A-Za-z]{1,3}\$?\d+)?)
+    | (?P<range>\$?[A-Za-z]{1,3}\$?\d+:\$?[A-Za-z]{1,3}\$?\d+)
+    | (?P<ref>\$?[A-Za-z]{1,3}\$?\d+)(?![\w(])
+    | (?P<name>[A-Za-z_][\w.]*)
+    | (?P<op><>|<=|>=|[-+*/^&=<>%(),])
+    )''', re.X)
+
+# Binary operator precedence, lowest first
+_BINARY_LEVELS = (
+    ('=', '<>', '<', '>', '<=', '>='),
+    ('&',),
+    ('+', '-'),
+    ('*', '/'),
+    ('^',),
+)
+
+
+def _tokenize(formula: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos, end = 0, len(formula)
+    while pos < end:
+        match = _TOKEN_RE.match(formula, pos)
+        if match is None or match.end() == pos:
+            if formula[pos:].strip():
+                raise UnsupportedFormula(f'Unexpected input at {formula[pos:]!r}')
+            break
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    return tokens
+
+
+def _plain_ref(ref: str) -> str:
+    return ref.replace('$', '').upper()
+
+
+def _expand_range(range_ref: str) -> Tuple[str, ...]:
+    start, end = range_ref.split(':')
+    start_coords = cell_ref_to_coords(_plain_ref(start))
+    end_coords = cell_ref_to_coords(_plain_ref(end))
+    if start_coords is None or end_coords is None:
+        raise UnsupportedFormula(f'Invalid range {range_ref}')
+    col1, col2 = sorted((start_coords[0], end_coords[0]))
+    row1, row2 = sorted((start_coords[1], end_coords[1]))
+    return tuple(coords_to_cell_ref(col, row)
+                 for row in range(row1, row2 + 1)
+                 for col in range(col1, col2 + 1))
+
+
+class _Parser:
+    """
+    Recursive-descent parser producing tuple nodes:
+    ('num', float) ('str', s) ('bool', b) ('ref', ref) ('range', key)
+    ('neg', node) ('pct', node) ('bin', op, left, right) ('call', name, [args])
+    """
+
+    def __init__(self, formula: str):
+        self.tokens = _tokenize(formula)
+        self.pos = 0
+        self.refs: Set[str] = set()
+        self.ranges: Dict[str, Tuple[str, ...]] = {}
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> Tuple[str, str]:
+        token = self.peek()
+        if token is None:
+            raise UnsupportedFormula('Unexpected end of formula')
+        self.pos += 1
+        return token
+
+    def expect(self, op: str) -> None:
+        kind, text = self.take()
+        if kind != 'op' or text != op:
+            raise UnsupportedFormula(f'Expected {op!r}, got {text!r}')
+
+    def parse(self) -> tuple:
+        node = self.binary(0)
+        if self.peek() is not None:
+            raise UnsupportedFormula(f'Unexpected token {self.peek()[1]!r}')
+        return node
+
+    def binary(self, level: int) -> tuple:
+        if level == len(_BINARY_LEVELS):
+            return self.unary()
+        ops = _BINARY_LEVELS[level]
+        node = self.binary(level + 1)
+        while True:
+            token = self.peek()
+            if token is None or token[0] != 'op' or token[1] not in ops:
+                return node
+            self.pos += 1
+            node = ('bin', token[1], node, self.binary(level + 1))
+
+    def unary(self) -> tuple:
+        token = self.peek()
+        if token is not None and token[0] == 'op' and token[1] in '+-':
+            self.pos += 1
+            operand = self.unary()
+            return ('neg', operand) if token[1] == '-' else ('pos', operand)
+        node = self.primary()
+        while self.peek() == ('op', '%'):
+            self.pos += 1
+            node = ('pct', node)
+        return node
+
+    def primary(self) -> tuple:
+        kind, text = self.take()
+        if kind == 'number':
+            return ('num', float(text))
+        if kind == 'string':
+            return ('str', text[1:-1].replace('""', '"'))
+        if kind == 'ref':
+            ref = _plain_ref(text)
+            self.refs.add(ref)
+            return ('ref', ref)
+        if kind == 'range':
+            key = _plain_ref(text)
+            if key not in self.ranges:
+                self.ranges[key] = _expand_range(key)
+            return ('range', key)
+        if kind == 'sheetref':
+            raise UnsupportedFormula(f'Cross-sheet reference {text}')
+        if kind == 'name':
+            name = text.upper()
+            if self.peek() == ('op', '('):
+                self.pos += 1
+                return ('call', name, self.arguments())
+            if name in ('TRUE', 'FALSE'):
+                return ('bool', name == 'TRUE')
+            raise UnsupportedFormula(f'Unknown name {text}')
+        if kind == 'op' and text == '(':
+            node = self.binary(0)
+            self.expect(')')
+            return node
+        raise UnsupportedFormula(f'Unexpected token {text!r}')
+
+    def arguments(self) -> List[tuple]:
+        args = []
+        if self.peek() == ('op', ')'):
+            self.pos += 1
+            return args
+        while True:
+            args.append(self.binary(0))
+            kind, text = self.take()
+            if kind == 'op' and text == ')':
+                return args
+            if kind != 'op' or text != ',':
+                raise UnsupportedFormula(f'Expected , or ) in arguments, got {text!r}')
+
+
+class CompiledFormula:
+    """Parsed formula plus the cells and ranges it reads"""
+
+    __slots__ = ('source', 'node', 'refs', 'ranges')
+
+    def __init__(self, source: str):
+        parser = _Parser(source)
+        self.source = source
+        self.node = parser.parse()
+        self.refs = parser.refs
+        self.ranges = parser.ranges
+        _check_functions(self.node)
+
+    @property
+    def dependencies(self) -> Set[str]:
+        deps = set(self.refs)
+        for refs in self.ranges.values():
+            deps.update(refs)
+        return deps
+
+
+# Compiled formulas are immutable and shared across sheets
+_FORMULA_CACHE: Dict[str, Union[CompiledFormula, UnsupportedFormula]] = {}
+_FORMULA_CACHE_LIMIT = 16384
+
+
+def compile_formula(formula: str) -> CompiledFormula:
+    """Parse a formula (without the leading '='), memoized by source text"""
+    compiled = _FORMULA_CACHE.get(formula)
+    if compiled is None:
+        try:
+            compiled = CompiledFormula(formula)
+        except UnsupportedFormula as e:
+            compiled = e
+        if len(_FORMULA_CACHE) < _FORMULA_CACHE_LIMIT:
+            _FORMULA_CACHE[formula] = compiled
+    if isinstance(compiled, UnsupportedFormula):
+        raise compiled
+    return compiled
+
+
+# ---------------------------------------------------------------------------
+# Value coercion
+# ---------------------------------------------------------------------------
+
+def to_number(value: Value) -> float:
+    if value is None:
+        return 0.0
+    if value.__class__ is float:
+        return value
+    if value.__class__ is bool:
+        return 1.0 if value else 0.0
+    if isinstance(value, FormulaError):
+        raise FormulaError(value.code)
+    text = value.strip()
+    if not text:
+        return 0.0
+    try:
+        return float(text.replace(',', '').lstrip('$'))
+    except ValueError:
+        raise FormulaError('#VALUE!')
+
+
+def to_text(value: Value) -> str:
+    if value is None:
+        return ''
+    if value.__class__ is bool:
+        return 'TRUE' if value else 'FALSE'
+    if value.__class__ is float:
+        return format_number(value)
+    if isinstance(value, FormulaError):
+        raise FormulaError(value.code)
+    return value
+
+
+def to_bool(value: Value) -> bool:
+    if value.__class__ is str:
+        upper = value.strip().upper()
+        if upper in ('TRUE', 'FALSE'):
+            return upper == 'TRUE'
+    return to_number(value) != 0
+
+
+def format_number(value: float) -> str:
+    """Render a number the way SocialCalc saves it (integers without '.0')"""
+    if value.is_integer() and abs(value) < 1e16:
+        return str(int(value))
+    return repr(value)
+
+
+def display_value(value: Value) -> str:
+    """String shown in rendered output for an evaluated value"""
+    if isinstance(value, FormulaError):
+        return value.code
+    return to_text(value)
+
+
+def _compare(op: str, left: Value, right: Value) -> bool:
+    # Numbers sort before text; text compares case-insensitively and an
+    # empty string compares like a blank cell
+    if left == '':
+        left = None
+    if right == '':
+        right = None
+    if left is None:
+        left = '' if isinstance(right, str) else 0.0
+    if right is None:
+        right = '' if isinstance(left, str) else 0.0
+    if isinstance(left, str) and isinstance(right, str):
+        left, right = left.lower(), right.lower()
+    elif isinstance(left, str) or isinstance(right, str):
+        left, right = (1 if isinstance(left, str) else 0), (1 if isinstance(right, str) else 0)
+    else:
+        left, right = to_number(left), to_number(right)
+    if op == '=':
+        return left == right
+    if op == '<>':
+        return left != right
+    if op == '<':
+        return left < right
+    if op == '>':
+        return left > right
+    if op == '<=':
+        return left <= right
+    return left >= right
+
+
+def _round_half_away(number: float, digits: int) -> float:
+    factor = 10.0 ** digits
+    return math.copysign(math.floor(abs(number) * factor + 0.5) / factor, number)
+
+
+_CRITERIA_RE = re.compile(r'^(<>|<=|>=|=|<|>)?(.*)$', re.S)
+
+
+def _criteria_matcher(criteria: Value):
+    """Build a predicate for SUMIF criteria such as "x", ">0" or 5"""
+    if criteria.__class__ is float:
+        return lambda value: value.__class__ is float and value == criteria
+    op, operand = _CRITERIA_RE.match(to_text(criteria)).groups()
+    op = op or '='
+    try:
+        target: Value = float(operand)
+    except ValueError:
+        target = operand
+    return lambda value: (value is not None or op == '<>') and _compare(op, value, target)
+
+
+# ---------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------
+
+def _fn_sum(engine, args):
+    total = 0.0
+    for arg in args:
+        if arg.__class__ is tuple:
+            total += engine.range_sum(arg[1])
+        else:
+            total += to_number(arg)
+    return total
+
+
+def _numbers(engine, args) -> List[float]:
+    values = []
+    for arg in args:
+        if arg.__class__ is tuple:
+            values.extend(engine.range_numbers(arg[1]))
+        else:
+            values.append(to_number(arg))
+    return values
+
+
+def _fn_min(engine, args):
+    values = _numbers(engine, args)
+    return min(values) if values else 0.0
+
+
+def _fn_max(engine, args):
+    values = _numbers(engine, args)
+    return max(values) if values else 0.0
+
+
+def _fn_average(engine, args):
+    values = _numbers(engine, args)
+    if not values:
+        raise FormulaError('#DIV/0!')
+    return sum(values) / len(values)
+
+
+def _fn_count(engine, args):
+    return float(len(_numbers(engine, args)))
+
+
+def _fn_round(engine, args):
+    digits = int(to_number(args[1])) if len(args) > 1 else 0
+    return _round_half_away(to_number(args[0]), digits)
+
+
+def _fn_abs(engine, args):
+    return abs(to_number(args[0]))
+
+
+def _fn_and(engine, args):
+    return all(to_bool(v) for v in _flatten(engine, args))
+
+
+def _fn_or(engine, args):
+    return any(to_bool(v) for v in _flatten(engine, args))
+
+
+def _fn_not(engine, args):
+    return not to_bool(args[0])
+
+
+def _fn_today(engine, args):
+    return float(date.today().toordinal() - DATE_EPOCH)
+
+
+def _fn_date(engine, args):
+    year, month, day = (int(to_number(a)) for a in args)
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    try:
+        return float(date(year, month, 1).toordinal() - DATE_EPOCH + day - 1)
+    except ValueError:
+        raise FormulaError('#NUM!')
+
+
+def _fn_sumif(engine, args):
+    if args[0].__class__ is not tuple:
+        raise FormulaError('#VALUE!')
+    criteria_refs = engine.range_refs(args[0][1])
+    sum_refs = engine.range_refs(args[2][1]) if len(args) > 2 and args[2].__class__ is tuple \
+        else criteria_refs
+    matches = _criteria_matcher(args[1])
+    total = 0.0
+    for criteria_ref, sum_ref in zip(criteria_refs, sum_refs):
+        if matches(engine.value_of(criteria_ref)):
+            value = engine.value_of(sum_ref)
+            if value.__class__ is float:
+                total += value
+    return total
+
+
+def _flatten(engine, args) -> List[Value]:
+    values = []
+    for arg in args:
+        if arg.__class__ is tuple:
+            values.extend(engine.value_of(ref) for ref in engine.range_refs(arg[1]))
+        else:
+            values.append(arg)
+    return values
+
+
+# name -> (implementation, min args, max args); IF and ISBLANK are handled lazily
+FUNCTIONS = {
+    'SUM': (_fn_sum, 1, None),
+    'MIN': (_fn_min, 1, None),
+    'MAX': (_fn_max, 1, None),
+    'AVERAGE': (_fn_average, 1, None),
+    'COUNT': (_fn_count, 1, None),
+    'ROUND': (_fn_round, 1, 2),
+    'ABS': (_fn_abs, 1, 1),
+    'AND': (_fn_and, 1, None),
+    'OR': (_fn_or, 1, None),
+    'NOT': (_fn_not, 1, 1),
+    'TODAY': (_fn_today, 0, 0),
+    'DATE': (_fn_date, 3, 3),
+    'SUMIF': (_fn_sumif, 2, 3),
+}
+_SPECIAL_FUNCTIONS = {'IF': (2, 3), 'ISBLANK': (1, 1)}
+
+
+def _check_functions(node: tuple) -> None:
+    kind = node[0]
+    if kind == 'call':
+        name, args = node[1], node[2]
+        spec = _SPECIAL_FUNCTIONS.get(name) or (FUNCTIONS[name][1:] if name in FUNCTIONS else None)
+        if spec is None:
+            raise UnsupportedFormula(f'Unsupported function {name}')
+        low, high = spec
+        if len(args) < low or (high is not None and len(args) > high):
+            raise UnsupportedFormula(f'Wrong number of arguments to {name}')
+        for arg in args:
+            _check_functions(arg)
+    elif kind == 'bin':
+        _check_functions(node[2])
+        _check_functions(node[3])
+    elif kind in ('neg', 'pos', 'pct'):
+        _check_functions(node[1])
+
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+def _input_value(cell) -> Value:
+    """Value of a non-formula cell as saved in the savestr"""
+    if cell.valuetype[:1] == 'n':
+        try:
+            return float(cell.value)
+        except ValueError:
+            return cell.value
+    if cell.valuetype[:1] == 'e':
+        return FormulaError(cell.value or '#VALUE!')
+    return cell.value
+
+
+class FormulaEngine:
+    """
+    Evaluated values for one sheet
+
+    The parsed sheet is never modified; values live in the engine and edits
+    go through set_value()/set_formula(), which recalculate only the cells
+    that depend on the edited cell.
+    """
+
+    def __init__(self, sheet: MSCSheet):
+        self.sheet = sheet
+        self.values: Dict[str, Value] = {}
+        self.formulas: Dict[str, CompiledFormula] = {}
+        self.unsupported: Dict[str, str] = {}
+        self.dependents: Dict[str, Set[str]] = {}
+        self._order: Dict[str, int] = {}
+        self._ranges: Dict[str, Tuple[str, ...]] = {}
+        self._range_numbers: Dict[str, Tuple[float, ...]] = {}
+        self._range_sums: Dict[str, float] = {}
+        self._ranges_by_cell: Dict[str, Set[str]] = {}
+        self.evaluations = 0
+
+        for ref, cell in sheet.cells.items():
+            if cell.datatype == 'f' and cell.formula:
+                try:
+                    self._add_formula(ref, compile_formula(cell.formula))
+                    continue
+                except UnsupportedFormula as e:
+                    self.unsupported[ref] = str(e)
+            self.values[ref] = _input_value(cell)
+
+        self._rebuild_order()
+        self.recalculate()
+
+    # -- graph ---------------------------------------------------------------
+
+    def _add_formula(self, ref: str, compiled: CompiledFormula) -> None:
+        self.formulas[ref] = compiled
+        for dep in compiled.dependencies:
+            self.dependents.setdefault(dep, set()).add(ref)
+        for key, refs in compiled.ranges.items():
+            if key not in self._ranges:
+                self._ranges[key] = refs
+                for member in refs:
+                    self._ranges_by_cell.setdefault(member, set()).add(key)
+
+    def _remove_formula(self, ref: str) -> None:
+        compiled = self.formulas.pop(ref, None)
+        if compiled is None:
+            return
+        for dep in compiled.dependencies:
+            dependents = self.dependents.get(dep)
+            if dependents:
+                dependents.discard(ref)
+
+    def _rebuild_order(self) -> None:
+        """Topologically number formula cells; cells on a cycle get #CIRC!"""
+        pending = {ref: 0 for ref in self.formulas}
+        for ref, compiled in self.formulas.items():
+            for dep in compiled.dependencies:
+                if dep in pending:
+                    pending[ref] += 1
+
+        ready = [ref for ref, count in pending.items() if count == 0]
+        order: Dict[str, int] = {}
+        while ready:
+            ref = ready.pop()
+            order[ref] = len(order)
+            for dependent in self.dependents.get(ref, ()):
+                if dependent in pending:
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0:
+                        ready.append(dependent)
+
+        self._order = order
+        for ref in self.formulas:
+            if ref not in order:
+                self.values[ref] = FormulaError('#CIRC!')
+
+    def _dirty_from(self, refs) -> List[str]:
+        """Formula cells downstream of `refs`, in evaluation order"""
+        dirty: Set[str] = set()
+        stack = list(refs)
+        while stack:
+            for dependent in self.dependents.get(stack.pop(), ()):
+                if dependent not in dirty:
+                    dirty.add(dependent)
+                    stack.append(dependent)
+        order = self._order
+        return sorted((ref for ref in dirty if ref in order), key=order.__getitem__)
+
+    # -- evaluation ----------------------------------------------------------
+
+    def recalculate(self, refs=None) -> int:
+        """
+        Re-evaluate formula cells in dependency order
+
+        Args:
+            refs: Formula cells to evaluate (already ordered); all when None
+
+        Returns:
+            Number of formulas evaluated
+        """
+        if refs is None:
+            refs = sorted(self._order, key=self._order.__getitem__)
+        for ref in refs:
+            self._invalidate(ref)
+            try:
+                self.values[ref] = self.evaluate(self.formulas[ref].node)
+            except FormulaError as e:
+                self.values[ref] = FormulaError(e.code)
+            except (ZeroDivisionError, OverflowError, ValueError, TypeError):
+                self.values[ref] = FormulaError('#NUM!')
+        self.evaluations += len(refs)
+        return len(refs)
+
+    def set_value(self, ref: str, value: Value) -> List[str]:
+        """Set a plain value (text or number) and recalculate its dependents"""
+        ref = _plain_ref(ref)
+        if ref in self.formulas:
+            self._remove_formula(ref)
+            self._rebuild_order()
+        self.unsupported.pop(ref, None)
+        self._invalidate(ref)
+        self.values[ref] = value
+        dirty = self._dirty_from([ref])
+        self.recalculate(dirty)
+        return dirty
+
+    def set_formula(self, ref: str, formula: str) -> List[str]:
+        """Replace a cell's formula and recalculate it and its dependents"""
+        ref = _plain_ref(ref)
+        self._remove_formula(ref)
+        self._add_formula(ref, compile_formula(formula.lstrip('=')))
+        self.unsupported.pop(ref, None)
+        self._rebuild_order()
+        dirty = ([ref] if ref in self._order else []) + self._dirty_from([ref])
+        self.recalculate(dirty)
+        return dirty
+
+    def set_cell(self, ref: str, cell: Optional[MSCCell]) -> List[str]:
+        """
+        Replace a cell as parsed from a savestr `cell:` line (None clears it)
+        and recalculate its dependents
+
+        Formulas the engine cannot evaluate keep the value saved with them.
+
+        Returns:
+            Formula cells that were re-evaluated
+        """
+        if cell is not None and cell.datatype == 'f' and cell.formula:
+            try:
+                compile_formula(cell.formula.lstrip('='))
+            except UnsupportedFormula as e:
+                dirty = self.set_value(ref, _input_value(cell))
+                self.unsupported[_plain_ref(ref)] = str(e)
+                return dirty
+            return self.set_formula(ref, cell.formula)
+        return self.set_value(ref, _input_value(cell) if cell is not None else None)
+
+    def value_of(self, ref: str) -> Value:
+        return self.values.get(ref)
+
+    def evaluate(self, node: tuple) -> Value:
+        kind = node[0]
+        if kind == 'num' or kind == 'str' or kind == 'bool':
+            return node[1]
+        if kind == 'ref':
+            value = self.values.get(node[1])
+            if isinstance(value, FormulaError):
+                raise FormulaError(value.code)
+            return value
+        if kind == 'bin':
+            return self._binary(node[1], self.evaluate(node[2]), self.evaluate(node[3]))
+        if kind == 'call':
+            return self._call(node[1], node[2])
+        if kind == 'neg':
+            return -to_number(self.evaluate(node[1]))
+        if kind == 'pos':
+            return to_number(self.evaluate(node[1]))
+        if kind == 'pct':
+            return to_number(self.evaluate(node[1])) / 100.0
+        # A bare range in scalar context
+        raise FormulaError('#VALUE!')
+
+    def _binary(self, op: str, left: Value, right: Value) -> Value:
+        if op == '+':
+            return to_number(left) + to_number(right)
+        if op == '-':
+            return to_number(left) - to_number(right)
+        if op == '*':
+            return to_number(left) * to_number(right)
+        if op == '/':
+            divisor = to_number(right)
+            if divisor == 0:
+                raise FormulaError('#DIV/0!')
+            return to_number(left) / divisor
+        if op == '^':
+            return float(to_number(left) ** to_number(right))
+        if op == '&':
+            return to_text(left) + to_text(right)
+        for value in (left, right):
+            if isinstance(value, FormulaError):
+                raise FormulaError(value.code)
+        return _compare(op, left, right)
+
+    def _call(self, name: str, arg_nodes: List[tuple]) -> Value:
+        if name == 'IF':
+            if to_bool(self.evaluate(arg_nodes[0])):
+                return self.evaluate(arg_nodes[1])
+            return self.evaluate(arg_nodes[2]) if len(arg_nodes) > 2 else False
+        if name == 'ISBLANK':
+            arg = arg_nodes[0]
+            if arg[0] == 'ref':
+                return self.values.get(arg[1]) is None
+            return False
+
+        args = [node if node[0] == 'range' else self.evaluate(node) for node in arg_nodes]
+        return FUNCTIONS[name][0](self, args)
+
+    # -- range aggregates ------------------------------------------------------
+
+    def range_refs(self, key: str) -> Tuple[str, ...]:
+        return self._ranges[key]
+
+    def range_numbers(self, key: str) -> Tuple[float, ...]:
+        """
+        Numeric values in a range as a flat tuple
+
+        Cached per range and dropped when any member cell changes, so several
+        formulas aggregating the same range share one gather. Text and blank
+        cells are skipped as in SocialCalc; an error cell poisons the range.
+        """
+        numbers = self._range_numbers.get(key)
+        if numbers is None:
+            values = [self.values.get(ref) for ref in self._ranges[key]]
+            for value in values:
+                if isinstance(value, FormulaError):
+                    raise FormulaError(value.code)
+            numbers = tuple(v for v in values if v.__class__ is float)
+            self._range_numbers[key] = numbers
+        return numbers
+
+    def range_sum(self, key: str) -> float:
+        total = self._range_sums.get(key)
+        if total is None:
+            total = self._range_sums[key] = sum(self.range_numbers(key))
+        return total
+
+    def _invalidate(self, ref: str) -> None:
+        for key in self._ranges_by_cell.get(ref, ()):
+            self._range_numbers.pop(key, None)
+            self._range_sums.pop(key, None)
+
+    # -- output ----------------------------------------------------------------
+
+    def display_values(self) -> Dict[str, str]:
+        """Rendered strings for every evaluated formula cell, keyed by ref"""
+        return {ref: display_value(self.values.get(ref)) for ref in self.formulas}
+
+
+# Engines for cached (shared, read-only) sheets, evaluated once per sheet
+_engines: 'weakref.WeakKeyDictionary[MSCSheet, FormulaEngine]' = weakref.WeakKeyDictionary()
+_engines_lock = threading.Lock()
+
+
+def get_engine(sheet: MSCSheet) -> FormulaEngine:
+    """
+    Shared evaluated engine for a sheet
+
+    The result is reused by every renderer of the same sheet object and must
+    not be edited; build a FormulaEngine directly to apply edits.
+    """
+    with _engines_lock:
+        engine = _engines.get(sheet)
+    if engine is None:
+        engine = FormulaEngine(sheet)
+        with _engines_lock:
+            engine = _engines.setdefault(sheet, engine)
+    return engine
+
+
+def computed_values(sheet: MSCSheet) -> Dict[str, str]:
+    """Display strings for the sheet's formula cells, recalculated server-side"""
+    return get_engine(sheet).display_values()
+
+
+# ---------------------------------------------------------------------------
+# Invoice totals
+# ---------------------------------------------------------------------------
+
+TOTAL_LABEL_RE = re.compile(
+    r'^\s*(grand\s+)?total(\s+(amount|due|estimate|outstanding))?\s*:?\s*$', re.I)
+
+
+def find_total_ref(sheet: MSCSheet) -> Optional[str]:
+    """
+    Locate the invoice total cell
+
+    Uses the bottom-most "TOTAL"-style label (not subtotal/tax/paid) and the
+    first numeric cell to its right on the same row.
+    """
+    engine = get_engine(sheet)
+    labels = [cell for cell in sheet.cells.values()
+              if cell.valuetype[:1] == 't' and TOTAL_LABEL_RE.match(cell.value)]
+    for label in sorted(labels, key=lambda c: (c.row, c.col), reverse=True):
+        row_cells = sorted((c for c in sheet.cells.values()
+                            if c.row == label.row and c.col > label.col),
+                           key=lambda c: c.col)
+        for cell in row_cells:
+            if engine.value_of(cell.ref).__class__ is float:
+                return cell.ref
+    return None
+
+
+def compute_total(sheet: MSCSheet) -> Optional[float]:
+    """Server-side invoice total for a sheet, or None if no total cell is found"""
+    ref = find_total_ref(sheet)
+    if ref is None:
+        return None
+    return get_engine(sheet).value_of(ref)
+
+
+def invoice_total(content: Any) -> Optional[float]:
+    """
+    Recalculate the total of stored invoice content
+
+    Args:
+        content: Raw savestr, workbook JSON (string or dict) or a complete
+                 {msc, appMapping, footer} invoice document
+
+    Returns:
+        The total, or None when the content has no recognizable total cell
+    """
+    if isinstance(content, dict):
+        content = content.get('msc', content)
+    if isinstance(content, dict):
+        content = json.dumps(content)
+    if not isinstance(content, str) or not content.strip():
+        return None
+    try:
+        return compute_total(load_sheet(content))
+    except Exception as e:
+        print(f"Error computing invoice total: {e}")
+        return None
@@ -0,0 +1,346 @@
+"""
+HTML-to-PDF Renderer Pool
+Keeps long-lived wkhtmltopdf processes warm instead of spawning one per PDF.
+
+Each worker runs `wkhtmltopdf --read-args-from-stdin`: every line written to
+its stdin is one conversion (shared options come from the command line), and
+the process prints "Done" on stderr when a conversion finishes. Workers are
+health-checked, recycled after a number of jobs, and killed when a job runs
+past its timeout. Jobs beyond the bounded queue are rejected immediately.
+"""
+
+import atexit
+import os
+import queue
+import random
+import string
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+
+WKHTMLTOPDF_BIN = os.environ.get('WKHTMLTOPDF_BIN', 'wkhtmltopdf')
+POOL_SIZE = int(os.environ.get('HTML_PDF_POOL_SIZE', 2))
+QUEUE_SIZE = int(os.environ.get('HTML_PDF_QUEUE_SIZE', 16))
+MAX_JOBS_PER_WORKER = int(os.environ.get('HTML_PDF_WORKER_MAX_JOBS', 200))
+JOB_TIMEOUT = float(os.environ.get('HTML_PDF_JOB_TIMEOUT', 60))
+HEALTH_CHECK_INTERVAL = float(os.environ.get('HTML_PDF_HEALTH_CHECK_INTERVAL', 60))
+
+# Input/output files live on tmpfs when available so jobs never touch disk
+WORK_DIR = os.environ.get('HTML_PDF_WORK_DIR') or (
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+
+PROBE_HTML = '<!DOCTYPE html><html><body><p>ok</p></body></html>'
+
+
+class RendererBusyError(RuntimeError):
+    """Raised when the pool's bounded queue is full"""
+
+
+class RenderError(RuntimeError):
+    """Raised when a worker finishes a job without producing a PDF"""
+
+
+def _job_name() -> str:
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=20))
+
+
+class WkhtmltopdfWorker:
+    """One long-lived wkhtmltopdf process converting jobs read from stdin"""
+
+    def __init__(self, binary: str = WKHTMLTOPDF_BIN, work_dir: str = WORK_DIR):
+        self.binary = binary
+        self.work_dir = work_dir
+        self.jobs = 0
+        self.started_at = time.time()
+        self.last_used = self.started_at
+        self._lines: 'queue.Queue[Optional[str]]' = queue.Queue()
+        self._proc = subprocess.Popen(
+            [binary, '--encoding', 'UTF-8', '--enable-local-file-access', '--read-args-from-stdin'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        self._reader = threading.Thread(target=self._read_stderr, daemon=True)
+        self._reader.start()
+
+    def _read_stderr(self) -> None:
+        """Split stderr into lines (progress bars use \\r) and hand them to render()"""
+        buffer = b''
+        stream = self._proc.stderr
+        while True:
+            chunk = stream.read1(4096) if hasattr(stream, 'read1') else stream.read(4096)
+            if not chunk:
+                break
+            buffer += chunk.replace(b'\r', b'\n')
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                if line.strip():
+                    self._lines.put(line.decode('utf-8', 'replace').strip())
+        self._lines.put(None)
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def render(self, html: str, options: List[str], timeout: float = JOB_TIMEOUT) -> bytes:
+        """
+        Convert one HTML document
+
+        Raises:
+            subprocess.TimeoutExpired: The job ran past `timeout`; the worker
+                is stopped and must be discarded
+            RenderError: wkhtmltopdf finished without a valid PDF
+            ValueError: An option is empty or contains whitespace
+        """
+        # Options share one whitespace-separated line with the file paths, so a
+        # value with whitespace would add arguments of its own
+        if any(not option or any(char.isspace() for char in option) for option in options):
+            raise ValueError('wkhtmltopdf option values must not be empty or contain whitespace')
+
+        # Drop anything left over from the previous job (late warnings)
+        while not self._lines.empty():
+            self._lines.get_nowait()
+
+        name = _job_name()
+        html_file = os.path.join(self.work_dir, f'{name}.html')
+        pdf_file = os.path.join(self.work_dir, f'{name}.pdf')
+        messages = []
+        try:
+            with open(html_file, 'w', encoding='utf-8') as f:
+                f.write(html)
+
+            self._proc.stdin.write((' '.join(options + [html_file, pdf_file]) + '\n').encode('utf-8'))
+            self._proc.stdin.flush()
+
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    line = self._lines.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    self.kill()
+                    raise subprocess.TimeoutExpired(self.binary, timeout)
+                if line is None:
+                    raise RenderError('wkhtmltopdf exited: ' + '; '.join(messages[-3:]))
+                if line == 'Done':
+                    break
+                if not line.startswith('[') and '(' not in line:
+                    messages.append(line)
+
+            try:
+                with open(pdf_file, 'rb') as f:
+                    pdf_bytes = f.read()
+            except FileNotFoundError:
+                pdf_bytes = b''
+            if not pdf_bytes.startswith(b'%PDF'):
+                raise RenderError('; '.join(messages) or 'PDF generation failed')
+            return pdf_bytes
+        finally:
+            self.jobs += 1
+            self.last_used = time.time()
+            for path in (html_file, pdf_file):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def check(self, timeout: float = 10) -> bool:
+        """Health check: the process is running and converts a trivial page"""
+        if not self.alive:
+            return False
+        try:
+            self.render(PROBE_HTML, [], timeout=timeout)
+            return True
+        except (subprocess.TimeoutExpired, RenderError, OSError):
+            return False
+
+    def stop(self) -> None:
+        """Let the process finish after its current line, killing it if it lingers"""
+        if self.alive:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=2)
+            except (OSError, subprocess.TimeoutExpired):
+                self.kill()
+
+    def kill(self) -> None:
+        if self.alive:
+            self._proc.kill()
+            self._proc.wait()
+
+
+class RendererPool:
+    """
+    Fixed-size pool of warm wkhtmltopdf workers
+
+    At most `size` jobs run at once and `queue_size` more may wait for a
+    worker; further jobs fail fast with RendererBusyError. Workers start on
+    demand, are replaced when they die, time out or fail a health check, and
+    are recycled after `max_jobs` conversions to bound memory growth.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, queue_size: int = QUEUE_SIZE,
+                 max_jobs: int = MAX_JOBS_PER_WORKER, job_timeout: float = JOB_TIMEOUT,
+                 binary: str = WKHTMLTOPDF_BIN, work_dir: str = WORK_DIR):
+        self.size = size
+        self.queue_size = queue_size
+        self.max_jobs = max_jobs
+        self.job_timeout = job_timeout
+        self.binary = binary
+        self.work_dir = work_dir
+        self._idle: List[WkhtmltopdfWorker] = []
+        self._slots = threading.BoundedSemaphore(size + queue_size)
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._workers = 0
+        self._waiting = 0
+        self._closed = False
+        self.stats_counters = {
+            'jobs': 0, 'failures': 0, 'timeouts': 0, 'rejected': 0,
+            'started': 0, 'recycled': 0, 'unhealthy': 0,
+        }
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats_counters[key] += 1
+
+    def _spawn(self) -> WkhtmltopdfWorker:
+        try:
+            worker = WkhtmltopdfWorker(self.binary, self.work_dir)
+        except Exception:
+            with self._available:
+                self._workers -= 1
+                self._available.notify()
+            raise
+        self._count('started')
+        return worker
+
+    def _discard(self, worker: WkhtmltopdfWorker) -> None:
+        worker.stop()
+        with self._available:
+            self._workers -= 1
+            self._available.notify()
+
+    def _checkout(self, timeout: float) -> WkhtmltopdfWorker:
+        deadline = time.monotonic() + timeout
+        while True:
+            spawn = False
+            with self._available:
+                while not self._idle:
+                    if self._workers < self.size:
+                        self._workers += 1
+                        spawn = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise subprocess.TimeoutExpired(self.binary, timeout)
+                    self._waiting += 1
+                    self._available.wait(remaining)
+                    self._waiting -= 1
+                worker = None if spawn else self._idle.pop()
+            if spawn:
+                return self._spawn()
+
+            # Health check: dead workers are replaced; long-idle ones are probed
+            idle_for = time.time() - worker.last_used
+            if worker.alive and (idle_for < HEALTH_CHECK_INTERVAL or worker.check()):
+                return worker
+            self._count('unhealthy')
+            self._discard(worker)
+
+    def _checkin(self, worker: WkhtmltopdfWorker) -> None:
+        if self._closed or not worker.alive:
+            self._discard(worker)
+        elif worker.jobs >= self.max_jobs:
+            self._count('recycled')
+            self._discard(worker)
+        else:
+            with self._available:
+                self._idle.append(worker)
+                self._available.notify()
+
+    def render(self, html: str, options: List[str], timeout: float = None) -> bytes:
+        """
+        Render an HTML document to PDF bytes on a pooled worker
+
+        Args:
+            html: Complete HTML document
+            options: wkhtmltopdf page options (page size, margins, ...)
+            timeout: Per-job timeout in seconds, including time spent queued
+
+        Raises:
+            RendererBusyError: The pool and its queue are full
+            subprocess.TimeoutExpired: The job did not finish in time
+            RenderError: wkhtmltopdf could not produce a PDF
+            FileNotFoundError: wkhtmltopdf is not installed
+        """
+        timeout = self.job_timeout if timeout is None else timeout
+        if self._closed:
+            raise RendererBusyError('Renderer pool is shut down')
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise RendererBusyError('PDF renderer queue is full')
+        try:
+            start = time.monotonic()
+            try:
+                worker = self._checkout(timeout)
+            except subprocess.TimeoutExpired:
+                self._count('timeouts')
+                raise
+            try:
+                pdf_bytes = worker.render(html, options, max(timeout - (time.monotonic() - start), 1))
+                self._count('jobs')
+                return pdf_bytes
+            except subprocess.TimeoutExpired:
+                self._count('timeouts')
+                raise
+            except Exception:
+                self._count('failures')
+                raise
+            finally:
+                self._checkin(worker)
+        finally:
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        self._closed = True
+        with self._available:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            self._discard(worker)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': self.size,
+                'queueSize': self.queue_size,
+                'workers': self._workers,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'maxJobsPerWorker': self.max_jobs,
+                **self.stats_counters,
+            }
+
+
+_pool: Optional[RendererPool] = None
+_pool_lock = threading.Lock()
+
+
+def pool_stats() -> Optional[Dict[str, Any]]:
+    """Stats of the process-wide pool, or None if it has not been started"""
+    return _pool.stats() if _pool is not None else None
+
+
+def get_renderer_pool() -> Optional[RendererPool]:
+    """Process-wide pool, created on first use; None when HTML_PDF_POOL_SIZE=0"""
+    global _pool
+    if POOL_SIZE <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = RendererPool()
+            atexit.register(_pool.shutdown)
+        return _pool
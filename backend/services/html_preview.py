@@ -1,11 +1,246 @@
 """
 HTML Preview Generator for SocialCalc
 Generates HTML preview instead of PNG to avoid Cairo dependencies
+
+The document is assembled with list joins in one pass over the used area.
+Each distinct cell formatting is compiled once into a CSS class, so cells
+carry a short class attribute instead of an inline style.
 """
 
 import base64
-from typing import Dict, Any
-import json
+import html
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from services.msc_parser import MSCSheet, MSCStyle
+from services.sheet_cache import load_sheet
+from services.sheet_grid import SparseGrid
+from services.formula_engine import FormulaEngine, get_engine
+from services.value_format import cell_display_text
+
+
+BASE_CSS = """
+        body { margin: 0; padding: 20px; font-family: Arial, sans-serif; background: white; }
+        table { border-collapse: collapse; width: 100%; font-size: 11px; }
+        td { padding: 4px 6px; min-width: 60px; height: 20px; vertical-align: middle; }
+        td.n { text-align: right; }
+"""
+GRIDLINE_CSS = "        td { border: 1px solid #c0c0c0; }\n"
+
+DOCUMENT_TAIL = '    </table>\n</body>\n</html>\n'
+
+ROWS_PER_CHUNK = 200  # rows joined per yielded chunk when streaming
+
+
+def _font_declarations(font: str) -> List[str]:
+    """CSS for an MSC font ('normal bold 11pt Arial'); '*' parts are inherited"""
+    parts = font.split(None, 3)
+    if len(parts) < 4:
+        return []
+    style, weight, size, family = parts
+    declarations = []
+    if style != '*':
+        declarations.append(f'font-style:{style}')
+    if weight != '*':
+        declarations.append(f'font-weight:{weight}')
+    if size != '*':
+        declarations.append(f'font-size:{size}')
+    if family != '*':
+        declarations.append(f'font-family:{family}')
+    return declarations
+
+
+def _layout_declarations(layout: str) -> List[str]:
+    """CSS declarations of an MSC layout ('padding:...;vertical-align:...;') minus '*' parts"""
+    return [part.strip() for part in layout.split(';') if part.strip() and '*' not in part]
+
+
+def style_declarations(sheet: MSCSheet, style: MSCStyle) -> str:
+    """CSS declarations for the formatting of one interned MSC style"""
+    declarations = []
+    if style.font:
+        declarations.extend(_font_declarations(sheet.font_of(style.font)))
+    if style.color:
+        declarations.append(f'color:{sheet.color_of(style.color)}')
+    if style.bgcolor:
+        declarations.append(f'background-color:{sheet.color_of(style.bgcolor)}')
+    if style.cellformat:
+        align = sheet.cellformats.get(style.cellformat)
+        if align:
+            declarations.append(f'text-align:{align}')
+    if style.layout:
+        declarations.extend(_layout_declarations(sheet.layouts.get(style.layout, '')))
+    if style.borders:
+        for side, index in zip(('top', 'right', 'bottom', 'left'), style.borders):
+            if index and index in sheet.borders:
+                declarations.append(f'border-{side}:{sheet.borders[index]}')
+    return ';'.join(declarations)
+
+
+class SheetHTMLRenderer:
+    """
+    Preview document of one sheet, or single rows of it
+
+    Each distinct formatting becomes one CSS class; styles that differ only
+    in value format share a class. Classes for the styles in the sheet are
+    compiled up front in first-use order. Styles first seen later (rows
+    re-rendered after edits) get new classes whose rules collect in
+    take_new_rules(). Cells covered by merges and hidden rows and columns
+    are left out.
+    """
+
+    def __init__(self, sheet: MSCSheet, settings: Dict[str, Any], row_ids: bool = False,
+                 engine: Optional[FormulaEngine] = None):
+        self.sheet = sheet
+        self.settings = settings
+        self.row_ids = row_ids  # data-row="N" (1-based) on every <tr>, for patching
+        self.grid = SparseGrid(sheet)
+        # An editor's own engine, or the shared read-only one
+        self.values = (engine or get_engine(sheet)).values
+        self.rules: List[str] = []
+        self._classes: Dict[MSCStyle, str] = {}
+        self._by_declarations: Dict[str, str] = {}
+        self._tags: Dict[Tuple[MSCStyle, bool], str] = {}  # opening <td> per (style, numeric)
+        self._new_rules: List[str] = []
+        for style in sheet.style_index():
+            self.class_for(style)
+        self._new_rules = []
+
+        self.cols = [col for col in self.grid.col_range if col not in sheet.hidden_cols]
+        # Merge origins inside another merge are ignored, as in the browser
+        self.covered = set()
+        for row in sorted(self.grid.rows):
+            row_cells = self.grid.rows[row]
+            for col in sorted(row_cells):
+                cell = row_cells[col]
+                if (cell.colspan > 1 or cell.rowspan > 1) and (col, row) not in self.covered:
+                    self.covered.update((c, r) for c in range(col, col + cell.colspan)
+                                        for r in range(row, row + cell.rowspan) if (c, r) != (col, row))
+        self._covered_rows = {row for _, row in self.covered}
+        self._empty_cells = '<td></td>' * len(self.cols)
+
+    def class_for(self, style: MSCStyle) -> str:
+        """CSS class name of a style ('' when it needs no CSS)"""
+        name = self._classes.get(style)
+        if name is None:
+            declarations = style_declarations(self.sheet, style)
+            name = ''
+            if declarations:
+                name = self._by_declarations.get(declarations)
+                if name is None:
+                    name = self._by_declarations[declarations] = f's{len(self._by_declarations)}'
+                    rule = f'        td.{name} {{ {declarations} }}\n'
+                    self.rules.append(rule)
+                    self._new_rules.append(rule)
+            self._classes[style] = name
+        return name
+
+    def take_new_rules(self) -> List[str]:
+        """CSS rules of classes compiled since the last call"""
+        rules, self._new_rules = self._new_rules, []
+        return rules
+
+    def css(self) -> str:
+        """Base rules, sheet defaults (sheet:font/color/bgcolor/layout) and the style classes"""
+        sheet = self.sheet
+        parts = [BASE_CSS]
+        if self.settings.get('includeGridlines', True):
+            parts.append(GRIDLINE_CSS)
+        defaults = []
+        for key, convert in (('font', lambda i: _font_declarations(sheet.font_of(i))),
+                             ('color', lambda i: [f'color:{sheet.color_of(i)}']),
+                             ('bgcolor', lambda i: [f'background-color:{sheet.color_of(i)}']),
+                             ('layout', lambda i: _layout_declarations(sheet.layouts.get(i, '')))):
+            value = sheet.attribs.get(key, '')
+            if value.isdigit() and int(value):
+                defaults.extend(convert(int(value)))
+        if defaults:
+            parts.append(f"        td {{ {';'.join(defaults)} }}\n")
+        parts.extend(self.rules)
+        return ''.join(parts)
+
+    def _open_tag(self, style: MSCStyle, numeric: bool) -> str:
+        attrs = ''
+        if style.colspan > 1:
+            attrs += f' colspan="{style.colspan}"'
+        if style.rowspan > 1:
+            attrs += f' rowspan="{style.rowspan}"'
+        name = self.class_for(style)
+        if numeric:
+            name = f'n {name}' if name else 'n'
+        if name:
+            attrs += f' class="{name}"'
+        return f'<td{attrs}>'
+
+    def row_html(self, row: int) -> str:
+        """The <tr> of a sheet row (0-based), '' for hidden rows"""
+        if row in self.sheet.hidden_rows:
+            return ''
+        tr = f'        <tr data-row="{row + 1}">' if self.row_ids else '        <tr>'
+        row_cells = self.grid.rows.get(row)
+        if not row_cells and row not in self._covered_rows:
+            return f'{tr}{self._empty_cells}</tr>\n'
+
+        sheet, values, covered, tags = self.sheet, self.values, self.covered, self._tags
+        parts = [tr]
+        for col in self.cols:
+            if (col, row) in covered:
+                continue
+            cell = row_cells.get(col) if row_cells else None
+            if cell is None:
+                parts.append('<td></td>')
+                continue
+            style = cell.style
+            numeric = cell.valuetype[:1] == 'n'
+            tag = tags.get((style, numeric))
+            if tag is None:
+                tag = tags[(style, numeric)] = self._open_tag(style, numeric)
+            text = cell_display_text(sheet, cell, values.get(cell.ref))
+            if text:
+                text = html.escape(text, quote=False).replace('\n', '<br>')
+            parts.append(f'{tag}{text}</td>')
+        parts.append('</tr>\n')
+        return ''.join(parts)
+
+    def document_head(self) -> str:
+        """Everything before the first <tr>"""
+        return ('<!DOCTYPE html>\n<html>\n<head>\n    <meta charset="UTF-8">\n    <style>'
+                + self.css() + '    </style>\n</head>\n<body>\n    <table>\n')
+
+    def iter_document(self) -> Iterator[str]:
+        """Yield the standalone document in chunks of ROWS_PER_CHUNK rows"""
+        yield self.document_head()
+        row_html = self.row_html
+        chunk = []
+        for row in self.grid.row_range:
+            chunk.append(row_html(row))
+            if len(chunk) >= ROWS_PER_CHUNK:
+                yield ''.join(chunk)
+                chunk = []
+        chunk.append(DOCUMENT_TAIL)
+        yield ''.join(chunk)
+
+
+def iter_sheet_html(sheet: MSCSheet, settings: Dict[str, Any]) -> Iterator[str]:
+    """
+    Yield a standalone HTML document for the used area of a parsed sheet in
+    chunks of ROWS_PER_CHUNK rows, for streaming responses
+    """
+    return SheetHTMLRenderer(sheet, settings).iter_document()
+
+
+def render_sheet_html(sheet: MSCSheet, settings: Dict[str, Any]) -> str:
+    """
+    Render the used area of a parsed sheet as a standalone HTML document
+
+    Args:
+        sheet: Parsed sheet
+        settings: Preview generation settings
+            - includeGridlines: boolean
+
+    Returns:
+        HTML document string
+    """
+    return ''.join(iter_sheet_html(sheet, settings))
 
 
 def generate_html_preview(sheet_data: str, settings: Dict[str, Any]) -> Dict[str, Any]:
@@ -15,158 +250,19 @@ def generate_html_preview(sheet_data: str, settings: Dict[str, Any]) -> Dict[str
     Args:
         sheet_data: MSC format string or JSON workbook format
         settings: Preview generation settings
+            - allSheets: preview every sheet of a workbook (see workbook_renderer)
         
     Returns:
         Dictionary with success status and HTML preview data
     """
+    if settings.get('allSheets'):
+        from services.workbook_renderer import render_workbook_previews
+        return render_workbook_previews(sheet_data, settings, 'html')
+
     try:
-        # Check if data is JSON format (workbook)
-        try:
-            workbook_data = json.loads(sheet_data)
-            # Extract first sheet's savestr
-            if 'sheetArr' in workbook_data:
-                first_sheet_id = workbook_data.get('currentid', 'sheet1')
-                sheet_arr = workbook_data['sheetArr']
-                if first_sheet_id in sheet_arr:
-                    msc_data = sheet_arr[first_sheet_id]['sheetstr']['savestr']
-                else:
-                    # Get first available sheet
-                    first_sheet = list(sheet_arr.values())[0]
-                    msc_data = first_sheet['sheetstr']['savestr']
-            else:
-                raise ValueError('Invalid workbook format')
-        except (json.JSONDecodeError, KeyError, ValueError):
-            # Assume it's raw MSC format
-            msc_data = sheet_data
-        
-        # Parse MSC data
-        cells = {}
-        max_row = 0
-        max_col = 0
-        
-        lines = msc_data.strip().split('\n')
-        
-        for line in lines:
-            if line.startswith('cell:'):
-                parts = line.split(':')
-                if len(parts) >= 4:
-                    cell_ref = parts[1]
-                    cell_type = parts[2]
-                    cell_value = parts[3] if len(parts) > 3 else ''
-                    
-                    # Parse formatting
-                    is_bold = False
-                    bg_color = ''
-                    text_color = ''
-                    
-                    for i in range(4, len(parts), 2):
-                        if i + 1 < len(parts):
-                            if parts[i] == 'f' and parts[i + 1] == '1':
-                                is_bold = True
-                            elif parts[i] == 'bg':
-                                bg_color = parts[i + 1]
-                            elif parts[i] == 'color':
-                                text_color = parts[i + 1]
-                    
-                    # Parse cell reference
-                    import re
-                    match = re.match(r'([A-Z]+)(\d+)', cell_ref)
-                    if match:
-                        col_str = match.group(1)
-                        row_num = int(match.group(2))
-                        
-                        # Convert column letters to number
-                        col = 0
-                        for char in col_str:
-                            col = col * 26 + (ord(char) - 65)
-                        
-                        max_row = max(max_row, row_num)
-                        max_col = max(max_col, col)
-                        
-                        cells[cell_ref] = {
-                            'value': cell_value,
-                            'bold': is_bold,
-                            'bg': bg_color,
-                            'color': text_color,
-                            'row': row_num - 1,
-                            'col': col
-                        }
-        
-        # Build HTML table
-        include_gridlines = settings.get('includeGridlines', True)
-        
-        html = '''
-<!DOCTYPE html>
-<html>
-<head>
-    <style>
-        body { 
-            margin: 0; 
-            padding: 20px; 
-            font-family: Arial, sans-serif; 
-            background: white;
-        }
-        table { 
-            border-collapse: collapse; 
-            width: 100%;
-            font-size: 11px;
-        }
-        td { 
-            padding: 4px 6px;
-            min-width: 60px;
-            height: 20px;
-            vertical-align: middle;
-'''
-        
-        if include_gridlines:
-            html += '''
-            border: 1px solid #c0c0c0;
-'''
-        
-        html += '''
-        }
-        .bold { font-weight: bold; }
-    </style>
-</head>
-<body>
-    <table>
-'''
-        
-        # Generate table rows
-        for row in range(max_row):
-            html += '        <tr>\n'
-            for col in range(max_col + 1):
-                # Find cell
-                cell_ref = ''
-                col_num = col
-                while col_num >= 0:
-                    cell_ref = chr(65 + (col_num % 26)) + cell_ref
-                    col_num = col_num // 26 - 1
-                    if col_num < 0:
-                        break
-                cell_ref += str(row + 1)
-                
-                cell = cells.get(cell_ref, {})
-                value = cell.get('value', '')
-                
-                # Build cell style
-                style_parts = []
-                if cell.get('bg'):
-                    style_parts.append(f"background-color: {cell['bg']}")
-                if cell.get('color'):
-                    style_parts.append(f"color: {cell['color']}")
-                
-                style_attr = f' style="{"; ".join(style_parts)}"' if style_parts else ''
-                class_attr = ' class="bold"' if cell.get('bold') else ''
-                
-                html += f'            <td{style_attr}{class_attr}>{value}</td>\n'
-            
-            html += '        </tr>\n'
-        
-        html += '''    </table>
-</body>
-</html>
-'''
+        # Parse MSC data (workbook JSON or raw MSC, cached across requests)
+        sheet = load_sheet(sheet_data)
+        html = render_sheet_html(sheet, settings)
         
         # Encode HTML as base64
         html_base64 = base64.b64encode(html.encode('utf-8')).decode('utf-8')
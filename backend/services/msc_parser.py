@@ -0,0 +1,610 @@
+"""
+MSC Parser for SocialCalc
+Single-pass parser that turns a SocialCalc savestr into a typed sheet model.
+Shared by the PDF generator, HTML preview and mapping agent so every path
+sees the same cells, styles and sheet dimensions.
+"""
+
+import codecs
+import json
+import re
+from typing import Dict, Any, List, Optional, Tuple, Iterator, Iterable, NamedTuple, Union, IO
+
+
+# Column labels are precomputed once (A..ZZZ) so ref <-> coords conversion
+# is a dict/list lookup instead of letter-by-letter arithmetic.
+MAX_LABEL_COLUMNS = 18278
+
+
+def _build_column_labels(count: int) -> List[str]:
+    labels = []
+    for col in range(count):
+        label = ''
+        n = col
+        while True:
+            label = chr(65 + n % 26) + label
+            n = n // 26 - 1
+            if n < 0:
+                break
+        labels.append(label)
+    return labels
+
+
+COLUMN_LABELS: List[str] = _build_column_labels(MAX_LABEL_COLUMNS)
+COLUMN_INDEX: Dict[str, int] = {label: i for i, label in enumerate(COLUMN_LABELS)}
+
+_CELL_REF_RE = re.compile(r'([A-Z]{1,3})([1-9][0-9]*)$')
+# Cell ref plus the leading value spec (t/v, vt, vtf/vtc); the rest is the style tail
+_CELL_LINE_RE = re.compile(
+    r'cell:([A-Z]{1,3}[1-9][0-9]*)(?=:|$)'
+    r'(?::(?:(t|v):([^:]*)|vt:([^:]*):([^:]*)|(vtf|vtc):([^:]*):([^:]*):([^:]*)))?'
+    r'(.*)',
+    re.S,
+)
+_STYLE_FAMILIES = ('font', 'color', 'border', 'layout', 'cellformat', 'valueformat')
+_STYLE_DEF_RE = re.compile(r'(font|color|border|layout|cellformat|valueformat):(\d+):(.*)$', re.S)
+
+# Number of values following each cell attribute key in a savestr cell line
+_CELL_ATTR_ARITY = {
+    'v': 1, 't': 1, 'vt': 2, 'vtf': 3, 'vtc': 3, 'e': 1,
+    'b': 4, 'l': 1, 'f': 1, 'c': 1, 'bg': 1, 'cf': 1,
+    'ntvf': 1, 'tvf': 1, 'colspan': 1, 'rowspan': 1,
+    'cssc': 1, 'csss': 1, 'mod': 1, 'comment': 1,
+}
+
+# Single-value attributes stored as style-table indices / span counts
+_INT_CELL_ATTRS = {
+    'f': 'font', 'c': 'color', 'bg': 'bgcolor', 'cf': 'cellformat', 'l': 'layout',
+    'ntvf': 'nontextvalueformat', 'tvf': 'textvalueformat',
+    'colspan': 'colspan', 'rowspan': 'rowspan',
+}
+_TEXT_CELL_ATTRS = {'e': 'error', 'cssc': 'cssc', 'csss': 'csss', 'comment': 'comment'}
+
+# Savestrs larger than this are read line by line instead of split up front
+STREAM_THRESHOLD = 1 << 20
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Cell ref lookups are memoized; capped so hostile input cannot grow it forever
+_REF_CACHE: Dict[str, Tuple[int, int]] = {}
+_REF_CACHE_LIMIT = 65536
+_TAIL_CACHE: Dict[str, Tuple[Optional[Dict[str, str]], 'MSCStyle']] = {}
+_TAIL_CACHE_LIMIT = 16384
+
+
+def decode_value(value: str) -> str:
+    """Undo SocialCalc save encoding (\\c -> ':', \\n -> newline, \\b -> backslash)"""
+    if '\\' not in value:
+        return value
+    return value.replace('\\c', ':').replace('\\n', '\n').replace('\\b', '\\')
+
+
+def column_label(col: int) -> str:
+    """Convert a 0-indexed column number to its letter label (0 -> 'A')"""
+    if col < MAX_LABEL_COLUMNS:
+        return COLUMN_LABELS[col]
+    return _build_column_labels(col + 1)[col]
+
+
+def coords_to_cell_ref(col: int, row: int) -> str:
+    """Convert 0-indexed (col, row) coordinates to a cell reference like 'A1'"""
+    return f"{column_label(col)}{row + 1}"
+
+
+def cell_ref_to_coords(cell_ref: str) -> Optional[Tuple[int, int]]:
+    """Convert a cell reference like 'A1' to 0-indexed (col, row), or None if invalid"""
+    coords = _REF_CACHE.get(cell_ref)
+    if coords is not None:
+        return coords
+
+    match = _CELL_REF_RE.match(cell_ref)
+    if not match:
+        return None
+
+    coords = (COLUMN_INDEX[match.group(1)], int(match.group(2)) - 1)
+    if len(_REF_CACHE) < _REF_CACHE_LIMIT:
+        _REF_CACHE[cell_ref] = coords
+    return coords
+
+
+class MSCStyle:
+    """
+    Interned formatting record shared by every cell with the same attributes
+
+    Styles are immutable and deduplicated process-wide, so identity comparison
+    is equality and a sheet with thousands of cells holds only a handful.
+    """
+
+    __slots__ = (
+        'font', 'color', 'bgcolor', 'cellformat', 'layout', 'borders',
+        'nontextvalueformat', 'textvalueformat', 'colspan', 'rowspan',
+        'cssc', 'csss', 'comment', 'error', 'extra', 'key',
+    )
+
+    def __init__(self, font: int = 0, color: int = 0, bgcolor: int = 0, cellformat: int = 0,
+                 layout: int = 0, borders: Optional[Tuple[int, int, int, int]] = None,
+                 nontextvalueformat: int = 0, textvalueformat: int = 0,
+                 colspan: int = 1, rowspan: int = 1, cssc: str = '', csss: str = '',
+                 comment: str = '', error: str = '', extra: Optional[Dict[str, str]] = None):
+        self.font = font
+        self.color = color
+        self.bgcolor = bgcolor
+        self.cellformat = cellformat
+        self.layout = layout
+        self.borders = borders  # top, right, bottom, left border indices
+        self.nontextvalueformat = nontextvalueformat
+        self.textvalueformat = textvalueformat
+        self.colspan = colspan
+        self.rowspan = rowspan
+        self.cssc = cssc
+        self.csss = csss
+        self.comment = comment
+        self.error = error
+        self.extra = extra  # Unrecognised attributes, kept verbatim
+        self.key = (font, color, bgcolor, cellformat, layout, borders,
+                    nontextvalueformat, textvalueformat, colspan, rowspan,
+                    cssc, csss, comment, error,
+                    tuple(sorted(extra.items())) if extra else None)
+
+    def __repr__(self) -> str:
+        return f"MSCStyle(f={self.font}, c={self.color}, bg={self.bgcolor}, cf={self.cellformat}, l={self.layout})"
+
+
+DEFAULT_STYLE = MSCStyle()
+_STYLE_INTERN: Dict[tuple, MSCStyle] = {DEFAULT_STYLE.key: DEFAULT_STYLE}
+
+
+def intern_style(**attrs) -> MSCStyle:
+    """Return the shared MSCStyle instance for the given attributes"""
+    style = MSCStyle(**attrs)
+    return _STYLE_INTERN.setdefault(style.key, style)
+
+
+def _style_attr(name: str) -> property:
+    return property(lambda cell: getattr(cell.style, name), doc=f"Style attribute `{name}`")
+
+
+class MSCCell:
+    """
+    A single cell from a savestr `cell:` line
+
+    Cells only carry position and value; formatting lives in an interned
+    MSCStyle and is exposed through read-only attributes (cell.font etc).
+    """
+
+    __slots__ = ('ref', 'col', 'row', 'datatype', 'valuetype', 'value', 'formula', 'style')
+
+    def __init__(self, ref: str, col: int, row: int, style: MSCStyle = DEFAULT_STYLE):
+        self.ref = ref
+        self.col = col
+        self.row = row
+        self.datatype = ''      # t=text, v=value, f=formula, c=constant
+        self.valuetype = ''     # SocialCalc value type, e.g. 't', 'n', 'nd'
+        self.value = ''         # Decoded data value
+        self.formula = ''
+        self.style = style
+
+    font = _style_attr('font')
+    color = _style_attr('color')
+    bgcolor = _style_attr('bgcolor')
+    cellformat = _style_attr('cellformat')
+    layout = _style_attr('layout')
+    borders = _style_attr('borders')
+    nontextvalueformat = _style_attr('nontextvalueformat')
+    textvalueformat = _style_attr('textvalueformat')
+    colspan = _style_attr('colspan')
+    rowspan = _style_attr('rowspan')
+    cssc = _style_attr('cssc')
+    csss = _style_attr('csss')
+    comment = _style_attr('comment')
+    error = _style_attr('error')
+    extra = _style_attr('extra')
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.valuetype[:1] == 'n'
+
+    def __repr__(self) -> str:
+        return f"MSCCell({self.ref}, {self.datatype or '-'}:{self.value!r})"
+
+
+class MSCSheet:
+    """Parsed SocialCalc sheet: cells plus the indexed style tables they refer to"""
+
+    def __init__(self):
+        self.version = ''
+        self.cells: Dict[str, MSCCell] = {}
+        self.fonts: Dict[int, str] = {}
+        self.colors: Dict[int, str] = {}
+        self.borders: Dict[int, str] = {}
+        self.layouts: Dict[int, str] = {}
+        self.cellformats: Dict[int, str] = {}
+        self.valueformats: Dict[int, str] = {}
+        self.col_widths: Dict[int, str] = {}
+        self.row_heights: Dict[int, str] = {}
+        self.hidden_cols: set = set()
+        self.hidden_rows: set = set()
+        self.attribs: Dict[str, str] = {}
+        self.declared_cols = 0  # From the `sheet:c:..:r:..` header
+        self.declared_rows = 0
+        self.max_col = 0        # Used extent (column count) from cell lines
+        self.max_row = 0        # Used extent (row count) from cell lines
+
+    @property
+    def num_cols(self) -> int:
+        return max(self.declared_cols, self.max_col)
+
+    @property
+    def num_rows(self) -> int:
+        return max(self.declared_rows, self.max_row)
+
+    def style_index(self) -> Dict[MSCStyle, int]:
+        """Distinct styles used by this sheet, numbered in first-use order"""
+        index: Dict[MSCStyle, int] = {}
+        for cell in self.cells.values():
+            if cell.style not in index:
+                index[cell.style] = len(index)
+        return index
+
+    def cell_at(self, col: int, row: int) -> Optional[MSCCell]:
+        return self.cells.get(coords_to_cell_ref(col, row))
+
+    def color_of(self, index: int) -> str:
+        """Resolve a color index to its CSS value ('' if unset)"""
+        return self.colors.get(index, '') if index else ''
+
+    def font_of(self, index: int) -> str:
+        """Resolve a font index to its CSS shorthand ('' if unset)"""
+        return self.fonts.get(index, '') if index else ''
+
+    def is_bold(self, cell: MSCCell) -> bool:
+        font = self.font_of(cell.font or int(self.attribs.get('font', 0) or 0))
+        return ' bold ' in f' {font} '
+
+    def is_italic(self, cell: MSCCell) -> bool:
+        font = self.font_of(cell.font or int(self.attribs.get('font', 0) or 0))
+        return font.startswith('italic')
+
+
+def _to_int(value: str, default: int = 0) -> int:
+    return int(value) if value.isdigit() else default
+
+
+def _parse_cell_attrs(parts: List[str]) -> Dict[str, Any]:
+    """Parse `key:value...` cell attribute tokens into MSCCell attribute values"""
+    attrs: Dict[str, Any] = {}
+    n = len(parts)
+    i = 0
+    while i < n:
+        key = parts[i]
+
+        attr = _INT_CELL_ATTRS.get(key)
+        if attr is not None:
+            if i + 1 < n and parts[i + 1].isdigit():
+                attrs[attr] = int(parts[i + 1])
+            i += 2
+            continue
+
+        arity = _CELL_ATTR_ARITY.get(key, 1)
+        args = parts[i + 1:i + 1 + arity]
+        i += 1 + arity
+        if len(args) < arity:
+            args += [''] * (arity - len(args))
+
+        if key == 't':
+            attrs.update(datatype='t', valuetype='t', value=decode_value(args[0]))
+        elif key == 'v':
+            attrs.update(datatype='v', valuetype='n', value=decode_value(args[0]))
+        elif key == 'b':
+            attrs['borders'] = (
+                _to_int(args[0]), _to_int(args[1]),
+                _to_int(args[2]), _to_int(args[3]),
+            )
+        elif key == 'vt':
+            attrs.update(datatype='v' if args[0][:1] == 'n' else 't',
+                         valuetype=args[0], value=decode_value(args[1]))
+        elif key == 'vtf' or key == 'vtc':
+            attrs.update(datatype='f' if key == 'vtf' else 'c', valuetype=args[0],
+                         value=decode_value(args[1]), formula=decode_value(args[2]))
+        elif key in _TEXT_CELL_ATTRS:
+            attrs[_TEXT_CELL_ATTRS[key]] = decode_value(args[0])
+        elif key:
+            attrs.setdefault('extra', {})[key] = decode_value(args[0])
+
+    return attrs
+
+
+_VALUE_ATTRS = ('datatype', 'valuetype', 'value', 'formula')
+
+
+def _cell_tail(tail: str) -> Tuple[Optional[Dict[str, str]], MSCStyle]:
+    """
+    Parse the attribute tail of a cell line (everything after the value)
+
+    Returns (value attributes or None, interned style). Templates repeat the
+    same style tails (`:f:1:cf:3:l:1:ntvf:1:bg:4`) across whole rows and
+    columns, so parsed tails are memoized.
+    """
+    parsed = _TAIL_CACHE.get(tail)
+    if parsed is None:
+        attrs = _parse_cell_attrs(tail[1:].split(':'))
+        values = {name: attrs.pop(name) for name in _VALUE_ATTRS if name in attrs} or None
+        parsed = (values, intern_style(**attrs))
+        if len(_TAIL_CACHE) < _TAIL_CACHE_LIMIT:
+            _TAIL_CACHE[tail] = parsed
+    return parsed
+
+
+def _parse_pairs(parts: List[str], start: int) -> Dict[str, str]:
+    return {parts[i]: parts[i + 1] for i in range(start, len(parts) - 1, 2)}
+
+
+class StyleDef(NamedTuple):
+    """`font:`, `color:`, `border:`, `layout:`, `cellformat:` or `valueformat:` line"""
+    family: str
+    index: int
+    value: str
+
+
+class ColDef(NamedTuple):
+    """`col:` line, e.g. col:B:w:350:hide:no"""
+    col: int
+    attrs: Dict[str, str]
+
+
+class RowDef(NamedTuple):
+    """`row:` line, e.g. row:2:h:40"""
+    row: int
+    attrs: Dict[str, str]
+
+
+class SheetDef(NamedTuple):
+    """`sheet:` header line"""
+    attribs: Dict[str, str]
+
+
+class VersionDef(NamedTuple):
+    version: str
+
+
+MSCRecord = Union[MSCCell, StyleDef, ColDef, RowDef, SheetDef, VersionDef]
+
+
+def _iter_str_lines(msc_data: str) -> Iterator[str]:
+    if len(msc_data) < STREAM_THRESHOLD:
+        yield from msc_data.split('\n')
+        return
+
+    # Large savestrs (embedded SVG logos etc) are walked in place so only one
+    # line copy is alive at a time instead of a full list of them
+    find = msc_data.find
+    start = 0
+    while True:
+        end = find('\n', start)
+        if end < 0:
+            yield msc_data[start:]
+            return
+        yield msc_data[start:end]
+        start = end + 1
+
+
+def _iter_stream_lines(stream: Union[IO, Iterable[bytes]]) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    if hasattr(stream, 'read'):
+        chunks = iter(lambda: stream.read(STREAM_CHUNK_SIZE), b'')
+    else:
+        chunks = stream
+
+    pending = ''
+    for chunk in chunks:
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if not text:
+            continue
+        lines = (pending + text).split('\n')
+        pending = lines.pop()
+        yield from lines
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def iter_msc_lines(source: Union[str, bytes, IO, Iterable[bytes]]) -> Iterator[str]:
+    """
+    Yield savestr lines (without line terminators) from a string, bytes, or a
+    byte stream such as an S3 StreamingBody / open file / iterable of chunks
+    """
+    if isinstance(source, bytes):
+        source = source.decode('utf-8')
+    lines = _iter_str_lines(source) if isinstance(source, str) else _iter_stream_lines(source)
+    for line in lines:
+        if line[-1:] == '\r':
+            line = line[:-1]
+        yield line
+
+
+def iter_msc_records(source: Union[str, bytes, IO, Iterable[bytes]]) -> Iterator[MSCRecord]:
+    """
+    Stream typed records from a savestr without materializing the whole sheet
+
+    Yields MSCCell for `cell:` lines and StyleDef / ColDef / RowDef /
+    SheetDef / VersionDef for the others; unknown lines are skipped.
+
+    Args:
+        source: savestr as str/bytes, or a byte stream (file object, S3 body,
+                iterable of byte chunks)
+    """
+    # Hot loop: cell lines dominate savestrs, so they are handled inline with
+    # locals bound up front rather than through a helper call per line.
+    cell_match = _CELL_LINE_RE.match
+    ref_cache_get = _REF_CACHE.get
+    tail_cache_get = _TAIL_CACHE.get
+
+    for line in iter_msc_lines(source):
+        if line[:5] == 'cell:':
+            match = cell_match(line)
+            if match is None:
+                continue
+            ref, kind, value, vt_type, vt_value, fkind, f_type, f_value, formula, tail = match.groups()
+            col, row = ref_cache_get(ref) or cell_ref_to_coords(ref)
+            cell = MSCCell(ref, col, row)
+
+            if kind is not None:
+                cell.datatype = kind
+                cell.valuetype = 't' if kind == 't' else 'n'
+                cell.value = decode_value(value) if '\\' in value else value
+            elif vt_type is not None:
+                cell.datatype = 'v' if vt_type[:1] == 'n' else 't'
+                cell.valuetype = vt_type
+                cell.value = decode_value(vt_value)
+            elif fkind is not None:
+                cell.datatype = 'f' if fkind == 'vtf' else 'c'
+                cell.valuetype = f_type
+                cell.value = decode_value(f_value)
+                cell.formula = decode_value(formula)
+
+            if tail:
+                values, cell.style = tail_cache_get(tail) or _cell_tail(tail)
+                if values is not None:
+                    for name, attr_value in values.items():
+                        setattr(cell, name, attr_value)
+
+            yield cell
+            continue
+
+        kind, _, rest = line.partition(':')
+
+        if kind == 'col':
+            parts = line.split(':')
+            col = COLUMN_INDEX.get(parts[1]) if len(parts) > 1 else None
+            if col is not None:
+                yield ColDef(col, _parse_pairs(parts, 2))
+
+        elif kind == 'row':
+            parts = line.split(':')
+            if len(parts) > 1 and parts[1].isdigit():
+                yield RowDef(int(parts[1]) - 1, _parse_pairs(parts, 2))
+
+        elif kind == 'sheet':
+            yield SheetDef(_parse_pairs(line.split(':'), 1))
+
+        elif kind == 'version':
+            yield VersionDef(rest)
+
+        elif kind in _STYLE_FAMILIES:
+            match = _STYLE_DEF_RE.match(line)
+            if match:
+                value = match.group(3)
+                if kind == 'valueformat':
+                    value = decode_value(value)
+                yield StyleDef(kind, int(match.group(2)), value)
+
+
+def parse_msc(source: Union[str, bytes, IO, Iterable[bytes]]) -> MSCSheet:
+    """
+    Parse a SocialCalc savestr into an MSCSheet in a single pass
+
+    Args:
+        source: SocialCalc MSC format string, or a byte stream (see iter_msc_records)
+
+    Returns:
+        MSCSheet with cells, style tables, col/row sizes and sheet dimensions
+    """
+    sheet = MSCSheet()
+    cells = sheet.cells
+    style_tables = {
+        'font': sheet.fonts, 'color': sheet.colors, 'border': sheet.borders,
+        'layout': sheet.layouts, 'cellformat': sheet.cellformats,
+        'valueformat': sheet.valueformats,
+    }
+    max_col = 0
+    max_row = 0
+
+    for record in iter_msc_records(source):
+        if type(record) is MSCCell:
+            cells[record.ref] = record
+            if record.col >= max_col:
+                max_col = record.col + 1
+            if record.row >= max_row:
+                max_row = record.row + 1
+
+        elif type(record) is StyleDef:
+            style_tables[record.family][record.index] = record.value
+
+        elif type(record) is ColDef:
+            if 'w' in record.attrs:
+                sheet.col_widths[record.col] = record.attrs['w']
+            if record.attrs.get('hide') == 'yes':
+                sheet.hidden_cols.add(record.col)
+
+        elif type(record) is RowDef:
+            if 'h' in record.attrs:
+                sheet.row_heights[record.row] = record.attrs['h']
+            if record.attrs.get('hide') == 'yes':
+                sheet.hidden_rows.add(record.row)
+
+        elif type(record) is SheetDef:
+            sheet.attribs = record.attribs
+            if sheet.attribs.get('c', '').isdigit():
+                sheet.declared_cols = int(sheet.attribs['c'])
+            if sheet.attribs.get('r', '').isdigit():
+                sheet.declared_rows = int(sheet.attribs['r'])
+
+        elif type(record) is VersionDef:
+            sheet.version = record.version
+
+    sheet.max_col = max_col
+    sheet.max_row = max_row
+    return sheet
+
+
+def extract_savestr(sheet_data: str) -> str:
+    """
+    Return the MSC savestr from request sheet data
+
+    Accepts either a raw savestr or a JSON workbook ({"sheetArr": ...}); for
+    workbooks the current sheet is used, falling back to the first sheet.
+    """
+    if not sheet_data.lstrip().startswith('{'):
+        return sheet_data
+
+    try:
+        workbook_data = json.loads(sheet_data)
+        sheet_arr = workbook_data['sheetArr']
+        current_id = workbook_data.get('currentid', 'sheet1')
+        if current_id in sheet_arr:
+            return sheet_arr[current_id]['sheetstr']['savestr']
+        return list(sheet_arr.values())[0]['sheetstr']['savestr']
+    except (json.JSONDecodeError, KeyError, IndexError, TypeError):
+        # Not a workbook - treat as raw MSC
+        return sheet_data
+
+
+class WorkbookSheet(NamedTuple):
+    """One sheet of a workbook: its sheetArr id, display name and savestr"""
+    id: str
+    name: str
+    savestr: str
+    hidden: bool
+
+
+def extract_workbook_sheets(sheet_data: str) -> List[WorkbookSheet]:
+    """
+    Return every sheet of request sheet data, in workbook order
+
+    Raw savestrs (and anything that is not a workbook) yield a single sheet.
+    """
+    if sheet_data.lstrip().startswith('{'):
+        try:
+            sheet_arr = json.loads(sheet_data)['sheetArr']
+            sheets = []
+            for sheet_id, entry in sheet_arr.items():
+                sheets.append(WorkbookSheet(
+                    id=sheet_id,
+                    name=entry.get('name') or sheet_id,
+                    savestr=entry['sheetstr']['savestr'],
+                    hidden=str(entry.get('hidden', '0')).lower() in ('1', 'yes', 'true'),
+                ))
+            if sheets:
+                return sheets
+        except (json.JSONDecodeError, KeyError, AttributeError, TypeError):
+            pass
+    return [WorkbookSheet(id='sheet1', name='sheet1', savestr=sheet_data, hidden=False)]
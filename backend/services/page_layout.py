@@ -0,0 +1,652 @@
+"""
+Page Layout
+Computes how a sheet falls onto pages without rendering it: column widths
+from `col:X:w`, row heights from `row:X:h` and the fonts in use, the paper
+and margin settings, the page breaks, the page count and the scale that
+fits the table to the page width (or to `fitPages` pages).
+
+The ReportLab renderer lays its tables out from this result, so the
+reported breaks are the ones the PDF gets. Text widths come from ReportLab's
+font metrics and are cached per string and font.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from functools import cached_property, lru_cache
+from typing import Dict, Any, List, NamedTuple, Optional, Set, Tuple
+
+from reportlab.lib.pagesizes import A4, LETTER, LEGAL, landscape, portrait
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from services.cell_style import StyleResolver, parse_length, PX
+from services.formula_engine import get_engine
+from services.msc_parser import MSCSheet, MSCCell, DEFAULT_STYLE
+from services.sheet_grid import SparseGrid
+from services.value_format import cell_display_text
+
+DEFAULT_COL_WIDTH = 80  # px, SocialCalc's default when neither col nor sheet sets one
+LINE_HEIGHT = 1.2       # leading as a multiple of the font size
+FRAME_PADDING = 12      # points SimpleDocTemplate's frame reserves vertically
+DEFAULT_MARGIN = 20     # mm
+
+# Sheets with at least this many rows are rendered in page-sized LongTable chunks
+LARGE_SHEET_ROWS = int(os.environ.get('PDF_LARGE_SHEET_ROWS', 300))
+# fitPages never shrinks the table below this scale
+MIN_FIT_SCALE = float(os.environ.get('LAYOUT_MIN_FIT_SCALE', 0.1))
+STRING_WIDTH_CACHE_SIZE = int(os.environ.get('STRING_WIDTH_CACHE_SIZE', 65536))
+# Sheets whose measurements are kept between layouts
+LAYOUT_METRICS_CACHE_SIZE = int(os.environ.get('LAYOUT_METRICS_CACHE_SIZE', 16))
+FIT_ITERATIONS = 24
+
+# Paper size mappings (width, height in points)
+PAPER_SIZES = {
+    'a4': A4,
+    'letter': LETTER,
+    'legal': LEGAL
+}
+
+LAYOUT_ENGINES = ('pdf', 'html')
+
+Page = Tuple[List[int], List[int]]  # (repeated header rows, rows) of one page
+
+
+class PageGeometry(NamedTuple):
+    """Page size and margins (top, right, bottom, left) in points"""
+    page_width: float
+    page_height: float
+    margins: Tuple[float, float, float, float]
+
+    @property
+    def frame_width(self) -> float:
+        return self.page_width - self.margins[1] - self.margins[3]
+
+    @property
+    def frame_height(self) -> float:
+        return self.page_height - self.margins[0] - self.margins[2]
+
+
+def page_geometry(settings: Dict[str, Any]) -> PageGeometry:
+    """Page geometry for the paperSize, orientation and margins (mm) settings"""
+    paper_size = PAPER_SIZES.get(settings.get('paperSize', 'a4'), A4)
+    if settings.get('orientation', 'portrait') == 'landscape':
+        paper_size = landscape(paper_size)
+    else:
+        paper_size = portrait(paper_size)
+
+    margins = settings.get('margins') or {}
+    return PageGeometry(paper_size[0], paper_size[1], tuple(
+        margins.get(side, DEFAULT_MARGIN) * mm for side in ('top', 'right', 'bottom', 'left')))
+
+
+def document_geometry(doc) -> PageGeometry:
+    """Page geometry of a ReportLab document template"""
+    return PageGeometry(doc.pagesize[0], doc.pagesize[1],
+                        (doc.topMargin, doc.rightMargin, doc.bottomMargin, doc.leftMargin))
+
+
+@lru_cache(maxsize=STRING_WIDTH_CACHE_SIZE)
+def _string_width(text: str, font_name: str) -> float:
+    return stringWidth(text, font_name, 1)
+
+
+def text_width(text: str, font_name: str, font_size: float) -> float:
+    """Width in points of the widest line of `text`"""
+    return max(_string_width(line, font_name) for line in text.split('\n')) * font_size
+
+
+def header_rows_from_mapping(app_mapping: Any) -> List[int]:
+    """
+    Header rows of the table items in an app mapping (1-based)
+
+    A table item's `rows.start` is its first data row; the row above it
+    holds the column headings.
+    """
+    rows = set()
+    stack = [app_mapping]
+    while stack:
+        item = stack.pop()
+        if not isinstance(item, dict):
+            continue
+        if item.get('type') == 'table' and isinstance(item.get('rows'), dict):
+            try:
+                start = int(item['rows'].get('start', 0))
+            except (TypeError, ValueError):
+                start = 0
+            if start > 1:
+                rows.add(start - 1)
+        stack.extend(value for value in item.values() if isinstance(value, dict))
+    return sorted(rows)
+
+
+def is_large_sheet(grid: SparseGrid, settings: Dict[str, Any]) -> bool:
+    large = settings.get('largeSheet')
+    if large is None:
+        return grid.num_rows >= LARGE_SHEET_ROWS
+    return bool(large)
+
+
+def header_rows(grid: SparseGrid, settings: Dict[str, Any]) -> List[int]:
+    """
+    Sheet rows (0-based) to repeat at the top of each page of a chunked
+    sheet: settings headerRows, else the app mapping's table headers,
+    else the first row
+    """
+    rows = settings.get('headerRows')
+    if rows is None and settings.get('appMapping'):
+        rows = header_rows_from_mapping(settings['appMapping'])
+    if rows is None:
+        return [grid.first_row]
+    return sorted({int(row) - 1 for row in rows
+                   if int(row) - 1 in grid.row_range and int(row) - 1 not in grid.sheet.hidden_rows})
+
+
+def column_widths(grid: SparseGrid) -> List[float]:
+    """Natural column widths in points from `col:X:w` (hidden columns are 0)"""
+    sheet = grid.sheet
+    default = parse_length(sheet.attribs.get('w', '')) or DEFAULT_COL_WIDTH * PX
+    widths = []
+    for col in grid.col_range:
+        if col in sheet.hidden_cols:
+            widths.append(0.0)
+        else:
+            widths.append(parse_length(sheet.col_widths.get(col, '')) or default)
+    return widths
+
+
+def content_column_widths(grid: SparseGrid, table_data: List[List[str]],
+                          resolver: StyleResolver) -> List[float]:
+    """
+    Column widths of a table whose cells do not wrap (the HTML renderers):
+    the natural width, widened to the widest single-column cell text
+    """
+    widths = column_widths(grid)
+    first_row, first_col = grid.first_row, grid.first_col
+    for row, cells in grid.rows.items():
+        if row in grid.sheet.hidden_rows:
+            continue
+        row_values = table_data[row - first_row]
+        for col, cell in cells.items():
+            text = row_values[col - first_col]
+            if not text or cell.colspan > 1 or not widths[col - first_col]:
+                continue
+            style = resolver.resolve(cell)
+            needed = text_width(text, style.font_name, style.font_size) + style.padding[1] + style.padding[3]
+            if needed > widths[col - first_col]:
+                widths[col - first_col] = needed
+    return widths
+
+
+def row_heights(grid: SparseGrid, table_data: List[List[str]],
+                resolver: StyleResolver, measure_all: bool = False) -> List[Optional[float]]:
+    """
+    Row heights in points: None (automatic) unless the row sets `row:X:h`,
+    in which case the set height is used when it fits the content
+
+    With measure_all, automatic rows are measured too (one line of the
+    tallest font per line break, plus padding), so every height is known
+    up front.
+    """
+    sheet = grid.sheet
+    heights: List[Optional[float]] = []
+    if measure_all:
+        base = resolver.resolve_style(DEFAULT_STYLE)
+        min_height = base.font_size * LINE_HEIGHT + base.padding[0] + base.padding[2]
+    for row in grid.row_range:
+        if row in sheet.hidden_rows:
+            heights.append(0.0)
+            continue
+        height = parse_length(sheet.row_heights.get(row, ''))
+        if height:
+            height *= resolver.scale
+        elif measure_all:
+            height = min_height
+        else:
+            heights.append(None)
+            continue
+        row_values = table_data[row - grid.first_row]
+        for col, cell in grid.rows.get(row, {}).items():
+            if cell.rowspan > 1:
+                continue
+            style = resolver.resolve(cell)
+            lines = row_values[col - grid.first_col].count('\n') + 1
+            needed = lines * style.font_size * LINE_HEIGHT + style.padding[0] + style.padding[2]
+            if needed > height:
+                height = needed
+        heights.append(height)
+    return heights
+
+
+def visible_rows(grid: SparseGrid) -> Dict[int, List[MSCCell]]:
+    """Rendered cells (not hidden, not covered by a merged cell) by sheet row"""
+    sheet = grid.sheet
+    covered = set()
+    for row, row_cells in grid.rows.items():
+        for col, cell in row_cells.items():
+            if cell.colspan > 1 or cell.rowspan > 1:
+                covered.update((c, r) for c in range(col, col + cell.colspan)
+                               for r in range(row, row + cell.rowspan) if (c, r) != (col, row))
+
+    hidden_rows, hidden_cols = sheet.hidden_rows, sheet.hidden_cols
+    return {row: [cell for col, cell in row_cells.items()
+                  if col not in hidden_cols and (col, row) not in covered]
+            for row, row_cells in grid.rows.items() if row not in hidden_rows}
+
+
+def table_row_heights(grid: SparseGrid, table_data: List[List[str]], resolver: StyleResolver,
+                      visible: Dict[int, List[MSCCell]]) -> List[float]:
+    """
+    Row heights a single ReportLab Table gives the sheet: automatic rows
+    are as tall as their tallest cell, except that merges spanning several
+    rows do not size any one row; their content is spread evenly over the
+    automatic rows they cover when those are not tall enough already
+    """
+    fixed = row_heights(grid, table_data, resolver)
+    first_row, first_col = grid.first_row, grid.first_col
+    last_row = first_row + grid.num_rows - 1
+    last_col = first_col + grid.num_cols - 1
+    base = resolver.resolve_style(DEFAULT_STYLE)
+    base_height = base.font_size * LINE_HEIGHT + base.padding[0] + base.padding[2]
+
+    def cell_height(cell: MSCCell) -> float:
+        style = resolver.resolve(cell)
+        lines = table_data[cell.row - first_row][cell.col - first_col].count('\n') + 1
+        return lines * style.font_size * LINE_HEIGHT + style.padding[0] + style.padding[2]
+
+    row_spanned: Dict[int, Set[int]] = {}  # columns inside merges that span rows
+    for row, cells in visible.items():
+        for cell in cells:
+            end_row = min(row + cell.rowspan - 1, last_row)
+            if end_row > row:
+                columns = range(cell.col, min(cell.col + cell.colspan - 1, last_col) + 1)
+                for spanned_row in range(row, end_row + 1):
+                    row_spanned.setdefault(spanned_row, set()).update(columns)
+
+    heights: List[float] = []
+    spans: Dict[Tuple[int, int], float] = {}
+    for row in grid.row_range:
+        height = fixed[row - first_row]
+        if height is not None:
+            heights.append(height)
+            continue
+        spanned = row_spanned.get(row, ())
+        cells = visible.get(row, ())
+        height = base_height if grid.num_cols - len(spanned) > sum(
+            1 for cell in cells if cell.col not in spanned) else 0.0
+        for cell in cells:
+            if cell.col not in spanned:
+                height = max(height, cell_height(cell))
+            elif cell.rowspan > 1:
+                key = (row - first_row, min(row + cell.rowspan - 1, last_row) - first_row)
+                spans[key] = max(spans.get(key, 0.0), cell_height(cell))
+        heights.append(height)
+
+    # Largest merges first, as ReportLab assigns them
+    for needed, (start, end) in sorted(((needed, key) for key, needed in spans.items()), reverse=True):
+        short = needed - sum(heights[start:end + 1])
+        grow = [index for index in range(start, end + 1) if fixed[index] is None]
+        if short > 1e-6 and grow:
+            for index in grow:
+                heights[index] += short / len(grow)
+    return heights
+
+
+def fit_width_scale(natural_width: float, available_width: float, settings: Dict[str, Any]) -> float:
+    """
+    Scale factor for the table: fitToPage fits the width exactly, otherwise
+    the `scale` percentage, reduced when the table would overflow the page
+    """
+    if natural_width <= 0:
+        return 1.0
+    if settings.get('fitToPage', False):
+        return available_width / natural_width
+    scale = settings.get('scale', 100) / 100.0
+    return min(scale, available_width / natural_width)
+
+
+def span_interior_rows(visible: Dict[int, List[MSCCell]]) -> Set[int]:
+    """Rows covered by a merge from a row above (a page cannot start on them)"""
+    rows = set()
+    for row, cells in visible.items():
+        for cell in cells:
+            if cell.rowspan > 1:
+                rows.update(range(row + 1, row + cell.rowspan))
+    return rows
+
+
+def paginate(heights: List[float], rows: List[int], first_row: int, header_rows: List[int],
+             budget: float, unsplittable: Set[int] = frozenset()) -> List[Page]:
+    """
+    Pack rows into pages greedily
+
+    Every page after the header rows have been passed starts with a copy of
+    them. A page does not start on an unsplittable row unless the page
+    would otherwise hold nothing.
+
+    Args:
+        heights: Row heights in points, indexed by sheet row - first_row
+        rows: Sheet rows in order
+        first_row: Sheet row of heights[0]
+        header_rows: Sheet rows repeated on the following pages
+        budget: Usable height of a page in points
+
+    Returns:
+        [(repeated header rows, rows)] per page
+    """
+    pages: List[Page] = []
+    i = 0
+    while i < len(rows):
+        prefix = [row for row in header_rows if row < rows[i]]
+        room = budget - sum(heights[row - first_row] for row in prefix)
+        start = i
+        split = None
+        used = 0.0
+        while i < len(rows) and (i == start or used + heights[rows[i] - first_row] <= room):
+            used += heights[rows[i] - first_row]
+            i += 1
+            if i < len(rows) and rows[i] not in unsplittable:
+                split = i
+        if i < len(rows) and rows[i] in unsplittable and split is not None:
+            i = split
+        pages.append((prefix, rows[start:i]))
+    return pages
+
+
+def table_text(grid: SparseGrid, visible: Dict[int, List[MSCCell]]) -> List[List[str]]:
+    """
+    Display text of the used area, one list per row
+
+    Formulas are recalculated and every value is rendered through its
+    value format. Cells covered by a merge and cells in hidden rows or
+    columns are left blank.
+    """
+    sheet = grid.sheet
+    values = get_engine(sheet).values
+    first_row, first_col = grid.first_row, grid.first_col
+    table = [[''] * grid.num_cols for _ in range(grid.num_rows)]
+    for row, cells in visible.items():
+        row_values = table[row - first_row]
+        for cell in cells:
+            row_values[cell.col - first_col] = cell_display_text(sheet, cell, values.get(cell.ref))
+    return table
+
+
+class SheetMetrics:
+    """
+    Everything about a sheet's layout that does not depend on the settings,
+    measured at scale 1 when first needed: the grid, display text, column
+    widths and row heights
+
+    Heights and widths scale linearly, so a layout for new settings only
+    repaginates. The sheet must not be mutated while its metrics are cached.
+    """
+
+    def __init__(self, sheet: MSCSheet):
+        self.sheet = sheet
+        self.grid = SparseGrid(sheet)
+        self.visible = visible_rows(self.grid)
+        self.table_data = table_text(self.grid, self.visible)
+        self.is_empty = not any(any(cell for cell in row) for row in self.table_data)
+        self.resolver = StyleResolver(sheet)
+
+    @cached_property
+    def natural_widths(self) -> List[float]:
+        return column_widths(self.grid)
+
+    @cached_property
+    def content_widths(self) -> List[float]:
+        return content_column_widths(self.grid, self.table_data, self.resolver)
+
+    @cached_property
+    def chunk_heights(self) -> List[float]:
+        """Heights given to the LongTable chunks of large sheets"""
+        return row_heights(self.grid, self.table_data, self.resolver, measure_all=True)
+
+    @cached_property
+    def table_heights(self) -> List[float]:
+        """Heights ReportLab gives a single Table"""
+        return table_row_heights(self.grid, self.table_data, self.resolver, self.visible)
+
+    @cached_property
+    def auto_rows(self) -> Set[int]:
+        """Visible rows without `row:X:h`"""
+        sheet = self.sheet
+        return {row for row in self.grid.row_range
+                if row not in sheet.hidden_rows and not parse_length(sheet.row_heights.get(row, ''))}
+
+    @cached_property
+    def span_rows(self) -> Set[int]:
+        return span_interior_rows(self.visible)
+
+    @cached_property
+    def overflow_cells(self) -> int:
+        """Cells whose text is wider than their (merged) column and is cut off"""
+        grid, widths = self.grid, self.natural_widths
+        first_row, first_col = grid.first_row, grid.first_col
+        count = 0
+        for row, cells in self.visible.items():
+            row_values = self.table_data[row - first_row]
+            for cell in cells:
+                text = row_values[cell.col - first_col]
+                width = sum(widths[cell.col - first_col:cell.col - first_col + cell.colspan])
+                if not text or not width:
+                    continue
+                style = self.resolver.resolve(cell)
+                if text_width(text, style.font_name, style.font_size) + style.padding[1] + style.padding[3] > width:
+                    count += 1
+        return count
+
+
+_metrics: 'OrderedDict[int, SheetMetrics]' = OrderedDict()
+_metrics_lock = threading.Lock()
+
+
+def sheet_metrics(sheet: MSCSheet) -> SheetMetrics:
+    """
+    Metrics of a parsed sheet, kept for the LAYOUT_METRICS_CACHE_SIZE most
+    recently laid out sheets (raises SheetTooLargeError)
+    """
+    with _metrics_lock:
+        metrics = _metrics.get(id(sheet))
+        if metrics is not None and metrics.sheet is sheet:
+            _metrics.move_to_end(id(sheet))
+            return metrics
+    metrics = SheetMetrics(sheet)
+    with _metrics_lock:
+        _metrics[id(sheet)] = metrics
+        _metrics.move_to_end(id(sheet))
+        while len(_metrics) > LAYOUT_METRICS_CACHE_SIZE:
+            _metrics.popitem(last=False)
+    return metrics
+
+
+class PageLayout:
+    """
+    Where a sheet's rows and columns land on the page at the chosen scale
+
+    Attributes:
+        geometry: Page geometry
+        metrics: The sheet's metrics (None for sheets without data)
+        scale: Table scale factor (1.0 = the sheet's own sizes)
+        col_widths: Scaled column widths in points
+        row_heights: Scaled row heights in points (every row measured)
+        pages: [(repeated header rows, rows)] per page, sheet rows 0-based
+        chunked: Rendered as one LongTable per page (large sheets)
+        resolver: Style resolver at `scale`
+    """
+
+    def __init__(self, geometry: PageGeometry, metrics: Optional[SheetMetrics] = None,
+                 natural_widths: Tuple[float, ...] = (), unit_heights: Tuple[float, ...] = (),
+                 scale: float = 1.0, pages: Optional[List[Page]] = None, chunked: bool = False,
+                 fit_pages: Optional[int] = None):
+        self.geometry = geometry
+        self.metrics = metrics
+        self.scale = scale
+        self.pages = pages if pages is not None else []
+        self.chunked = chunked
+        self.fit_pages = fit_pages
+        self.col_widths = [width * scale for width in natural_widths]
+        self.row_heights = [height * scale for height in unit_heights]
+        self.resolver = StyleResolver(metrics.sheet, scale) if metrics is not None else None
+
+    @property
+    def is_empty(self) -> bool:
+        return self.metrics is None
+
+    @property
+    def page_count(self) -> int:
+        return max(1, len(self.pages))
+
+    def table_row_heights(self) -> List[Optional[float]]:
+        """Row heights for a single Table: None where ReportLab sizes the row itself"""
+        grid, auto_rows = self.metrics.grid, self.metrics.auto_rows
+        return [None if row in auto_rows else self.row_heights[row - grid.first_row]
+                for row in grid.row_range]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON summary: scale, page count and the sheet rows (1-based) on every page"""
+        geometry = self.geometry
+        pages = []
+        for prefix, rows in self.pages:
+            first_row = self.metrics.grid.first_row
+            pages.append({
+                'firstRow': rows[0] + 1,
+                'lastRow': rows[-1] + 1,
+                'repeatedRows': [row + 1 for row in prefix],
+                'height': round(sum(self.row_heights[row - first_row] for row in prefix + rows), 2),
+            })
+        return {
+            'pageCount': self.page_count,
+            'scale': round(self.scale * 100, 2),
+            'fitPages': self.fit_pages,
+            'fits': self.fit_pages is None or self.page_count <= self.fit_pages,
+            'page': {'width': round(geometry.page_width, 2), 'height': round(geometry.page_height, 2)},
+            'frame': {'width': round(geometry.frame_width, 2), 'height': round(geometry.frame_height, 2)},
+            'tableWidth': round(sum(self.col_widths), 2),
+            'columnWidths': [round(width, 2) for width in self.col_widths],
+            'chunked': self.chunked,
+            'overflowCells': self.metrics.overflow_cells if self.metrics is not None else 0,
+            'pages': pages,
+        }
+
+
+def compute_layout(sheet: MSCSheet, settings: Dict[str, Any], geometry: Optional[PageGeometry] = None,
+                   content_widths: bool = False) -> PageLayout:
+    """
+    Lay a sheet out on pages
+
+    Args:
+        sheet: Parsed sheet (not mutated afterwards; see SheetMetrics)
+        settings: PDF generation settings
+            - paperSize, orientation, margins: page geometry
+            - scale, fitToPage: as for PDF generation
+            - fitPages: shrink the table until it is at most this many pages
+              long (never enlarges it, never below MIN_FIT_SCALE)
+            - largeSheet, headerRows, appMapping: chunked rendering and its
+              repeated rows
+        geometry: Page geometry (from settings when omitted)
+        content_widths: Widen columns to their text, for renderers that do
+                        not wrap cells
+
+    Returns:
+        PageLayout (raises SheetTooLargeError for sheets over the limits)
+    """
+    metrics = sheet_metrics(sheet)
+    if geometry is None:
+        geometry = page_geometry(settings)
+    if metrics.is_empty:
+        return PageLayout(geometry)
+
+    grid = metrics.grid
+    natural_widths = metrics.content_widths if content_widths else metrics.natural_widths
+    chunked = is_large_sheet(grid, settings)
+    if chunked:
+        # Chunks get these heights; rows of a single Table are sized by ReportLab
+        unit_heights = metrics.chunk_heights
+        repeated, unsplittable = header_rows(grid, settings), frozenset()
+    else:
+        # A single Table repeats its first row and does not split merges
+        unit_heights = metrics.table_heights
+        repeated, unsplittable = [grid.first_row], metrics.span_rows
+    rows = list(grid.row_range)
+    budget = geometry.frame_height - FRAME_PADDING
+
+    def pages_at(scale: float) -> List[Page]:
+        return paginate([height * scale for height in unit_heights], rows, grid.first_row,
+                        repeated, budget, unsplittable)
+
+    scale = fit_width_scale(sum(natural_widths), geometry.frame_width, settings)
+    pages = pages_at(scale)
+    fit_pages = settings.get('fitPages')
+    fit_pages = max(1, int(fit_pages)) if fit_pages else None
+    if fit_pages and len(pages) > fit_pages and scale > MIN_FIT_SCALE:
+        # Heights shrink with the scale, so the page count only falls as it does
+        low, high = MIN_FIT_SCALE, scale
+        low_pages = pages_at(low)
+        if len(low_pages) <= fit_pages:
+            for _ in range(FIT_ITERATIONS):
+                middle = (low + high) / 2
+                middle_pages = pages_at(middle)
+                if len(middle_pages) <= fit_pages:
+                    low, low_pages = middle, middle_pages
+                else:
+                    high = middle
+        scale, pages = low, low_pages
+
+    return PageLayout(geometry, metrics, natural_widths, unit_heights, scale, pages, chunked, fit_pages)
+
+
+def get_page_layout(sheet_data: str, settings: Dict[str, Any], engine: str = 'pdf') -> Dict[str, Any]:
+    """
+    Page layout of SocialCalc data, computed without rendering
+
+    Args:
+        sheet_data: MSC format string or JSON workbook format
+        settings: PDF generation settings (see compute_layout)
+        engine: 'pdf' for the ReportLab renderer, 'html' for the wkhtmltopdf
+                one (cells do not wrap, so columns widen to their text)
+
+    Returns:
+        Dictionary with success status and the layout (see PageLayout.to_dict)
+    """
+    if engine not in LAYOUT_ENGINES:
+        return {
+            'success': False,
+            'error': f"engine must be one of {', '.join(LAYOUT_ENGINES)}"
+        }
+    try:
+        import time
+        from services.msc_parser import extract_savestr
+        from services.sheet_cache import get_parsed_sheet
+
+        start = time.perf_counter()
+        layout = compute_layout(get_parsed_sheet(extract_savestr(sheet_data)), settings,
+                                content_widths=engine == 'html')
+        data = layout.to_dict()
+        data['engine'] = engine
+        data['layoutMs'] = round((time.perf_counter() - start) * 1000, 2)
+        return {'success': True, 'data': data}
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {
+            'success': False,
+            'error': f'Failed to compute page layout: {str(e)}'
+        }
+
+
+def html_layout_settings(sheet_data: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Settings for converting the HTML of `sheet_data` with fitToPage/fitPages
+    resolved to the explicit scale the layout chose
+    """
+    if not settings.get('fitToPage') and not settings.get('fitPages'):
+        return settings
+    from services.msc_parser import extract_savestr
+    from services.sheet_cache import get_parsed_sheet
+    layout = compute_layout(get_parsed_sheet(extract_savestr(sheet_data)), settings, content_widths=True)
+    if layout.is_empty:
+        return settings
+    return {**settings, 'fitToPage': False, 'scale': round(layout.scale * 100, 2)}
@@ -0,0 +1,196 @@
+"""
+Rendered PDF Cache
+Disk-backed, content-addressed cache of finished PDFs. Entries are keyed by a
+hash of everything that affects the output (table HTML and page options), so
+re-downloading the same invoice skips wkhtmltopdf entirely. The cache is
+bounded by a byte budget (least recently used entries are evicted first) and
+a TTL.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+DEFAULT_CACHE_DIR = os.environ.get('PDF_CACHE_DIR') or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'tmp', 'pdf-cache')
+DEFAULT_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+DEFAULT_TTL = float(os.environ.get('PDF_CACHE_TTL', 24 * 3600))
+
+
+def content_key(*parts: Any) -> str:
+    """Content hash of JSON-serializable key parts"""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+
+class RenderedPDFCache:
+    """
+    Byte-budgeted LRU of PDF files on disk
+
+    The in-memory index (key -> (size, created)) is rebuilt from the directory
+    on start-up, oldest files first, so a restart keeps the warm cache. Files
+    are written atomically; a file written by another process is picked up
+    on lookup. `suffix` is the file extension of the cached artifacts.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL, suffix: str = '.pdf'):
+        self.cache_dir = cache_dir
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, tuple[int, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}{self.suffix}')
+
+    def _remove_file(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _load(self) -> None:
+        """Index existing cache files (caller holds the lock)"""
+        self._loaded = True
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return
+        found = []
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            found.append((st.st_mtime, name[:-len(self.suffix)], st.st_size))
+        for mtime, key, size in sorted(found):
+            self._entries[key] = (size, mtime)
+            self._bytes += size
+        self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until under budget (caller holds the lock)"""
+        while self._bytes > self.max_bytes and self._entries:
+            key, (size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            self._remove_file(key)
+
+    def _drop(self, key: str) -> None:
+        size, _ = self._entries.pop(key)
+        self._bytes -= size
+        self._remove_file(key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Cached PDF bytes for a key, or None on a miss or expired entry"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                # Another process may have rendered it since start-up
+                try:
+                    st = os.stat(self._path(key))
+                    entry = (st.st_size, st.st_mtime)
+                    self._entries[key] = entry
+                    self._bytes += entry[0]
+                    self._evict()
+                except OSError:
+                    self.misses += 1
+                    return None
+            if time.time() - entry[1] > self.ttl:
+                self._drop(key)
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+
+        try:
+            with open(self._path(key), 'rb') as f:
+                pdf_bytes = f.read()
+        except OSError:
+            pdf_bytes = b''
+        with self._lock:
+            if len(pdf_bytes) == entry[0]:
+                self.hits += 1
+                return pdf_bytes
+            # Evicted by another process or truncated: forget it
+            if key in self._entries:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, pdf_bytes: bytes) -> None:
+        """Store a rendered PDF; entries larger than the whole budget are not cached"""
+        size = len(pdf_bytes)
+        if not self.enabled or size > self.max_bytes:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(pdf_bytes)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[0]
+            self._entries[key] = (size, time.time())
+            self._bytes += size
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._remove_file(key)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expired': self.expired,
+                'hitRatio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Process-wide instance in front of the wkhtmltopdf renderers
+pdf_cache = RenderedPDFCache()
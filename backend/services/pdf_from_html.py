@@ -1,92 +1,118 @@
 """
 PDF Generator from HTML
-Converts SocialCalc HTML table to PDF using wkhtmltopdf (like invoice-editor)
+Converts SocialCalc HTML table to PDF using wkhtmltopdf (like invoice-editor).
+Conversions run on a pool of warm wkhtmltopdf workers (see html_pdf_pool);
+with the pool disabled, a one-shot process is fed through stdin/stdout pipes.
+Output is made deterministic and cached on disk by content (see pdf_cache).
 """
 
 import base64
-import os
-import random
-import string
+import hashlib
+import math
+import re
 import subprocess
-import tempfile
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
+from services.html_pdf_pool import (
+    WKHTMLTOPDF_BIN, JOB_TIMEOUT, RenderError, RendererBusyError, get_renderer_pool
+)
+from services.pdf_cache import pdf_cache, content_key
+from services.pdf_store import get_pdf_store
 
-def get_random_string(size: int = 20) -> str:
-    """Generate a random string for unique filenames"""
-    char_set = string.ascii_uppercase + string.digits
-    return ''.join(random.sample(char_set, size))
 
+# Paper size mappings for wkhtmltopdf
+PAPER_SIZES = {
+    'a3': 'A3', 'a4': 'A4', 'a5': 'A5',
+    'b4': 'B4', 'b5': 'B5',
+    'letter': 'Letter', 'legal': 'Legal', 'tabloid': 'Tabloid',
+    'statement': 'Statement', 'executive': 'Executive', 'folio': 'Folio'
+}
+ORIENTATIONS = frozenset({'portrait', 'landscape'})
 
-def generate_pdf_from_html(sheet_html: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+# Timestamps in the document info dictionary and the trailer /ID
+_PDF_DATE_RE = re.compile(rb'/(CreationDate|ModDate)\s*\((D:[^)]*)\)')
+_PDF_ID_RE = re.compile(rb'/ID\s*\[\s*<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>\s*\]')
+_FIXED_PDF_DATE = b'D:20000101000000'
+
+
+def extract_table_html(sheet_html: str) -> str:
+    """The <table> element from CreateSheetHTML() output, or the input unchanged"""
+    if '<table' in sheet_html:
+        table_start = sheet_html.find('<table')
+        table_end = sheet_html.find('</table>') + 8
+        if table_start >= 0 and table_end > table_start:
+            return sheet_html[table_start:table_end]
+    return sheet_html
+
+
+def html_pdf_cache_key(sheet_html: str, settings: Dict[str, Any]) -> str:
     """
-    Generate PDF from SocialCalc HTML using wkhtmltopdf
-    
-    Args:
-        sheet_html: HTML string from SocialCalc's CreateSheetHTML()
-        settings: PDF generation settings
-    
-    Returns:
-        Dictionary with success status and PDF data (base64 encoded)
+    Content key of a conversion: the extracted table plus every setting that
+    changes the output (page size, orientation, margins, scale, gridlines)
     """
-    try:
-        # Extract table from HTML if present
-        html_content = sheet_html
-        if '<table' in html_content:
-            # Extract table element
-            table_start = html_content.find('<table')
-            table_end = html_content.find('</table>') + 8
-            if table_start >= 0 and table_end > table_start:
-                table_html = html_content[table_start:table_end]
-            else:
-                table_html = html_content
-        else:
-            # If no table, use the full HTML content
-            table_html = html_content
-
-        # Paper size mappings for wkhtmltopdf
-        paper_sizes = {
-            'a3': 'A3',
-            'a4': 'A4',
-            'a5': 'A5',
-            'b4': 'B4',
-            'b5': 'B5',
-            'letter': 'Letter',
-            'legal': 'Legal',
-            'tabloid': 'Tabloid',
-            'statement': 'Statement',
-            'executive': 'Executive',
-            'folio': 'Folio'
-        }
+    return content_key(
+        extract_table_html(sheet_html),
+        wkhtmltopdf_options(settings),
+        bool(settings.get('includeGridlines', True)),
+        settings.get('scale', 100),
+        bool(settings.get('fitToPage', False)),
+    )
 
-        # Get margins from settings
-        margins = settings.get('margins', {'top': 20, 'right': 20, 'bottom': 20, 'left': 20})
-        margin_top = margins.get('top', 20)
-        margin_right = margins.get('right', 20)
-        margin_bottom = margins.get('bottom', 20)
-        margin_left = margins.get('left', 20)
 
-        # Get paper size and orientation
-        paper_size = settings.get('paperSize', 'a4')
-        orientation = settings.get('orientation', 'portrait')
-        page_size = paper_sizes.get(paper_size.lower(), 'A4')
+def make_deterministic(pdf_bytes: bytes) -> bytes:
+    """
+    Replace the creation/modification dates and the document /ID with fixed
+    values so identical input renders to identical bytes
+
+    Replacements keep the original lengths, so xref offsets stay valid.
+    """
+    def fix_date(match):
+        stamp = match.group(2)
+        # Keep the timezone layout (e.g. +02'00') but zero its digits
+        fixed = _FIXED_PDF_DATE[:len(stamp)] + re.sub(rb'\d', b'0', stamp[len(_FIXED_PDF_DATE):])
+        return match.group(0).replace(stamp, fixed)
+
+    pdf_bytes = _PDF_DATE_RE.sub(fix_date, pdf_bytes)
+
+    match = _PDF_ID_RE.search(pdf_bytes)
+    if match:
+        # Derive the ID from the content (with the old ID blanked out)
+        blanked = pdf_bytes[:match.start()] + pdf_bytes[match.end():]
+        digest = hashlib.sha256(blanked).hexdigest().upper().encode('ascii')
+        ident = match.group(0)
+        for old in (match.group(1), match.group(2)):
+            ident = ident.replace(old, (digest * 4)[:len(old)])
+        pdf_bytes = pdf_bytes[:match.start()] + ident + pdf_bytes[match.end():]
+    return pdf_bytes
+
+
+def build_html_document(sheet_html: str, settings: Dict[str, Any]) -> str:
+    """
+    Wrap the table from SocialCalc's CreateSheetHTML() in a printable page
 
-        # Build CSS
-        include_gridlines = settings.get('includeGridlines', True)
-        scale = settings.get('scale', 100) / 100.0
-        fit_to_page = settings.get('fitToPage', False)
+    Args:
+        sheet_html: HTML string from SocialCalc's CreateSheetHTML()
+        settings: PDF generation settings (gridlines, scale, fitToPage)
+    """
+    table_html = extract_table_html(sheet_html)
 
-        # CSS styling for gridlines
-        gridline_css = ""
-        if include_gridlines:
-            gridline_css = "td, th { border: 1px solid #e0e0e0; }"
+    include_gridlines = settings.get('includeGridlines', True)
+    scale = settings.get('scale', 100) / 100.0
+    fit_to_page = settings.get('fitToPage', False)
 
-        # CSS transform for scaling
-        zoom_css = ""
-        if not fit_to_page and scale != 1.0:
-            zoom_css = f"table {{ transform: scale({scale}); transform-origin: top left; }}"
+    # CSS styling - preserve original SocialCalc borders
+    # When includeGridlines is True: add light gray background grid
+    # When False: don't add border CSS, let original borders show
+    gridline_css = ""
+    if include_gridlines:
+        gridline_css = "td, th { border: 1px solid #e0e0e0; }"
 
-        css_content = f"""
+    # CSS transform for scaling
+    zoom_css = ""
+    if not fit_to_page and scale != 1.0:
+        zoom_css = f"table {{ transform: scale({scale}); transform-origin: top left; }}"
+
+    css_content = f"""
             * {{ box-sizing: border-box; }}
             body {{ margin: 0; padding: 0; font-family: Arial, sans-serif; }}
             table {{ border-collapse: collapse; width: {'100%' if fit_to_page else 'auto'}; table-layout: auto; }}
@@ -95,8 +121,7 @@ def generate_pdf_from_html(sheet_html: str, settings: Dict[str, Any]) -> Dict[st
             {gridline_css}
         """
 
-        # Build complete HTML
-        complete_html = f"""
+    return f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -109,64 +134,134 @@ def generate_pdf_from_html(sheet_html: str, settings: Dict[str, Any]) -> Dict[st
 </html>
 """
 
-        # Create temporary files for HTML input and PDF output
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            fname = get_random_string(20)
-            html_file = os.path.join(tmp_dir, f"{fname}.html")
-            pdf_file = os.path.join(tmp_dir, f"{fname}.pdf")
-
-            # Write HTML to temp file
-            with open(html_file, 'w', encoding='utf-8') as f:
-                f.write(complete_html)
-
-            cmd = [
-                'wkhtmltopdf',
-                '--quiet',
-                '--enable-local-file-access',
-                '--page-size', page_size,
-                '--orientation', orientation.capitalize(),
-                '--margin-top', f'{margin_top}mm',
-                '--margin-right', f'{margin_right}mm',
-                '--margin-bottom', f'{margin_bottom}mm',
-                '--margin-left', f'{margin_left}mm',
-                '--encoding', 'UTF-8',
-            ]
-
-            # Add input and output files
-            cmd.extend([html_file, pdf_file])
-
-            # Run wkhtmltopdf
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=60  # 60 second timeout
-            )
-
-            # Check if PDF was created successfully
-            if not os.path.exists(pdf_file):
-                error_msg = result.stderr if result.stderr else 'PDF generation failed'
-                return {
-                    'success': False,
-                    'error': f'wkhtmltopdf failed: {error_msg}'
-                }
 
-            # Read PDF and convert to base64
-            with open(pdf_file, 'rb') as f:
-                pdf_bytes = f.read()
+def wkhtmltopdf_options(settings: Dict[str, Any]) -> List[str]:
+    """
+    Page size, orientation and margin options for one conversion
 
-            pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+    Raises:
+        ValueError: orientation is not portrait/landscape or a margin is not a number
+    """
+    paper_size = str(settings.get('paperSize', 'a4'))
+    orientation = str(settings.get('orientation', 'portrait')).lower()
+    margins = settings.get('margins') or {}
+
+    if not isinstance(margins, dict):
+        raise ValueError('margins must be an object of top/right/bottom/left')
+    if orientation not in ORIENTATIONS:
+        raise ValueError(f"orientation must be one of {', '.join(sorted(ORIENTATIONS))}")
+    millimetres = {}
+    for side in ('top', 'right', 'bottom', 'left'):
+        value = float(margins.get(side, 20))
+        if not math.isfinite(value):
+            raise ValueError(f'margins.{side} must be a finite number')
+        millimetres[side] = f'{value:g}mm'
+
+    return [
+        '--page-size', PAPER_SIZES.get(paper_size.lower(), 'A4'),
+        '--orientation', orientation.capitalize(),
+        '--margin-top', millimetres['top'],
+        '--margin-right', millimetres['right'],
+        '--margin-bottom', millimetres['bottom'],
+        '--margin-left', millimetres['left'],
+    ]
+
+
+def render_html_pdf(complete_html: str, options: List[str], timeout: float = JOB_TIMEOUT) -> bytes:
+    """
+    Convert an HTML document to PDF bytes
 
-            # Generate filename
-            filename = f"spreadsheet_{paper_size}_{orientation}.pdf"
+    Uses the warm renderer pool when enabled (HTML_PDF_POOL_SIZE > 0),
+    otherwise a single wkhtmltopdf process reading stdin and writing stdout.
 
-            return {
-                'success': True,
-                'data': {
-                    'pdf': pdf_base64,
-                    'filename': filename
-                }
+    Raises:
+        subprocess.TimeoutExpired, FileNotFoundError, RenderError, RendererBusyError
+    """
+    pool = get_renderer_pool()
+    if pool is not None:
+        return make_deterministic(pool.render(complete_html, options, timeout=timeout))
+
+    cmd = [WKHTMLTOPDF_BIN, '--quiet', '--enable-local-file-access', '--encoding', 'UTF-8']
+    cmd.extend(options)
+    cmd.extend(['-', '-'])
+    result = subprocess.run(cmd, input=complete_html.encode('utf-8'), capture_output=True, timeout=timeout)
+    if not result.stdout.startswith(b'%PDF'):
+        raise RenderError(result.stderr.decode('utf-8', 'replace').strip() or 'PDF generation failed')
+    return make_deterministic(result.stdout)
+
+
+def render_sheet_html_pdf(sheet_html: str, settings: Dict[str, Any]) -> Tuple[bytes, bool]:
+    """
+    PDF bytes for CreateSheetHTML() output, served from the rendered PDF cache
+    when the same table and settings were converted before
+
+    Returns:
+        (pdf_bytes, cache_hit)
+    """
+    key = html_pdf_cache_key(sheet_html, settings)
+    pdf_bytes = pdf_cache.get(key)
+    if pdf_bytes is not None:
+        return pdf_bytes, True
+
+    pdf_bytes = render_html_pdf(build_html_document(sheet_html, settings), wkhtmltopdf_options(settings))
+    try:
+        pdf_cache.put(key, pdf_bytes)
+    except OSError as e:
+        print(f"Error writing PDF cache entry: {str(e)}")
+    return pdf_bytes, False
+
+
+def render_document_pdf(document: str, settings: Dict[str, Any]) -> Tuple[bytes, bool]:
+    """
+    PDF bytes for a complete HTML document (no table extraction or page
+    CSS), served from the rendered PDF cache when converted before
+
+    Returns:
+        (pdf_bytes, cache_hit)
+    """
+    options = wkhtmltopdf_options(settings)
+    key = content_key('document', document, options)
+    pdf_bytes = pdf_cache.get(key)
+    if pdf_bytes is not None:
+        return pdf_bytes, True
+
+    pdf_bytes = render_html_pdf(document, options)
+    try:
+        pdf_cache.put(key, pdf_bytes)
+    except OSError as e:
+        print(f"Error writing PDF cache entry: {str(e)}")
+    return pdf_bytes, False
+
+
+def generate_pdf_from_html(sheet_html: str, settings: Dict[str, Any], raw: bool = False) -> Dict[str, Any]:
+    """
+    Generate PDF from SocialCalc HTML using wkhtmltopdf
+    
+    Args:
+        sheet_html: HTML string from SocialCalc's CreateSheetHTML()
+        settings: PDF generation settings
+        raw: Return the PDF as bytes instead of base64
+    
+    Returns:
+        Dictionary with success status and PDF data (base64 encoded)
+    """
+    try:
+        paper_size = settings.get('paperSize', 'a4')
+        orientation = settings.get('orientation', 'portrait')
+
+        pdf_bytes, cached = render_sheet_html_pdf(sheet_html, settings)
+
+        # Generate filename
+        filename = f"spreadsheet_{paper_size}_{orientation}.pdf"
+
+        return {
+            'success': True,
+            'data': {
+                'pdf': pdf_bytes if raw else base64.b64encode(pdf_bytes).decode('utf-8'),
+                'filename': filename,
+                'cached': cached
             }
+        }
 
     except subprocess.TimeoutExpired:
         return {
@@ -178,6 +273,21 @@ def generate_pdf_from_html(sheet_html: str, settings: Dict[str, Any]) -> Dict[st
             'success': False,
             'error': 'wkhtmltopdf not found. Please install it: sudo apt install wkhtmltopdf'
         }
+    except RendererBusyError as e:
+        return {
+            'success': False,
+            'error': f'PDF renderer busy: {str(e)}'
+        }
+    except RenderError as e:
+        return {
+            'success': False,
+            'error': f'wkhtmltopdf failed: {str(e)}'
+        }
+    except ValueError as e:
+        return {
+            'success': False,
+            'error': f'Invalid PDF settings: {str(e)}'
+        }
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -191,7 +301,9 @@ def generate_pdf_from_html_with_storage(
     sheet_html: str, 
     settings: Dict[str, Any],
     action: str = None,
-    base_path: str = None
+    base_path: str = None,
+    raw: bool = False,
+    metadata: Dict[str, Any] = None
 ) -> Dict[str, Any]:
     """
     Generate PDF from HTML and optionally store on disk (like invoice-editor)
@@ -200,148 +312,33 @@ def generate_pdf_from_html_with_storage(
         sheet_html: HTML string from SocialCalc's CreateSheetHTML()
         settings: PDF generation settings
         action: Optional action type ('preview', 'send', or None)
-        base_path: Base path for storing PDFs on disk
+        base_path: Base path for storing PDFs on disk (default: the shared store)
+        raw: Return the PDF as bytes instead of base64
+        metadata: Optional metadata stored next to the PDF (used for 'send')
     
     Returns:
         Dictionary with success status, PDF data, and file path
     """
     try:
-        # Extract table from HTML if present
-        html_content = sheet_html
-        if '<table' in html_content:
-            table_start = html_content.find('<table')
-            table_end = html_content.find('</table>') + 8
-            if table_start >= 0 and table_end > table_start:
-                table_html = html_content[table_start:table_end]
-            else:
-                table_html = html_content
-        else:
-            table_html = html_content
-
-        # Paper size mappings
-        paper_sizes = {
-            'a3': 'A3', 'a4': 'A4', 'a5': 'A5',
-            'b4': 'B4', 'b5': 'B5',
-            'letter': 'Letter', 'legal': 'Legal', 'tabloid': 'Tabloid',
-            'statement': 'Statement', 'executive': 'Executive', 'folio': 'Folio'
-        }
-
         paper_size = settings.get('paperSize', 'a4')
         orientation = settings.get('orientation', 'portrait')
-        page_size = paper_sizes.get(paper_size.lower(), 'A4')
-
-        margins = settings.get('margins', {'top': 20, 'right': 20, 'bottom': 20, 'left': 20})
-        include_gridlines = settings.get('includeGridlines', True)
-        scale = settings.get('scale', 100) / 100.0
-        fit_to_page = settings.get('fitToPage', False)
-
-        # CSS styling - preserve original SocialCalc borders
-        # When includeGridlines is True: add light gray background grid
-        # When False: don't add border CSS, let original borders show
-        gridline_css = ""
-        if include_gridlines:
-            gridline_css = "td, th { border: 1px solid #e0e0e0; }"
-        
-        zoom_css = ""
-        if not fit_to_page and scale != 1.0:
-            zoom_css = f"table {{ transform: scale({scale}); transform-origin: top left; }}"
-
-        # Get margins
-        margin_top = margins.get('top', 20)
-        margin_right = margins.get('right', 20)
-        margin_bottom = margins.get('bottom', 20)
-        margin_left = margins.get('left', 20)
-
-        css_content = f"""
-            * {{ box-sizing: border-box; }}
-            body {{ margin: 0; padding: 0; font-family: Arial, sans-serif; }}
-            table {{ border-collapse: collapse; width: {'100%' if fit_to_page else 'auto'}; table-layout: auto; }}
-            {zoom_css}
-            td, th {{ padding: 2px 4px; vertical-align: middle; white-space: nowrap; }}
-            {gridline_css}
-        """
 
-        complete_html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>{css_content}</style>
-</head>
-<body>
-    {table_html}
-</body>
-</html>
-"""
+        # Render in memory (or take it from the cache); only the finished PDF
+        # is written to storage
+        pdf_bytes, cached = render_sheet_html_pdf(sheet_html, settings)
+        fname, pdf_file = get_pdf_store(base_path).save(pdf_bytes, action, metadata)
 
-        # Determine storage path
-        if base_path is None:
-            base_path = os.path.join(os.path.dirname(__file__), 'tmp')
-        
-        if action == 'preview':
-            storage_path = os.path.join(base_path, 'preview')
-        else:
-            storage_path = base_path
-
-        # Ensure directory exists
-        os.makedirs(storage_path, exist_ok=True)
-
-        # Generate unique filename
-        while True:
-            fname = get_random_string(20)
-            full_path = os.path.join(storage_path, fname)
-            if not os.path.exists(f"{full_path}.pdf"):
-                break
-
-        html_file = f"{full_path}.html"
-        pdf_file = f"{full_path}.pdf"
-
-        # Write HTML
-        with open(html_file, 'w', encoding='utf-8') as f:
-            f.write(complete_html)
-
-        # Build wkhtmltopdf command
-        cmd = [
-            'wkhtmltopdf', '--quiet', '--enable-local-file-access',
-            '--page-size', page_size,
-            '--orientation', orientation.capitalize(),
-            '--margin-top', f'{margin_top}mm',
-            '--margin-right', f'{margin_right}mm',
-            '--margin-bottom', f'{margin_bottom}mm',
-            '--margin-left', f'{margin_left}mm',
-            '--encoding', 'UTF-8',
-        ]
-
-        cmd.extend([html_file, pdf_file])
-
-        # Run wkhtmltopdf
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-
-        if not os.path.exists(pdf_file):
-            return {
-                'success': False,
-                'error': f'wkhtmltopdf failed: {result.stderr or "Unknown error"}'
-            }
-
-        # Read PDF for base64 response
-        with open(pdf_file, 'rb') as f:
-            pdf_bytes = f.read()
-
-        pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
         filename = f"spreadsheet_{paper_size}_{orientation}.pdf"
 
-        # Clean up HTML file (keep PDF for retrieval)
-        if os.path.exists(html_file):
-            os.remove(html_file)
-
         return {
             'success': True,
             'data': {
-                'pdf': pdf_base64,
+                'pdf': pdf_bytes if raw else base64.b64encode(pdf_bytes).decode('utf-8'),
                 'filename': filename,
                 'filePath': pdf_file,
                 'fileId': fname,
-                'action': action
+                'action': action,
+                'cached': cached
             }
         }
 
@@ -349,12 +346,28 @@ def generate_pdf_from_html_with_storage(
         return {'success': False, 'error': 'PDF generation timed out'}
     except FileNotFoundError:
         return {'success': False, 'error': 'wkhtmltopdf not found. Please install it.'}
+    except RendererBusyError as e:
+        return {'success': False, 'error': f'PDF renderer busy: {str(e)}'}
+    except RenderError as e:
+        return {'success': False, 'error': f'wkhtmltopdf failed: {str(e)}'}
+    except ValueError as e:
+        return {'success': False, 'error': f'Invalid PDF settings: {str(e)}'}
     except Exception as e:
         import traceback
         traceback.print_exc()
         return {'success': False, 'error': f'Failed to generate PDF: {str(e)}'}
 
 
+def stored_pdf_path(file_id: str, action: str = None, base_path: str = None) -> Optional[str]:
+    """
+    Path of a stored PDF, or None if it does not exist
+
+    Raises:
+        ValueError: file_id is not a generated file ID (e.g. contains a path)
+    """
+    return get_pdf_store(base_path).path(file_id, action)
+
+
 def get_stored_pdf(file_id: str, action: str = None, base_path: str = None) -> Dict[str, Any]:
     """
     Retrieve a stored PDF by file ID (like invoice-editor GET endpoint)
@@ -368,17 +381,9 @@ def get_stored_pdf(file_id: str, action: str = None, base_path: str = None) -> D
         Dictionary with success status and PDF data
     """
     try:
-        if base_path is None:
-            base_path = os.path.join(os.path.dirname(__file__), 'tmp')
-
-        if action == 'preview':
-            storage_path = os.path.join(base_path, 'preview')
-        else:
-            storage_path = base_path
-
-        pdf_file = os.path.join(storage_path, f"{file_id}.pdf")
+        pdf_file = stored_pdf_path(file_id, action, base_path)
 
-        if os.path.exists(pdf_file):
+        if pdf_file:
             with open(pdf_file, 'rb') as f:
                 pdf_bytes = f.read()
             
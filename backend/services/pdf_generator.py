@@ -1,36 +1,87 @@
 """
 PDF Generator for SocialCalc Spreadsheets
 Converts SocialCalc MSC format to PDF with customizable settings
+
+Renders in-process with ReportLab: column widths, row heights, merged cells,
+fonts, colors, borders, padding, alignment and value formats come from the
+sheet's style model, so the output tracks the HTML/wkhtmltopdf path without
+starting an external process.
 """
 
-from reportlab.lib.pagesizes import A4, LETTER, LEGAL, landscape, portrait
-from reportlab.lib.units import mm
 from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, PageBreak, Flowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
 from io import BytesIO
 import base64
-import re
-from typing import Dict, Any, List, Tuple, Optional
+from functools import partial
+from typing import Dict, Any, List, Tuple, Optional, Callable
+
+from services.msc_parser import MSCSheet, MSCCell, DEFAULT_STYLE, extract_savestr, cell_ref_to_coords, coords_to_cell_ref
+from services.sheet_cache import get_parsed_sheet
+from services.sheet_grid import SparseGrid
+from services.style_compiler import TableStyleCompiler
+from services.cell_style import StyleResolver, CellStyle, Border
+from services.html_pdf_pool import RendererBusyError
+from services import page_layout
+from services.page_layout import (
+    PAPER_SIZES, LINE_HEIGHT, PageLayout, compute_layout, document_geometry
+)
+
+
+def _line_args(border: Border) -> tuple:
+    """TableStyle line arguments (weight, color[, cap, dash]) for a border"""
+    if border.dash:
+        return border.width, border.color, None, border.dash
+    return border.width, border.color
+
+
+class TableChunk(Flowable):
+    """
+    Page-sized slice of a large sheet
+
+    The LongTable is built when the chunk is first laid out and dropped once
+    drawn, so only one chunk's table structures are alive at a time.
+    """
+
+    def __init__(self, build: Callable[[], Table]):
+        Flowable.__init__(self)
+        self._build = build
+        self._table: Optional[Table] = None
+
+    def _get_table(self) -> Table:
+        if self._table is None:
+            self._table = self._build()
+        return self._table
+
+    def wrap(self, availWidth, availHeight):
+        self.width, self.height = self._get_table().wrap(availWidth, availHeight)
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        # Only reached when the chunk lands on a partly used page
+        return self._get_table().split(availWidth, availHeight)
+
+    def draw(self):
+        self._get_table().drawOn(self.canv, 0, 0)
+        self._table = None
 
 
 class SocialCalcPDFGenerator:
     """Generate PDF from SocialCalc spreadsheet data"""
 
     # Paper size mappings (width, height in points)
-    PAPER_SIZES = {
-        'a4': A4,
-        'letter': LETTER,
-        'legal': LEGAL
-    }
+    PAPER_SIZES = PAPER_SIZES
 
     def __init__(self):
         self.styles = getSampleStyleSheet()
 
-    def parse_msc_data(self, msc_data: str) -> Dict[str, Any]:
+    def parse_msc_data(self, msc_data: str) -> MSCSheet:
         """
-        Parse MSC format data into structured format
+        Parse MSC format data into the shared sheet model
+
+        Parsed sheets come from the process-wide cache, so repeat renders of
+        the same savestr skip parsing. The returned model must not be mutated.
 
         Format:
         version:1.5
@@ -38,239 +89,271 @@ class SocialCalcPDFGenerator:
         cell:B2:v:100
         sheet:c:5:r:10
         """
-        cells = {}
-        max_col = 0
-        max_row = 0
-
-        lines = msc_data.strip().split('\n')
-
-        for line in lines:
-            line = line.strip()
-            if line.startswith('cell:'):
-                # Parse cell definition
-                parts = line.split(':')
-                if len(parts) >= 4:
-                    cell_ref = parts[1]  # e.g., A1
-                    cell_type = parts[2]  # t=text, v=value, etc.
-                    cell_value = parts[3] if len(parts) > 3 else ''
-
-                    # Parse formatting if present
-                    format_info = {}
-                    for i in range(4, len(parts), 2):
-                        if i + 1 < len(parts):
-                            format_key = parts[i]
-                            format_val = parts[i + 1]
-                            format_info[format_key] = format_val
-
-                    # Convert cell reference to row/col
-                    col, row = self._cell_ref_to_coords(cell_ref)
-
-                    cells[cell_ref] = {
-                        'value': cell_value,
-                        'type': cell_type,
-                        'format': format_info,
-                        'row': row,
-                        'col': col
-                    }
-
-                    max_col = max(max_col, col)
-                    max_row = max(max_row, row)
-
-            elif line.startswith('sheet:'):
-                # Parse sheet dimensions
-                match = re.search(r'c:(\d+):r:(\d+)', line)
-                if match:
-                    max_col = max(max_col, int(match.group(1)))
-                    max_row = max(max_row, int(match.group(2)))
-
-        return {
-            'cells': cells,
-            'max_col': max_col,
-            'max_row': max_row
-        }
+        return get_parsed_sheet(msc_data)
 
     def _cell_ref_to_coords(self, cell_ref: str) -> Tuple[int, int]:
         """Convert cell reference like 'A1' to (col, row) coordinates (0-indexed)"""
-        match = re.match(r'([A-Z]+)(\d+)', cell_ref)
-        if not match:
-            return (0, 0)
+        return cell_ref_to_coords(cell_ref) or (0, 0)
 
-        col_str, row_str = match.groups()
+    def _coords_to_cell_ref(self, col: int, row: int) -> str:
+        """Convert (col, row) coordinates to cell reference like 'A1'"""
+        return coords_to_cell_ref(col, row)
 
-        # Convert column letters to number (A=0, B=1, ..., Z=25, AA=26, etc.)
-        col = 0
-        for char in col_str:
-            col = col * 26 + (ord(char) - ord('A'))
+    def build_grid(self, parsed_data: MSCSheet) -> SparseGrid:
+        """Index populated cells, trimmed to their bounding box (raises SheetTooLargeError)"""
+        return SparseGrid(parsed_data)
 
-        row = int(row_str) - 1  # Convert to 0-indexed
+    def create_table_data(self, grid: SparseGrid) -> List[List[str]]:
+        """
+        Create 2D table data covering only the used area
 
-        return (col, row)
+        Formulas are recalculated and every value is rendered through its
+        value format. Cells covered by a merge and cells in hidden rows or
+        columns are left blank.
+        """
+        return page_layout.table_text(grid, self.visible_rows(grid))
+
+    def visible_rows(self, grid: SparseGrid) -> Dict[int, List[MSCCell]]:
+        """Rendered cells (not hidden, not covered by a merged cell) by sheet row"""
+        return page_layout.visible_rows(grid)
+
+    def column_widths(self, grid: SparseGrid) -> List[float]:
+        """Natural column widths in points from `col:X:w` (hidden columns are 0)"""
+        return page_layout.column_widths(grid)
+
+    def row_heights(self, grid: SparseGrid, table_data: List[List[str]],
+                    resolver: StyleResolver, measure_all: bool = False) -> List[Optional[float]]:
+        """Row heights in points (see page_layout.row_heights)"""
+        return page_layout.row_heights(grid, table_data, resolver, measure_all)
+
+    def layout_scale(self, natural_width: float, available_width: float,
+                     settings: Dict[str, Any]) -> float:
+        """Scale factor that fits the table width (see page_layout.fit_width_scale)"""
+        return page_layout.fit_width_scale(natural_width, available_width, settings)
+
+    def apply_table_style(self, table: Table, grid: Optional[SparseGrid],
+                          settings: Dict[str, Any],
+                          resolver: Optional[StyleResolver] = None,
+                          rows: Optional[List[int]] = None,
+                          visible: Optional[Dict[int, List[MSCCell]]] = None) -> Dict[str, int]:
+        """
+        Apply styling to the table based on cell formatting and settings
+
+        Per-cell formatting is merged into rectangular ranges before the
+        TableStyle is built. Pass grid=None for placeholder tables that carry
+        no sheet cells.
+
+        Args:
+            table: Table built from the grid's table data
+            grid: Sheet grid, or None for a placeholder table
+            settings: PDF generation settings (includeGridlines)
+            resolver: Style resolver at the table's scale (unscaled by default)
+            rows: Sheet rows held by the table, in order (default: the whole grid)
+            visible: Precomputed visible_rows(grid)
+
+        Returns:
+            Style compiler stats (cell commands, compiled commands, saved)
+        """
+        if grid is not None and resolver is None:
+            resolver = StyleResolver(grid.sheet)
+        base = resolver.resolve_style(DEFAULT_STYLE) if resolver else CellStyle(
+            'Helvetica', 9, None, None, 'LEFT', 'MIDDLE', (3, 6, 3, 6), (None,) * 4)
 
-    def _coords_to_cell_ref(self, col: int, row: int) -> str:
-        """Convert (col, row) coordinates to cell reference like 'A1'"""
-        col_str = ''
-        col_num = col
-        while col_num >= 0:
-            col_str = chr(ord('A') + (col_num % 26)) + col_str
-            col_num = col_num // 26 - 1
-            if col_num < 0:
-                break
-
-        return f"{col_str}{row + 1}"
-
-    def create_table_data(self, parsed_data: Dict[str, Any]) -> List[List[str]]:
-        """Create 2D table data from parsed cells"""
-        cells = parsed_data['cells']
-        max_col = parsed_data['max_col']
-        max_row = parsed_data['max_row']
-
-        # Initialize empty table
-        table_data = [['' for _ in range(max_col + 1)] for _ in range(max_row + 1)]
-
-        # Fill in cell values
-        for cell_ref, cell_info in cells.items():
-            col = cell_info['col']
-            row = cell_info['row']
-            value = cell_info['value']
-
-            # Handle different cell types
-            if cell_info['type'] == 't':  # text
-                table_data[row][col] = str(value)
-            elif cell_info['type'] == 'v':  # value/number
-                table_data[row][col] = str(value)
-            elif cell_info['type'] == 'vt':  # value with text
-                table_data[row][col] = str(value)
-            else:
-                table_data[row][col] = str(value)
-
-        return table_data
-
-    def apply_table_style(self, table: Table, parsed_data: Dict[str, Any],
-                          settings: Dict[str, Any]) -> None:
-        """Apply styling to the table based on cell formatting and settings"""
         style_commands = [
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 3),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+            ('FONT', (0, 0), (-1, -1), base.font_name, base.font_size, base.font_size * LINE_HEIGHT),
+            ('ALIGN', (0, 0), (-1, -1), base.align),
+            ('VALIGN', (0, 0), (-1, -1), base.valign),
+            ('TEXTCOLOR', (0, 0), (-1, -1), base.color or colors.black),
+            ('TOPPADDING', (0, 0), (-1, -1), base.padding[0]),
+            ('RIGHTPADDING', (0, 0), (-1, -1), base.padding[1]),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), base.padding[2]),
+            ('LEFTPADDING', (0, 0), (-1, -1), base.padding[3]),
         ]
+        if base.background is not None:
+            style_commands.append(('BACKGROUND', (0, 0), (-1, -1), base.background))
 
         # Add gridlines if enabled
         if settings.get('includeGridlines', True):
             style_commands.append(('GRID', (0, 0), (-1, -1), 0.5, colors.grey))
 
-        # Apply cell-specific formatting
-        cells = parsed_data.get('cells', {})
-        for cell_ref, cell_info in cells.items():
-            col = cell_info['col']
-            row = cell_info['row']
-            format_info = cell_info.get('format', {})
-
-            # Apply bold formatting
-            if format_info.get('f') == '1':
-                style_commands.append(('FONTNAME', (col, row), (col, row), 'Helvetica-Bold'))
-
-            # Apply background color if specified
-            if 'bg' in format_info:
-                # Parse color (format: "rgb(r,g,b)")
-                color_match = re.match(r'rgb\((\d+),(\d+),(\d+)\)', format_info['bg'])
-                if color_match:
-                    r, g, b = map(int, color_match.groups())
-                    style_commands.append(
-                        ('BACKGROUND', (col, row), (col, row), colors.Color(r/255, g/255, b/255))
-                    )
-
+        # Apply cell-specific formatting (table row i holds sheet row rows[i])
+        compiler = TableStyleCompiler()
+        if grid is not None:
+            if rows is None:
+                rows = list(grid.row_range)
+            if visible is None:
+                visible = self.visible_rows(grid)
+            for row, sheet_row in enumerate(rows):
+                for cell in visible.get(sheet_row, ()):
+                    col = cell.col - grid.first_col
+                    style = resolver.resolve(cell)
+                    end_col = min(col + cell.colspan, grid.num_cols) - 1
+                    # Merges only extend over the following rows the table holds
+                    end_row = row
+                    while (end_row + 1 < len(rows) and end_row + 1 - row < cell.rowspan
+                           and rows[end_row + 1] == sheet_row + end_row + 1 - row):
+                        end_row += 1
+                    if end_col > col or end_row > row:
+                        style_commands.append(('SPAN', (col, row), (end_col, end_row)))
+
+                    if style.font_name != base.font_name or style.font_size != base.font_size:
+                        compiler.add('FONT', col, row, style.font_name, style.font_size,
+                                     style.font_size * LINE_HEIGHT)
+                    if style.color is not None and style.color != base.color:
+                        compiler.add('TEXTCOLOR', col, row, style.color)
+                    if style.background is not None and style.background != base.background:
+                        compiler.add('BACKGROUND', col, row, style.background)
+                    if style.align != base.align:
+                        compiler.add('ALIGN', col, row, style.align)
+                    if style.valign != base.valign:
+                        compiler.add('VALIGN', col, row, style.valign)
+                    for side, command in enumerate(('TOPPADDING', 'RIGHTPADDING',
+                                                    'BOTTOMPADDING', 'LEFTPADDING')):
+                        if style.padding[side] != base.padding[side]:
+                            compiler.add(command, col, row, style.padding[side])
+
+                    # Borders go on the outer edges of the (merged) cell
+                    top, right, bottom, left = style.borders
+                    for line_col in range(col, end_col + 1):
+                        if top:
+                            compiler.add('LINEABOVE', line_col, row, *_line_args(top))
+                        if bottom:
+                            compiler.add('LINEBELOW', line_col, end_row, *_line_args(bottom))
+                    for line_row in range(row, end_row + 1):
+                        if left:
+                            compiler.add('LINEBEFORE', col, line_row, *_line_args(left))
+                        if right:
+                            compiler.add('LINEAFTER', end_col, line_row, *_line_args(right))
+
+        style_commands.extend(compiler.compile())
         table.setStyle(TableStyle(style_commands))
+        return compiler.stats()
 
-    def generate_pdf(self, msc_data: str, settings: Dict[str, Any]) -> bytes:
+    def create_document(self, buffer: BytesIO, settings: Dict[str, Any]) -> SimpleDocTemplate:
         """
-        Generate PDF from MSC data with given settings
+        Create a document for the page size, orientation and margins in settings
 
         Args:
-            msc_data: SocialCalc MSC format string
+            buffer: Output buffer for the PDF
             settings: PDF generation settings
                 - orientation: 'portrait' or 'landscape'
                 - paperSize: 'a4', 'letter', or 'legal'
                 - margins: {'top': mm, 'right': mm, 'bottom': mm, 'left': mm}
+        """
+        geometry = page_layout.page_geometry(settings)
+        top, right, bottom, left = geometry.margins
+        return SimpleDocTemplate(
+            buffer,
+            pagesize=(geometry.page_width, geometry.page_height),
+            topMargin=top,
+            rightMargin=right,
+            bottomMargin=bottom,
+            leftMargin=left
+        )
+
+    def build_sheet_flowables(self, parsed_data: MSCSheet, doc: SimpleDocTemplate,
+                              settings: Dict[str, Any]) -> List[Any]:
+        """
+        Build the flowables for one sheet on the page frame of `doc`
+
+        Only reads `doc` page geometry, so several sheets can be built
+        concurrently for the same document.
+
+        Args:
+            parsed_data: Parsed sheet
+            doc: Document the flowables will be laid out in
+            settings: PDF generation settings
                 - scale: percentage (50-200)
                 - fitToPage: boolean
+                - fitPages: shrink the table to at most this many pages
                 - includeGridlines: boolean
-
-        Returns:
-            PDF file as bytes
+                - largeSheet: force (true) or disable (false) chunked rendering;
+                  by default sheets of page_layout.LARGE_SHEET_ROWS rows or more are chunked
+                - headerRows: sheet rows (1-based) repeated on every page of a
+                  chunked sheet; derived from `appMapping` when not given
         """
-        # Parse MSC data
-        parsed_data = self.parse_msc_data(msc_data)
+        # Table data of the used area and its measurements, shared with the page layout
+        metrics = page_layout.sheet_metrics(parsed_data)
+        grid, table_data = metrics.grid, metrics.table_data
 
-        # Get paper size
-        paper_size = self.PAPER_SIZES.get(settings.get('paperSize', 'a4'), A4)
+        if metrics.is_empty:
+            # Empty sheet - create placeholder
+            table = Table([['No data to display']], colWidths=[doc.width])
+            self.apply_table_style(table, None, settings)
+            return [table]
 
-        # Apply orientation
-        if settings.get('orientation', 'portrait') == 'landscape':
-            paper_size = landscape(paper_size)
-        else:
-            paper_size = portrait(paper_size)
+        # Column widths, row heights, scale and page breaks from one layout pass
+        layout = compute_layout(parsed_data, settings, document_geometry(doc))
+        if layout.chunked:
+            return self.build_chunked_flowables(layout, settings)
 
-        # Get margins (convert mm to points)
-        margins = settings.get('margins', {'top': 20, 'right': 20, 'bottom': 20, 'left': 20})
-        top_margin = margins.get('top', 20) * mm
-        right_margin = margins.get('right', 20) * mm
-        bottom_margin = margins.get('bottom', 20) * mm
-        left_margin = margins.get('left', 20) * mm
+        # Create table
+        table = Table(table_data, colWidths=layout.col_widths, rowHeights=layout.table_row_heights(),
+                      repeatRows=1)
 
-        # Create PDF buffer
-        buffer = BytesIO()
+        # Apply styling
+        self.apply_table_style(table, grid, settings, layout.resolver, visible=metrics.visible)
 
-        # Create document
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=paper_size,
-            topMargin=top_margin,
-            rightMargin=right_margin,
-            bottomMargin=bottom_margin,
-            leftMargin=left_margin
-        )
+        return [table]
 
-        # Create table data
-        table_data = self.create_table_data(parsed_data)
+    def is_large_sheet(self, grid: SparseGrid, settings: Dict[str, Any]) -> bool:
+        return page_layout.is_large_sheet(grid, settings)
 
-        if not table_data or not any(any(cell for cell in row) for row in table_data):
-            # Empty sheet - create placeholder
-            table_data = [['No data to display']]
+    def header_rows(self, grid: SparseGrid, settings: Dict[str, Any]) -> List[int]:
+        """Sheet rows (0-based) repeated on each page of a chunked sheet (see page_layout.header_rows)"""
+        return page_layout.header_rows(grid, settings)
 
-        # Calculate available width
-        available_width = paper_size[0] - left_margin - right_margin
-        available_height = paper_size[1] - top_margin - bottom_margin
+    def build_chunked_flowables(self, layout: PageLayout, settings: Dict[str, Any]) -> List[Any]:
+        """
+        Lay out a large sheet as one LongTable per page
 
-        # Calculate column widths
-        num_cols = len(table_data[0]) if table_data else 1
+        Every row height is measured up front and rows are packed into pages
+        by the layout; each page after the header rows have been passed
+        starts with a copy of them. Tables are built lazily (TableChunk), so
+        layout cost is linear in the row count and memory is bounded by one
+        page.
+        """
+        metrics = layout.metrics
+        flowables = []
+        for prefix, chunk in layout.pages:
+            if flowables:
+                flowables.append(PageBreak())
+            flowables.append(TableChunk(partial(
+                self._chunk_table, metrics.grid, metrics.table_data, prefix + chunk, len(prefix),
+                layout.col_widths, layout.row_heights, layout.resolver, metrics.visible, settings)))
+        return flowables
+
+    def _chunk_table(self, grid: SparseGrid, table_data: List[List[str]], rows: List[int],
+                     repeat_rows: int, col_widths: List[float], heights: List[float],
+                     resolver: StyleResolver, visible: Dict[int, List[MSCCell]],
+                     settings: Dict[str, Any]) -> LongTable:
+        first_row = grid.first_row
+        table = LongTable([table_data[row - first_row] for row in rows], colWidths=col_widths,
+                          rowHeights=[heights[row - first_row] for row in rows], repeatRows=repeat_rows)
+        self.apply_table_style(table, grid, settings, resolver, rows=rows, visible=visible)
+        return table
 
-        # Apply scale factor
-        scale = settings.get('scale', 100) / 100.0
-        if settings.get('fitToPage', False):
-            scale = 1.0
+    def generate_pdf(self, msc_data: str, settings: Dict[str, Any]) -> bytes:
+        """
+        Generate PDF from MSC data with given settings
 
-        # Calculate column widths (distribute evenly or fit to page)
-        if settings.get('fitToPage', False):
-            col_widths = [available_width / num_cols] * num_cols
-        else:
-            # Default column width with scale
-            default_col_width = 100 * scale
-            col_widths = [min(default_col_width, available_width / num_cols)] * num_cols
+        Args:
+            msc_data: SocialCalc MSC format string
+            settings: PDF generation settings (see create_document and
+                build_sheet_flowables)
 
-        # Create table
-        table = Table(table_data, colWidths=col_widths, repeatRows=1)
+        Returns:
+            PDF file as bytes
+        """
+        # Parse MSC data
+        parsed_data = self.parse_msc_data(msc_data)
 
-        # Apply styling
-        self.apply_table_style(table, parsed_data, settings)
+        # Create PDF buffer and document
+        buffer = BytesIO()
+        doc = self.create_document(buffer, settings)
 
         # Build PDF
-        elements = [table]
+        elements = self.build_sheet_flowables(parsed_data, doc, settings)
         doc.build(elements)
 
         # Get PDF bytes
@@ -285,41 +368,31 @@ class SocialCalcPDFGenerator:
         return base64.b64encode(pdf_bytes).decode('utf-8')
 
 
-def generate_pdf_from_socialcalc(sheet_data: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+def generate_pdf_from_socialcalc(sheet_data: str, settings: Dict[str, Any],
+                                 raw: bool = False) -> Dict[str, Any]:
     """
     Main function to generate PDF from SocialCalc data
 
     Args:
         sheet_data: MSC format string or JSON workbook format
         settings: PDF generation settings
+            - allSheets: render every sheet of a workbook into one PDF
+        raw: Return the PDF as bytes instead of base64
 
     Returns:
         Dictionary with success status and PDF data
     """
+    if settings.get('allSheets'):
+        from services.workbook_renderer import render_workbook_pdf
+        return render_workbook_pdf(sheet_data, settings, raw)
+
     try:
-        # Check if data is JSON format (workbook)
-        import json
-        try:
-            workbook_data = json.loads(sheet_data)
-            # Extract first sheet's savestr
-            if 'sheetArr' in workbook_data:
-                first_sheet_id = workbook_data.get('currentid', 'sheet1')
-                sheet_arr = workbook_data['sheetArr']
-                if first_sheet_id in sheet_arr:
-                    msc_data = sheet_arr[first_sheet_id]['sheetstr']['savestr']
-                else:
-                    # Get first available sheet
-                    first_sheet = list(sheet_arr.values())[0]
-                    msc_data = first_sheet['sheetstr']['savestr']
-            else:
-                raise ValueError('Invalid workbook format')
-        except (json.JSONDecodeError, KeyError, ValueError):
-            # Assume it's raw MSC format
-            msc_data = sheet_data
-
-        # Generate PDF
-        generator = SocialCalcPDFGenerator()
-        pdf_base64 = generator.generate_pdf_base64(msc_data, settings)
+        # Workbook JSON or raw MSC
+        msc_data = extract_savestr(sheet_data)
+
+        # Generate PDF in a render process (inline when the pool is disabled)
+        from services.render_executor import render_executor
+        pdf_bytes = render_executor.render_pdf(msc_data, settings)
 
         # Generate filename
         filename = f"spreadsheet_{settings.get('paperSize', 'a4')}_{settings.get('orientation', 'portrait')}.pdf"
@@ -327,11 +400,16 @@ def generate_pdf_from_socialcalc(sheet_data: str, settings: Dict[str, Any]) -> D
         return {
             'success': True,
             'data': {
-                'pdf': pdf_base64,
+                'pdf': pdf_bytes if raw else base64.b64encode(pdf_bytes).decode('utf-8'),
                 'filename': filename
             }
         }
 
+    except RendererBusyError as e:
+        return {
+            'success': False,
+            'error': f'PDF renderer busy: {str(e)}'
+        }
     except Exception as e:
         return {
             'success': False,
@@ -339,6 +417,22 @@ def generate_pdf_from_socialcalc(sheet_data: str, settings: Dict[str, Any]) -> D
         }
 
 
+def render_preview_png(parsed_data: MSCSheet, settings: Dict[str, Any]) -> bytes:
+    """
+    Rasterize the first page of a parsed sheet to a PNG preview
+
+    Args:
+        parsed_data: Parsed sheet
+        settings: Preview generation settings (see thumbnails.rasterize_sheet)
+            - width, height: image size in pixels
+
+    Returns:
+        PNG image as bytes
+    """
+    from services.thumbnails import rasterize_sheet
+    return rasterize_sheet(parsed_data, settings)
+
+
 def generate_preview_image(sheet_data: str, settings: Dict[str, Any]) -> Dict[str, Any]:
     """
     Generate a preview image (PNG) from SocialCalc data
@@ -346,114 +440,23 @@ def generate_preview_image(sheet_data: str, settings: Dict[str, Any]) -> Dict[st
     Args:
         sheet_data: MSC format string or JSON workbook format
         settings: Preview generation settings
+            - allSheets: preview every sheet of a workbook
+            - width, height: image size in pixels
         
     Returns:
         Dictionary with success status and preview image data
     """
+    if settings.get('allSheets'):
+        from services.workbook_renderer import render_workbook_previews
+        return render_workbook_previews(sheet_data, settings, 'image')
+
     try:
-        from reportlab.graphics import renderPM
-        from reportlab.graphics.shapes import Drawing, Rect, String, Group
-        from reportlab.lib.pagesizes import A4, LETTER, LEGAL, landscape, portrait
-        from reportlab.lib import colors as rl_colors
-        from io import BytesIO
-        
-        # Check if data is JSON format (workbook)
-        import json
-        try:
-            workbook_data = json.loads(sheet_data)
-            # Extract first sheet's savestr
-            if 'sheetArr' in workbook_data:
-                first_sheet_id = workbook_data.get('currentid', 'sheet1')
-                sheet_arr = workbook_data['sheetArr']
-                if first_sheet_id in sheet_arr:
-                    msc_data = sheet_arr[first_sheet_id]['sheetstr']['savestr']
-                else:
-                    # Get first available sheet
-                    first_sheet = list(sheet_arr.values())[0]
-                    msc_data = first_sheet['sheetstr']['savestr']
-            else:
-                raise ValueError('Invalid workbook format')
-        except (json.JSONDecodeError, KeyError, ValueError):
-            # Assume it's raw MSC format
-            msc_data = sheet_data
-        
-        # Parse MSC data
-        generator = SocialCalcPDFGenerator()
-        parsed_data = generator.parse_msc_data(msc_data)
-        
-        # Get paper size
-        paper_sizes = {'a4': A4, 'letter': LETTER, 'legal': LEGAL}
-        paper_size = paper_sizes.get(settings.get('paperSize', 'a4'), A4)
-        
-        # Apply orientation
-        if settings.get('orientation', 'portrait') == 'landscape':
-            paper_size = landscape(paper_size)
-        else:
-            paper_size = portrait(paper_size)
-        
-        # Create table data
-        table_data = generator.create_table_data(parsed_data)
-        
-        if not table_data or not any(any(cell for cell in row) for row in table_data):
-            table_data = [['No data to display']]
+        # Workbook JSON or raw MSC
+        msc_data = extract_savestr(sheet_data)
         
-        # Create drawing for preview (scaled down for preview)
-        preview_width = int(paper_size[0] * 0.5)  # 50% size for preview
-        preview_height = int(paper_size[1] * 0.5)
-        
-        drawing = Drawing(preview_width, preview_height)
-        
-        # Add white background
-        drawing.add(Rect(0, 0, preview_width, preview_height, fillColor=rl_colors.white, strokeColor=None))
-        
-        # Calculate table layout
-        num_rows = len(table_data)
-        num_cols = len(table_data[0]) if table_data else 0
-        
-        cell_width = preview_width / num_cols if num_cols > 0 else preview_width
-        cell_height = 20  # Fixed cell height for preview
-        
-        # Draw table
-        include_gridlines = settings.get('includeGridlines', True)
-        
-        y_pos = preview_height - 40  # Start from top with margin
-        
-        for row_idx, row in enumerate(table_data):
-            x_pos = 20  # Left margin
-            
-            for col_idx, cell_value in enumerate(row):
-                # Draw cell border if gridlines enabled
-                if include_gridlines:
-                    drawing.add(Rect(
-                        x_pos, y_pos - cell_height, 
-                        cell_width, cell_height,
-                        fillColor=None,
-                        strokeColor=rl_colors.grey,
-                        strokeWidth=0.5
-                    ))
-                
-                # Draw cell text
-                if cell_value:
-                    drawing.add(String(
-                        x_pos + 3, y_pos - cell_height + 5,
-                        str(cell_value),
-                        fontSize=8,
-                        fillColor=rl_colors.black
-                    ))
-                
-                x_pos += cell_width
-            
-            y_pos -= cell_height
-            
-            # Stop if we've filled the preview height
-            if y_pos < 20:
-                break
-        
-        # Render to PNG
-        buffer = BytesIO()
-        renderPM.drawToFile(drawing, buffer, fmt='PNG')
-        png_bytes = buffer.getvalue()
-        buffer.close()
+        # Cached thumbnail, or rasterize in a render process
+        from services.thumbnails import render_thumbnail
+        png_bytes = render_thumbnail(msc_data, settings)
         
         # Convert to base64
         preview_base64 = base64.b64encode(png_bytes).decode('utf-8')
@@ -465,6 +468,11 @@ def generate_preview_image(sheet_data: str, settings: Dict[str, Any]) -> Dict[st
             }
         }
         
+    except RendererBusyError as e:
+        return {
+            'success': False,
+            'error': f'Preview renderer busy: {str(e)}'
+        }
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -0,0 +1,271 @@
+"""
+Stored PDF Lifecycle
+On-disk store for PDFs served back by file ID (GET /api/htmltopdf).
+
+Files are sharded into subdirectories by the first characters of their ID so
+no directory grows large. A janitor thread sweeps the store periodically:
+previews expire quickly, sent files (those with .json metadata) are kept
+longer, and when the store exceeds its disk quota the oldest files are
+evicted first.
+"""
+
+import json
+import os
+import random
+import re
+import string
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+
+DEFAULT_STORE_DIR = os.environ.get('PDF_STORE_DIR') or os.path.join(os.path.dirname(__file__), 'tmp')
+PREVIEW_TTL = float(os.environ.get('PDF_STORE_PREVIEW_TTL', 3600))
+SEND_TTL = float(os.environ.get('PDF_STORE_SEND_TTL', 30 * 24 * 3600))
+DEFAULT_TTL = float(os.environ.get('PDF_STORE_TTL', 7 * 24 * 3600))
+MAX_BYTES = int(os.environ.get('PDF_STORE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+SWEEP_INTERVAL = float(os.environ.get('PDF_STORE_SWEEP_INTERVAL', 300))
+
+FILE_ID_LENGTH = 20
+SHARD_WIDTH = 2
+PREVIEW_DIR = 'preview'
+
+_FILE_ID_RE = re.compile(r'^[A-Za-z0-9]+$')
+
+
+def new_file_id(size: int = FILE_ID_LENGTH) -> str:
+    """Random file ID (uppercase letters and digits)"""
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=size))
+
+
+class PDFStore:
+    """
+    Sharded PDF store with TTL sweeps and a byte quota
+
+    Layout: <root>/<shard>/<id>.pdf for stored and sent files (sent files also
+    have <id>.json metadata) and <root>/preview/<shard>/<id>.pdf for previews.
+    Files written flat into <root> or <root>/preview by older versions are
+    still found and swept.
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR, max_bytes: int = MAX_BYTES,
+                 preview_ttl: float = PREVIEW_TTL, send_ttl: float = SEND_TTL,
+                 default_ttl: float = DEFAULT_TTL, sweep_interval: float = SWEEP_INTERVAL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.preview_ttl = preview_ttl
+        self.send_ttl = send_ttl
+        self.default_ttl = default_ttl
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._janitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # Running totals, corrected by every sweep
+        self._files = 0
+        self._bytes = 0
+        self.counters = {'stored': 0, 'expired': 0, 'evicted': 0, 'sweeps': 0}
+        self.last_sweep: Optional[Dict[str, Any]] = None
+
+    def _dir(self, action: str = None) -> str:
+        return os.path.join(self.root, PREVIEW_DIR) if action == 'preview' else self.root
+
+    def _shard_dir(self, file_id: str, action: str = None) -> str:
+        return os.path.join(self._dir(action), file_id[:SHARD_WIDTH])
+
+    def save(self, pdf_bytes: bytes, action: str = None,
+             metadata: Dict[str, Any] = None) -> Tuple[str, str]:
+        """
+        Write a PDF under a new file ID
+
+        Args:
+            pdf_bytes: PDF content
+            action: 'preview', 'send' or None; selects directory and TTL
+            metadata: Optional metadata written next to the PDF as <id>.json
+
+        Returns:
+            (file_id, pdf_path)
+        """
+        self.start_janitor()
+        while True:
+            file_id = new_file_id()
+            shard = self._shard_dir(file_id, action)
+            os.makedirs(shard, exist_ok=True)
+            pdf_file = os.path.join(shard, f'{file_id}.pdf')
+            # Exclusive create instead of probing with os.path.exists
+            try:
+                fd = os.open(pdf_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+                break
+            except FileExistsError:
+                continue
+
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_bytes)
+        size = len(pdf_bytes)
+
+        if metadata is not None:
+            json_file = os.path.join(shard, f'{file_id}.json')
+            with open(json_file, 'w') as f:
+                json.dump(metadata, f)
+            size += os.path.getsize(json_file)
+
+        with self._lock:
+            self._files += 1
+            self._bytes += size
+            self.counters['stored'] += 1
+            over_quota = self._bytes > self.max_bytes
+        if over_quota:
+            self.sweep()
+        return file_id, pdf_file
+
+    def path(self, file_id: str, action: str = None) -> Optional[str]:
+        """
+        Path of a stored PDF, or None if it does not exist
+
+        Raises:
+            ValueError: file_id is not a generated file ID (e.g. contains a path)
+        """
+        if not _FILE_ID_RE.match(file_id):
+            raise ValueError('Invalid file ID')
+        for directory in (self._shard_dir(file_id, action), self._dir(action)):
+            pdf_file = os.path.join(directory, f'{file_id}.pdf')
+            if os.path.exists(pdf_file):
+                return pdf_file
+        return None
+
+    def metadata(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Metadata saved with a sent PDF, or None"""
+        pdf_file = self.path(file_id)
+        if not pdf_file:
+            return None
+        try:
+            with open(pdf_file[:-4] + '.json') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _scan(self) -> List[Tuple[float, int, str, float]]:
+        """(mtime, size, pdf path, ttl) of every stored PDF"""
+        entries = []
+
+        def scan_dir(directory, ttl_for, depth):
+            try:
+                items = list(os.scandir(directory))
+            except FileNotFoundError:
+                return
+            for entry in items:
+                if entry.is_dir(follow_symlinks=False):
+                    if depth == 0 and len(entry.name) == SHARD_WIDTH:
+                        scan_dir(entry.path, ttl_for, depth + 1)
+                elif entry.name.endswith('.pdf'):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    meta = entry.path[:-4] + '.json'
+                    size = st.st_size
+                    has_meta = os.path.exists(meta)
+                    if has_meta:
+                        try:
+                            size += os.path.getsize(meta)
+                        except OSError:
+                            pass
+                    entries.append((st.st_mtime, size, entry.path, ttl_for(has_meta)))
+
+        scan_dir(self.root, lambda sent: self.send_ttl if sent else self.default_ttl, 0)
+        scan_dir(os.path.join(self.root, PREVIEW_DIR), lambda sent: self.preview_ttl, 0)
+        return entries
+
+    @staticmethod
+    def _remove(pdf_file: str) -> None:
+        for path in (pdf_file, pdf_file[:-4] + '.json'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def sweep(self) -> Dict[str, Any]:
+        """
+        Delete expired files, then evict oldest files until under quota
+
+        Returns:
+            Summary of the sweep
+        """
+        start = time.perf_counter()
+        now = time.time()
+        expired = evicted = 0
+        kept = []
+        for mtime, size, pdf_file, ttl in self._scan():
+            if now - mtime > ttl:
+                self._remove(pdf_file)
+                expired += 1
+            else:
+                kept.append((mtime, size, pdf_file))
+
+        total = sum(size for _, size, _ in kept)
+        kept.sort()
+        while total > self.max_bytes and kept:
+            _, size, pdf_file = kept.pop(0)
+            self._remove(pdf_file)
+            total -= size
+            evicted += 1
+
+        summary = {
+            'expired': expired,
+            'evicted': evicted,
+            'files': len(kept),
+            'bytes': total,
+            'ms': round((time.perf_counter() - start) * 1000, 2),
+            'at': now,
+        }
+        with self._lock:
+            self._files = len(kept)
+            self._bytes = total
+            self.counters['expired'] += expired
+            self.counters['evicted'] += evicted
+            self.counters['sweeps'] += 1
+            self.last_sweep = summary
+        return summary
+
+    def _run_janitor(self) -> None:
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping PDF store: {str(e)}")
+
+    def start_janitor(self) -> None:
+        """Start the background sweeper once (an initial sweep indexes existing files)"""
+        if self._janitor is not None or self.sweep_interval <= 0:
+            return
+        with self._lock:
+            if self._janitor is not None:
+                return
+            self._janitor = threading.Thread(target=self._run_janitor, daemon=True, name='pdf-store-janitor')
+        self.sweep()
+        self._janitor.start()
+
+    def stop_janitor(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'root': self.root,
+                'files': self._files,
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'ttl': {'preview': self.preview_ttl, 'send': self.send_ttl, 'default': self.default_ttl},
+                'lastSweep': self.last_sweep,
+                **self.counters,
+            }
+
+
+# Process-wide store used by the /api/htmltopdf endpoints
+pdf_store = PDFStore()
+
+
+def get_pdf_store(base_path: str = None) -> PDFStore:
+    """The shared store, or a janitor-less store rooted at base_path"""
+    if base_path is None or os.path.abspath(base_path) == os.path.abspath(pdf_store.root):
+        return pdf_store
+    return PDFStore(base_path, sweep_interval=0)
@@ -0,0 +1,291 @@
+"""
+Live Preview Sessions
+Keeps the parsed sheet, its formula engine and its rendered rows for an
+editor session, so keystrokes travel as cell deltas instead of whole sheets.
+An edit recalculates only the formulas that depend on the edited cells and
+answers with the <tr> fragments that changed and a new version number.
+
+Sessions live in the memory of one process (route a session to the same
+worker) and expire after PREVIEW_SESSION_TTL idle seconds; the least
+recently used session is dropped when PREVIEW_MAX_SESSIONS are open.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Iterator, Set
+
+from services.formula_engine import FormulaEngine
+from services.html_preview import SheetHTMLRenderer, DOCUMENT_TAIL
+from services.msc_parser import (MSCCell, StyleDef, DEFAULT_STYLE, iter_msc_records, parse_msc,
+                                 cell_ref_to_coords)
+
+
+PREVIEW_SESSION_TTL = float(os.environ.get('PREVIEW_SESSION_TTL', 15 * 60))
+PREVIEW_MAX_SESSIONS = int(os.environ.get('PREVIEW_MAX_SESSIONS', 200))
+PREVIEW_MAX_DELTA_CELLS = int(os.environ.get('PREVIEW_MAX_DELTA_CELLS', 5000))
+PATCH_HISTORY = 64  # patches kept for event subscribers that fall behind
+
+STYLE_TABLES = {
+    'font': 'fonts', 'color': 'colors', 'border': 'borders', 'layout': 'layouts',
+    'cellformat': 'cellformats', 'valueformat': 'valueformats',
+}
+
+
+class SessionNotFoundError(KeyError):
+    """Raised for unknown or expired session IDs"""
+
+
+class VersionConflictError(RuntimeError):
+    """Raised when a delta was made against an older version than the session's"""
+
+    def __init__(self, version: int):
+        super().__init__(f'Session is at version {version}')
+        self.version = version
+
+
+class PreviewSession:
+    """
+    One editor's sheet, kept parsed and rendered between edits
+
+    The sheet is a private copy, so it and its engine are edited in place.
+    """
+
+    def __init__(self, session_id: str, savestr: str, settings: Dict[str, Any]):
+        self.id = session_id
+        self.settings = settings
+        self.sheet = parse_msc(savestr)
+        # Private engine: the shared one from get_engine must not be edited
+        self.engine = FormulaEngine(self.sheet)
+        self.version = 0
+        self.last_used = time.monotonic()
+        self.patches: deque = deque(maxlen=PATCH_HISTORY)
+        self._changed = threading.Condition()
+        self._closed = False
+        self._render_all()
+
+    def _render_all(self) -> None:
+        self.renderer = SheetHTMLRenderer(self.sheet, self.settings, row_ids=True, engine=self.engine)
+        self.renderer.take_new_rules()
+        self.rows = {row: self.renderer.row_html(row) for row in self.renderer.grid.row_range}
+
+    def document(self) -> str:
+        """Full preview document at the current version"""
+        with self._changed:
+            return self.renderer.document_head() + ''.join(self.rows.values()) + DOCUMENT_TAIL
+
+    def snapshot(self) -> Dict[str, Any]:
+        """{'version', 'document'} read together"""
+        with self._changed:
+            return {'version': self.version, 'document': self.document()}
+
+    def apply(self, lines: List[str], base_version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Apply savestr lines (`cell:` lines, and font/color/border/... style
+        definitions the cells refer to) and return the patch
+
+        A `cell:B4` line without a value clears the cell. Changes to merges,
+        to cells outside the rendered area, or to existing style
+        definitions re-render the whole document; the patch then carries
+        `document` instead of `rows`.
+
+        Args:
+            lines: Savestr lines
+            base_version: Version the edit was made against; a mismatch
+                          raises VersionConflictError
+
+        Returns:
+            {'version', 'rows': [{'row': 1-based, 'html'}], 'css': [new rules]}
+            or {'version', 'document'}
+        """
+        with self._changed:
+            if base_version is not None and base_version != self.version:
+                raise VersionConflictError(self.version)
+
+            sheet, grid = self.sheet, self.renderer.grid
+            touched: Set[int] = set()
+            restyled = False
+            structural = False
+            for record in iter_msc_records('\n'.join(lines)):
+                if type(record) is StyleDef:
+                    table = getattr(sheet, STYLE_TABLES[record.family])
+                    if table.get(record.index, record.value) != record.value:
+                        restyled = True
+                    table[record.index] = record.value
+                    continue
+                if type(record) is not MSCCell:
+                    structural = True  # col/row/sheet attributes change the layout
+                    continue
+
+                # A bare `cell:B4` line (no value, no formatting) clears the cell
+                cell = record if record.datatype or record.style is not DEFAULT_STYLE else None
+                old = sheet.cells.get(record.ref)
+                old_spans = (old.colspan, old.rowspan) if old else (1, 1)
+                new_spans = (cell.colspan, cell.rowspan) if cell else (1, 1)
+                inside = (grid.first_row <= record.row < grid.first_row + grid.num_rows
+                          and grid.first_col <= record.col < grid.first_col + grid.num_cols)
+                if old_spans != new_spans or not inside:
+                    structural = True
+
+                if cell is None:
+                    sheet.cells.pop(record.ref, None)
+                    grid.rows.get(record.row, {}).pop(record.col, None)
+                else:
+                    sheet.cells[record.ref] = cell
+                    grid.rows.setdefault(record.row, {})[record.col] = cell
+                    sheet.max_col = max(sheet.max_col, cell.col + 1)
+                    sheet.max_row = max(sheet.max_row, cell.row + 1)
+                touched.add(record.row)
+                for ref in self.engine.set_cell(record.ref, cell):
+                    touched.add(cell_ref_to_coords(ref)[1])
+
+            self.version += 1
+            if structural or restyled:
+                self._render_all()
+                patch = {'version': self.version, 'document': None}
+            else:
+                changed = []
+                for row in sorted(touched):
+                    if row not in self.rows:
+                        continue
+                    row_html = self.renderer.row_html(row)
+                    if row_html != self.rows[row]:
+                        self.rows[row] = row_html
+                        changed.append({'row': row + 1, 'html': row_html})
+                patch = {'version': self.version, 'rows': changed, 'css': self.renderer.take_new_rules()}
+
+            self.patches.append(patch)
+            self.last_used = time.monotonic()
+            self._changed.notify_all()
+            if 'document' in patch:
+                # The history keeps a marker only; subscribers render their own copy
+                patch = {**patch, 'document': self.document()}
+        return patch
+
+    def events(self, after: int, heartbeat: float = 15) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Yield patches newer than version `after` as they are made, until the
+        session closes; None after `heartbeat` idle seconds (keep-alive)
+
+        A subscriber that fell further behind than PATCH_HISTORY gets one
+        {'version', 'document'} patch instead.
+        """
+        while True:
+            with self._changed:
+                pending = [patch for patch in self.patches if patch['version'] > after]
+                behind = after < self.version and (not pending or pending[0]['version'] > after + 1)
+                if not pending and not behind and not self._closed:
+                    self._changed.wait(heartbeat)
+                    pending = [patch for patch in self.patches if patch['version'] > after]
+                    behind = after < self.version and (not pending or pending[0]['version'] > after + 1)
+                closed = self._closed
+                version = self.version
+            if behind or any('document' in patch for patch in pending):
+                yield {'version': version, 'document': self.document()}
+                after = version
+            elif pending:
+                for patch in pending:
+                    yield patch
+                after = pending[-1]['version']
+            elif closed:
+                return
+            else:
+                yield None
+
+    def close(self) -> None:
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+
+class PreviewSessionStore:
+    """Open preview sessions by ID, with idle expiry and an LRU cap"""
+
+    def __init__(self, ttl: float = PREVIEW_SESSION_TTL, max_sessions: int = PREVIEW_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: 'OrderedDict[str, PreviewSession]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'created': 0, 'expired': 0, 'evicted': 0, 'patches': 0, 'rowsSent': 0,
+                         'patchBytes': 0, 'documentsSent': 0}
+
+    def _expire(self) -> List[PreviewSession]:
+        """Drop idle sessions and trim to max_sessions (caller holds the lock)"""
+        dropped = []
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_used <= self.ttl:
+                break
+            dropped.append(self._sessions.pop(session_id))
+            self.counters['expired'] += 1
+        while len(self._sessions) > self.max_sessions:
+            dropped.append(self._sessions.popitem(last=False)[1])
+            self.counters['evicted'] += 1
+        return dropped
+
+    def create(self, savestr: str, settings: Dict[str, Any]) -> PreviewSession:
+        """Parse and render a sheet into a new session"""
+        session = PreviewSession(uuid.uuid4().hex, savestr, settings)
+        with self._lock:
+            self._sessions[session.id] = session
+            self.counters['created'] += 1
+            self.counters['documentsSent'] += 1
+            dropped = self._expire()
+        for old in dropped:
+            old.close()
+        return session
+
+    def get(self, session_id: str) -> PreviewSession:
+        """
+        Raises:
+            SessionNotFoundError: Unknown or expired session
+        """
+        with self._lock:
+            dropped = self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._sessions.move_to_end(session_id)
+        for old in dropped:
+            old.close()
+        if session is None:
+            raise SessionNotFoundError(session_id)
+        return session
+
+    def apply(self, session_id: str, lines: List[str], base_version: Optional[int] = None) -> Dict[str, Any]:
+        """Apply a delta to a session (see PreviewSession.apply)"""
+        if len(lines) > PREVIEW_MAX_DELTA_CELLS:
+            raise ValueError(f'Delta has {len(lines)} lines (limit {PREVIEW_MAX_DELTA_CELLS})')
+        patch = self.get(session_id).apply(lines, base_version)
+        with self._lock:
+            self.counters['patches'] += 1
+            if 'document' in patch:
+                self.counters['documentsSent'] += 1
+                self.counters['patchBytes'] += len(patch['document'])
+            else:
+                self.counters['rowsSent'] += len(patch['rows'])
+                self.counters['patchBytes'] += sum(len(row['html']) for row in patch['rows'])
+        return patch
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.close()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'maxSessions': self.max_sessions,
+                'ttl': self.ttl,
+                **self.counters,
+            }
+
+
+# Process-wide session registry used by the preview API
+preview_sessions = PreviewSessionStore()
@@ -0,0 +1,185 @@
+"""
+Render Bundle
+Produces any set of artifacts for one sheet (HTML preview, PNG thumbnail,
+ReportLab PDF) from a single request: the workbook JSON is unwrapped and
+the sheet parsed once, the PNG and PDF render concurrently on the render
+processes while the HTML is built here from the shared model.
+
+Render processes get the savestr rather than the model (it is much cheaper
+to send than a pickled sheet); when the pool is disabled every artifact
+renders in-process from the one cached parse. Artifacts are stored in the
+content-addressed caches, so they can also be answered as cache keys and
+fetched separately (see get_bundle_artifact).
+"""
+
+import base64
+import os
+import re
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional
+
+from services.html_pdf_pool import RendererBusyError
+from services.html_preview import render_sheet_html
+from services.msc_parser import extract_savestr
+from services.pdf_cache import RenderedPDFCache, pdf_cache, content_key
+from services.sheet_cache import get_parsed_sheet
+from services.thumbnails import submit_thumbnail, thumbnail_cache, thumbnail_key
+
+
+HTML_CACHE_DIR = os.environ.get('HTML_CACHE_DIR') or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'tmp', 'html-cache')
+HTML_CACHE_MAX_BYTES = int(os.environ.get('HTML_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+HTML_CACHE_TTL = float(os.environ.get('HTML_CACHE_TTL', 3600))
+
+ARTIFACTS = ('html', 'png', 'pdf')
+OUTPUTS = ('inline', 'keys')
+MIMETYPES = {'html': 'text/html', 'png': 'image/png', 'pdf': 'application/pdf'}
+KEY_RE = re.compile(r'[0-9a-f]{40}')
+
+# Bump when the ReportLab or HTML output changes so cached artifacts are not reused
+BUNDLE_VERSION = 1
+
+
+def artifact_key(artifact: str, savestr: str, settings: Dict[str, Any]) -> str:
+    """Cache key of one artifact (the PNG shares the thumbnail cache's keys)"""
+    if artifact == 'png':
+        return thumbnail_key(savestr, settings)
+    return content_key(f'bundle-{artifact}', BUNDLE_VERSION, savestr, settings)
+
+
+def _cached(cache: RenderedPDFCache, key: str) -> Optional[Future]:
+    """A finished future for a cached artifact, or None on a miss"""
+    body = cache.get(key)
+    if body is None:
+        return None
+    future: Future = Future()
+    future.set_result(body)
+    return future
+
+
+def _html(key: str, savestr: str, settings: Dict[str, Any]) -> bytes:
+    html_bytes = html_cache.get(key)
+    if html_bytes is None:
+        html_bytes = render_sheet_html(get_parsed_sheet(savestr), settings).encode('utf-8')
+        try:
+            html_cache.put(key, html_bytes)
+        except OSError as e:
+            print(f"Error writing HTML cache entry: {str(e)}")
+    return html_bytes
+
+
+def render_bundle(sheet_data: str, settings: Dict[str, Any], artifacts: List[str],
+                  thumbnail: Optional[Dict[str, Any]] = None, output: str = 'inline') -> Dict[str, Any]:
+    """
+    Render several artifacts of one sheet together
+
+    Args:
+        sheet_data: MSC format string or JSON workbook format
+        settings: Shared preview/PDF settings
+        artifacts: Any of 'html', 'png', 'pdf'
+        thumbnail: PNG overrides (width, height) on top of settings
+        output: 'inline' returns base64 artifacts, 'keys' only their cache keys
+
+    Returns:
+        Dictionary with success status, the artifacts (or keys), per-artifact
+        errors and timings
+    """
+    artifacts = list(dict.fromkeys(artifacts))
+    unknown = [artifact for artifact in artifacts if artifact not in ARTIFACTS]
+    if not artifacts or unknown:
+        return {
+            'success': False,
+            'error': f"artifacts must be a non-empty list of {', '.join(ARTIFACTS)}"
+        }
+    if output not in OUTPUTS:
+        return {
+            'success': False,
+            'error': f"output must be one of {', '.join(OUTPUTS)}"
+        }
+
+    try:
+        start = time.perf_counter()
+        # One workbook unwrap and one parse for the whole bundle
+        savestr = extract_savestr(sheet_data)
+        get_parsed_sheet(savestr)
+        parsed = time.perf_counter()
+
+        artifact_settings = {
+            'html': settings,
+            'png': {**settings, **(thumbnail or {})},
+            'pdf': settings,
+        }
+        keys = {artifact: artifact_key(artifact, savestr, artifact_settings[artifact]) for artifact in artifacts}
+
+        # The render processes start on PNG and PDF while the HTML is built here
+        from services.render_executor import render_executor
+        pending: Dict[str, Future] = {}
+        errors: Dict[str, str] = {}
+        fresh_pdf = False
+        try:
+            if 'png' in artifacts:
+                pending['png'] = submit_thumbnail(savestr, artifact_settings['png'])
+            if 'pdf' in artifacts:
+                pending['pdf'] = _cached(pdf_cache, keys['pdf'])
+                if pending['pdf'] is None:
+                    fresh_pdf = True
+                    pending['pdf'] = render_executor.submit_pdf(savestr, settings)
+        except RendererBusyError as e:
+            for artifact in ('png', 'pdf'):
+                if artifact in artifacts and artifact not in pending:
+                    errors[artifact] = f'Renderer busy: {str(e)}'
+
+        results: Dict[str, bytes] = {}
+        timings: Dict[str, float] = {'parseMs': round((parsed - start) * 1000, 2)}
+        if 'html' in artifacts:
+            results['html'] = _html(keys['html'], savestr, settings)
+            timings['htmlMs'] = round((time.perf_counter() - parsed) * 1000, 2)
+
+        for artifact, future in pending.items():
+            try:
+                results[artifact] = render_executor.result(future)
+            except Exception as e:
+                errors[artifact] = str(e) or e.__class__.__name__
+            timings[f'{artifact}Ms'] = round((time.perf_counter() - parsed) * 1000, 2)
+        if fresh_pdf and 'pdf' in results:
+            try:
+                pdf_cache.put(keys['pdf'], results['pdf'])
+            except OSError as e:
+                print(f"Error writing PDF cache entry: {str(e)}")
+        timings['totalMs'] = round((time.perf_counter() - start) * 1000, 2)
+
+        data: Dict[str, Any] = {'keys': {artifact: keys[artifact] for artifact in results}}
+        if output == 'inline':
+            data.update({artifact: base64.b64encode(body).decode('utf-8') for artifact, body in results.items()})
+        data['sizes'] = {artifact: len(body) for artifact, body in results.items()}
+        if 'pdf' in results:
+            data['filename'] = f"spreadsheet_{settings.get('paperSize', 'a4')}_{settings.get('orientation', 'portrait')}.pdf"
+        data['timings'] = timings
+        if errors:
+            data['errors'] = errors
+
+        result = {'success': not errors, 'data': data}
+        if errors:
+            result['error'] = '; '.join(f'{artifact}: {message}' for artifact, message in errors.items())
+        return result
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {
+            'success': False,
+            'error': f'Failed to render bundle: {str(e)}'
+        }
+
+
+def get_bundle_artifact(artifact: str, key: str) -> Optional[bytes]:
+    """A bundle artifact by cache key, or None once it has been evicted"""
+    cache = {'html': html_cache, 'png': thumbnail_cache, 'pdf': pdf_cache}.get(artifact)
+    if cache is None or not KEY_RE.fullmatch(key):
+        return None
+    return cache.get(key)
+
+
+# Process-wide cache of bundle HTML previews (PNGs and PDFs share the thumbnail and PDF caches)
+html_cache = RenderedPDFCache(HTML_CACHE_DIR, HTML_CACHE_MAX_BYTES, HTML_CACHE_TTL, suffix='.html')
@@ -0,0 +1,280 @@
+"""
+ReportLab Render Executor
+Runs SocialCalc PDF and preview rendering in a pool of worker processes so
+CPU-bound ReportLab work is not serialized on the GIL of a threaded server.
+
+Workers are forked from a forkserver that has already imported ReportLab,
+the PDF generator and the standard font metrics, and the pool is warmed on
+start, so the first request does not pay for imports. Sheets travel as their
+savestr (zlib-compressed when large), which is much smaller to pickle than a
+parsed MSCSheet; each worker keeps its own parsed-sheet cache. At most
+`processes + queue_size` renders are in flight; beyond that submissions fail
+fast with RendererBusyError.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional, Callable
+
+from services.html_pdf_pool import RendererBusyError, RenderError
+
+
+RENDER_PROCESSES = int(os.environ.get('RENDER_PROCESSES', os.cpu_count() or 1))
+RENDER_QUEUE_SIZE = int(os.environ.get('RENDER_QUEUE_SIZE', 16))
+RENDER_TIMEOUT = float(os.environ.get('RENDER_TIMEOUT', 60))
+RENDER_START_METHOD = os.environ.get('RENDER_START_METHOD', 'forkserver')
+COMPRESS_MIN_BYTES = int(os.environ.get('RENDER_COMPRESS_MIN_BYTES', 32 * 1024))
+
+# Imported by the forkserver before it forks any worker
+PRELOAD_MODULES = ['services.render_executor', 'services.pdf_generator', 'services.thumbnails']
+
+
+def encode_sheet(savestr: str) -> bytes:
+    """Compact savestr payload: UTF-8, zlib-compressed when large (first byte is the flag)"""
+    raw = savestr.encode('utf-8')
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        return b'z' + zlib.compress(raw, 1)
+    return b'r' + raw
+
+
+def decode_sheet(payload: bytes) -> str:
+    raw = zlib.decompress(payload[1:]) if payload[:1] == b'z' else payload[1:]
+    return raw.decode('utf-8')
+
+
+# -- worker side ---------------------------------------------------------------
+
+def _warm_worker() -> None:
+    """Process initializer: load font metrics and run one tiny render"""
+    from reportlab.pdfbase import pdfmetrics
+    from services.cell_style import FONT_FAMILIES
+    from services.pdf_generator import SocialCalcPDFGenerator
+
+    for names in FONT_FAMILIES.values():
+        for name in names:
+            pdfmetrics.getFont(name)
+    SocialCalcPDFGenerator().generate_pdf('version:1.5\ncell:A1:t:warm\nsheet:c:1:r:1\n', {})
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _render_pdf(payload: bytes, settings: Dict[str, Any]) -> bytes:
+    from services.pdf_generator import SocialCalcPDFGenerator
+    return SocialCalcPDFGenerator().generate_pdf(decode_sheet(payload), settings)
+
+
+def _render_preview(payload: bytes, settings: Dict[str, Any]) -> bytes:
+    from services.pdf_generator import SocialCalcPDFGenerator, render_preview_png
+    generator = SocialCalcPDFGenerator()
+    return render_preview_png(generator.parse_msc_data(decode_sheet(payload)), settings)
+
+
+# -- server side ---------------------------------------------------------------
+
+class RenderExecutor:
+    """
+    Bounded, pre-warmed process pool for ReportLab renders
+
+    `processes` renders run at once and `queue_size` more may wait; further
+    submissions raise RendererBusyError (or wait, with block=True). A pool
+    whose worker died is replaced on the next submission.
+    """
+
+    def __init__(self, processes: int = RENDER_PROCESSES, queue_size: int = RENDER_QUEUE_SIZE,
+                 timeout: float = RENDER_TIMEOUT, start_method: str = RENDER_START_METHOD):
+        self.processes = processes
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.start_method = start_method
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(processes, 1) + queue_size)
+        self._in_flight = 0
+        self.counters = {
+            'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+            'timeouts': 0, 'restarts': 0, 'payloadBytes': 0, 'sheetBytes': 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        # Never nest pools: renders inside a worker process (including one still
+        # importing the parent's main module during bootstrap) run inline
+        current = multiprocessing.current_process()
+        return (self.processes > 0 and multiprocessing.parent_process() is None
+                and not getattr(current, '_inheriting', False))
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[key] += amount
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        context = multiprocessing.get_context(self.start_method)
+        if self.start_method == 'forkserver':
+            context.set_forkserver_preload(PRELOAD_MODULES)
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=context,
+                                   initializer=_warm_worker)
+
+    def start(self) -> None:
+        """Start every worker process now instead of on first use"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pool is not None:
+                return
+            self._pool = self._create_pool()
+            pool = self._pool
+        # One task per worker; ProcessPoolExecutor spawns a process per pending task
+        warmups = [pool.submit(_ping) for _ in range(self.processes)]
+        for future in warmups:
+            try:
+                future.result(timeout=self.timeout)
+            except Exception as e:
+                print(f"Error warming render process: {str(e)}")
+                if isinstance(e, BrokenProcessPool):
+                    self._reset_pool(pool)
+                    return
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._create_pool()
+            return self._pool
+
+    def _reset_pool(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is broken:
+                self._pool = None
+                self.counters['restarts'] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn: Callable, *args: Any, block: bool = False) -> Future:
+        """
+        Queue fn(*args) on a worker process
+
+        Args:
+            fn: Module-level (picklable) function
+            block: Wait up to the timeout for a free slot instead of failing fast
+
+        Raises:
+            RendererBusyError: All processes and queue slots are taken
+        """
+        acquired = self._slots.acquire(timeout=self.timeout) if block else self._slots.acquire(blocking=False)
+        if not acquired:
+            self._count('rejected')
+            raise RendererBusyError('PDF render queue is full')
+
+        pool = self._get_pool()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._reset_pool(pool)
+            pool = self._get_pool()
+            try:
+                future = pool.submit(fn, *args)
+            except Exception:
+                self._slots.release()
+                raise
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_flight += 1
+            self.counters['submitted'] += 1
+        future.add_done_callback(lambda done: self._finished(pool, done))
+        return future
+
+    def _finished(self, pool: ProcessPoolExecutor, future: Future) -> None:
+        self._slots.release()
+        error = None if future.cancelled() else future.exception()
+        with self._lock:
+            self._in_flight -= 1
+            self.counters['failed' if future.cancelled() or error else 'completed'] += 1
+        if isinstance(error, BrokenProcessPool):
+            self._reset_pool(pool)
+
+    def result(self, future: Future) -> bytes:
+        """Wait for a submitted render, translating timeouts and dead workers"""
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self._count('timeouts')
+            raise TimeoutError(f'Render did not finish within {self.timeout:g}s')
+        except BrokenProcessPool as e:
+            raise RenderError(f'Render process died: {str(e)}')
+
+    def _payload(self, savestr: str) -> bytes:
+        payload = encode_sheet(savestr)
+        self._count('payloadBytes', len(payload))
+        self._count('sheetBytes', len(savestr))
+        return payload
+
+    def submit_pdf(self, savestr: str, settings: Dict[str, Any], block: bool = False) -> Future:
+        """
+        Queue a SocialCalcPDFGenerator render; the future resolves to PDF bytes
+
+        When the pool is disabled the render runs inline and the returned
+        future is already done.
+        """
+        if not self.enabled:
+            future: Future = Future()
+            try:
+                future.set_result(_render_pdf(encode_sheet(savestr), settings))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self.submit(_render_pdf, self._payload(savestr), settings, block=block)
+
+    def render_pdf(self, savestr: str, settings: Dict[str, Any]) -> bytes:
+        """Render a savestr to PDF bytes on a worker (inline when the pool is disabled)"""
+        if not self.enabled:
+            from services.pdf_generator import SocialCalcPDFGenerator
+            return SocialCalcPDFGenerator().generate_pdf(savestr, settings)
+        return self.result(self.submit_pdf(savestr, settings))
+
+    def submit_preview(self, savestr: str, settings: Dict[str, Any], block: bool = False) -> Future:
+        """Queue a PNG preview render; the future resolves to PNG bytes (see submit_pdf)"""
+        if not self.enabled:
+            future: Future = Future()
+            try:
+                future.set_result(_render_preview(encode_sheet(savestr), settings))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self.submit(_render_preview, self._payload(savestr), settings, block=block)
+
+    def render_preview(self, savestr: str, settings: Dict[str, Any]) -> bytes:
+        """Render a savestr to a PNG preview on a worker (inline when the pool is disabled)"""
+        if not self.enabled:
+            from services.pdf_generator import SocialCalcPDFGenerator, render_preview_png
+            return render_preview_png(SocialCalcPDFGenerator().parse_msc_data(savestr), settings)
+        return self.result(self.submit_preview(savestr, settings))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'processes': self.processes,
+                'queueSize': self.queue_size,
+                'started': self._pool is not None,
+                'inFlight': self._in_flight,
+                'startMethod': self.start_method,
+                **self.counters,
+            }
+
+
+# Process-wide executor used by the SocialCalc render paths
+render_executor = RenderExecutor()
+atexit.register(render_executor.shutdown)
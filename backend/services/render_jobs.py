@@ -0,0 +1,461 @@
+"""
+Render Job Queue
+Runs PDF renders in the background so API requests return a job ID right
+away instead of holding a Flask worker for the whole render.
+
+Jobs are kept in a local SQLite table, so their status survives a restart
+and is shared by every process on the host; results are written to files
+next to the database. A fixed number of worker threads per process bounds
+concurrency. Renderer timeouts and a full renderer queue are retried with
+backoff; queued jobs can be cancelled, and a running job that is cancelled
+has its result discarded.
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional, Callable, Tuple, Iterator
+
+from services.html_pdf_pool import RenderError, RendererBusyError
+
+
+JOBS_DIR = os.environ.get('RENDER_JOBS_DIR') or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'tmp', 'jobs')
+JOB_WORKERS = int(os.environ.get('RENDER_JOB_WORKERS', 2))
+MAX_QUEUED = int(os.environ.get('RENDER_JOB_MAX_QUEUED', 100))
+MAX_ATTEMPTS = int(os.environ.get('RENDER_JOB_MAX_ATTEMPTS', 3))
+RETRY_DELAY = float(os.environ.get('RENDER_JOB_RETRY_DELAY', 2))
+RESULT_TTL = float(os.environ.get('RENDER_JOB_RESULT_TTL', 24 * 3600))
+
+# Workers also poll, to pick up jobs submitted by other processes and retries
+POLL_INTERVAL = 1.0
+PURGE_INTERVAL = 300
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Errors worth another attempt: the renderer was slow or saturated
+RETRYABLE_ERRORS = (subprocess.TimeoutExpired, TimeoutError, RendererBusyError, RenderError)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    error TEXT,
+    result TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, run_after, created);
+"""
+
+
+class QueueFullError(RuntimeError):
+    """Raised when too many jobs are already waiting"""
+
+
+class JobError(RuntimeError):
+    """A render failed in a way that retrying will not fix"""
+
+
+def _render_pdf(payload: Dict[str, Any]) -> Tuple[bytes, Dict[str, Any]]:
+    """SocialCalc sheetData -> PDF (ReportLab)"""
+    from services.pdf_generator import generate_pdf_from_socialcalc
+    from services.msc_parser import extract_savestr
+    from services.render_executor import render_executor
+
+    settings = payload.get('settings', {})
+    if not settings.get('allSheets'):
+        # Call the executor directly so a saturated pool is retried, not failed
+        pdf_bytes = render_executor.render_pdf(extract_savestr(payload['sheetData']), settings)
+        return pdf_bytes, {'filename': f"spreadsheet_{settings.get('paperSize', 'a4')}_"
+                                       f"{settings.get('orientation', 'portrait')}.pdf"}
+
+    result = generate_pdf_from_socialcalc(payload['sheetData'], settings, raw=True)
+    if not result['success']:
+        raise JobError(result['error'])
+    data = result['data']
+    return data['pdf'], {'filename': data['filename']}
+
+
+def _render_html_pdf(payload: Dict[str, Any]) -> Tuple[bytes, Dict[str, Any]]:
+    """CreateSheetHTML() output -> PDF (wkhtmltopdf, through the PDF cache)"""
+    from services.pdf_from_html import render_sheet_html_pdf
+    settings = payload.get('settings', {})
+    pdf_bytes, cached = render_sheet_html_pdf(payload['sheetHTML'], settings)
+    filename = f"spreadsheet_{settings.get('paperSize', 'a4')}_{settings.get('orientation', 'portrait')}.pdf"
+    return pdf_bytes, {'filename': filename, 'cached': cached}
+
+
+def _dispatch_pdf(payload: Dict[str, Any]) -> Tuple[bytes, Dict[str, Any]]:
+    """sheetData and/or sheetHTML -> PDF with the engine the renderer registry picks"""
+    from services.html_pdf_pool import RendererBusyError
+    from services.renderers import render_pdf
+    result = render_pdf(payload.get('sheetData'), payload.get('settings', {}), payload.get('sheetHTML'),
+                        payload.get('engine', 'auto'), payload.get('fallback'), raw=True)
+    if not result['success']:
+        if result.get('busy'):
+            raise RendererBusyError(result['error'])
+        raise JobError(result['error'])
+    data = result['data']
+    return data['pdf'], {'filename': data['filename'], 'engine': data['engine'], 'cached': data['cached']}
+
+
+# Job type -> handler returning (pdf_bytes, result metadata)
+JOB_TYPES: Dict[str, Callable[[Dict[str, Any]], Tuple[bytes, Dict[str, Any]]]] = {
+    'pdf': _render_pdf,
+    'html-pdf': _render_html_pdf,
+    'render-pdf': _dispatch_pdf,
+}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class RenderJobQueue:
+    """SQLite-backed job table plus a pool of worker threads"""
+
+    def __init__(self, jobs_dir: str = JOBS_DIR, workers: int = JOB_WORKERS,
+                 max_queued: int = MAX_QUEUED, max_attempts: int = MAX_ATTEMPTS,
+                 retry_delay: float = RETRY_DELAY, result_ttl: float = RESULT_TTL):
+        self.jobs_dir = jobs_dir
+        self.db_path = os.path.join(jobs_dir, 'jobs.sqlite3')
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.result_ttl = result_ttl
+        self.owner = str(os.getpid())
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._threads = []
+        self._stop = threading.Event()
+        self._initialized = False
+        self._last_purge = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self) -> None:
+        with self._lock:
+            if self._initialized:
+                return
+            os.makedirs(self.jobs_dir, exist_ok=True)
+            conn = self._connect()
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(_SCHEMA)
+                # Jobs left running by a process that no longer exists go back to the queue
+                for row in conn.execute('SELECT id, owner FROM jobs WHERE status = ?', (RUNNING,)).fetchall():
+                    if not row['owner'] or not _pid_alive(int(row['owner'])):
+                        conn.execute('UPDATE jobs SET status = ?, owner = NULL WHERE id = ? AND status = ?',
+                                     (QUEUED, row['id'], RUNNING))
+            finally:
+                conn.close()
+            self._initialized = True
+        self.start()
+
+    def _update(self, job_id: str, **fields) -> None:
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        conn = self._connect()
+        try:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+        finally:
+            conn.close()
+        self._notify()
+
+    def _notify(self) -> None:
+        with self._changed:
+            self._changed.notify_all()
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f'{job_id}.pdf')
+
+    @staticmethod
+    def _public(row: sqlite3.Row) -> Dict[str, Any]:
+        job = {
+            'id': row['id'],
+            'type': row['type'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'maxAttempts': row['max_attempts'],
+            'error': row['error'],
+            'created': row['created'],
+            'started': row['started'],
+            'finished': row['finished'],
+        }
+        if row['status'] == QUEUED and row['cancel_requested'] == 0 and row['attempts']:
+            job['retryAt'] = row['run_after']
+        if row['result']:
+            job['result'] = json.loads(row['result'])
+        return job
+
+    def submit(self, job_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue a render job
+
+        Args:
+            job_type: Key of JOB_TYPES ('pdf' for sheetData, 'html-pdf' for sheetHTML)
+            payload: Request body for the handler (sheetData/sheetHTML, settings)
+
+        Raises:
+            ValueError: Unknown job type
+            QueueFullError: max_queued jobs are already waiting
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type}")
+        self._init_db()
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            queued = conn.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (QUEUED,)).fetchone()[0]
+            if queued >= self.max_queued:
+                conn.execute('ROLLBACK')
+                raise QueueFullError(f'{queued} render jobs already queued')
+            conn.execute(
+                'INSERT INTO jobs (id, type, status, payload, max_attempts, run_after, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, job_type, QUEUED, json.dumps(payload), self.max_attempts, now, now))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        self._notify()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current state of a job, or None if unknown"""
+        self._init_db()
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._public(row) if row else None
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a job: queued jobs are cancelled at once, running jobs when
+        their render returns (the result is discarded). Finished jobs are
+        left as they are.
+        """
+        self._init_db()
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('UPDATE jobs SET status = ?, cancel_requested = 1, finished = ? '
+                         'WHERE id = ? AND status = ?', (CANCELLED, now, job_id, QUEUED))
+            conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?',
+                         (job_id, RUNNING))
+        finally:
+            conn.close()
+        self._notify()
+        return self.get(job_id)
+
+    def result_file(self, job_id: str) -> Optional[str]:
+        """Path of a finished job's PDF, or None"""
+        job = self.get(job_id)
+        if not job or job['status'] != SUCCEEDED:
+            return None
+        path = self._result_path(job_id)
+        return path if os.path.exists(path) else None
+
+    def events(self, job_id: str, heartbeat: float = 15) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Yield the job's state each time it changes, until it finishes
+
+        Yields None after `heartbeat` seconds without a change so callers
+        can keep the connection alive.
+        """
+        last = None
+        idle = 0.0
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            state = (job['status'], job['attempts'], job.get('retryAt'))
+            if state != last:
+                last = state
+                idle = 0.0
+                yield job
+                if job['status'] in FINISHED:
+                    return
+            elif idle >= heartbeat:
+                idle = 0.0
+                yield None
+            waited = time.monotonic()
+            with self._changed:
+                self._changed.wait(POLL_INTERVAL)
+            idle += time.monotonic() - waited
+
+    def stats(self) -> Dict[str, Any]:
+        self._init_db()
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        finally:
+            conn.close()
+        return {
+            'workers': self.workers,
+            'workerThreads': sum(1 for t in self._threads if t.is_alive()),
+            'maxQueued': self.max_queued,
+            'maxAttempts': self.max_attempts,
+            'jobs': {status: counts.get(status, 0) for status in (QUEUED, RUNNING) + FINISHED},
+        }
+
+    def start(self) -> None:
+        """Start the worker threads once"""
+        if self._threads or self.workers <= 0:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, daemon=True, name=f'render-job-{i}')
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._notify()
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Atomically move the oldest runnable job to running"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT * FROM jobs WHERE status = ? AND run_after <= ? AND cancel_requested = 0 '
+                'ORDER BY created LIMIT 1',
+                (QUEUED, now)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, attempts = attempts + 1, owner = ?, started = ? WHERE id = ?',
+                (RUNNING, self.owner, now, row['id']))
+            conn.execute('COMMIT')
+            return conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+        finally:
+            conn.close()
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._purge()
+                row = self._claim()
+            except sqlite3.Error as e:
+                print(f"Error claiming render job: {str(e)}")
+                row = None
+            if row is None:
+                with self._changed:
+                    self._changed.wait(POLL_INTERVAL)
+                continue
+            self._notify()
+            self._run(row)
+
+    def _run(self, row: sqlite3.Row) -> None:
+        job_id = row['id']
+        try:
+            pdf_bytes, meta = JOB_TYPES[row['type']](json.loads(row['payload']))
+        except RETRYABLE_ERRORS as e:
+            error = str(e) or e.__class__.__name__
+            if row['attempts'] < row['max_attempts']:
+                # Retry unless the job was cancelled while it ran
+                delay = self.retry_delay * 2 ** (row['attempts'] - 1)
+                now = time.time()
+                conn = self._connect()
+                try:
+                    updated = conn.execute(
+                        'UPDATE jobs SET status = ?, owner = NULL, error = ?, run_after = ? '
+                        'WHERE id = ? AND cancel_requested = 0',
+                        (QUEUED, error, now + delay, job_id)).rowcount
+                    if not updated:
+                        conn.execute('UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?',
+                                     (CANCELLED, error, now, job_id))
+                finally:
+                    conn.close()
+                self._notify()
+            else:
+                self._update(job_id, status=FAILED, error=error, finished=time.time())
+            return
+        except Exception as e:
+            if not isinstance(e, JobError):
+                import traceback
+                traceback.print_exc()
+            self._update(job_id, status=FAILED, error=str(e) or e.__class__.__name__, finished=time.time())
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.jobs_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, self._result_path(job_id))
+        meta['bytes'] = len(pdf_bytes)
+
+        # Only finish as succeeded if nobody cancelled the job meanwhile
+        now = time.time()
+        conn = self._connect()
+        try:
+            updated = conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = NULL, finished = ? '
+                'WHERE id = ? AND cancel_requested = 0',
+                (SUCCEEDED, json.dumps(meta), now, job_id)).rowcount
+            if not updated:
+                conn.execute('UPDATE jobs SET status = ?, finished = ? WHERE id = ?', (CANCELLED, now, job_id))
+        finally:
+            conn.close()
+        if not updated:
+            self._remove_result(job_id)
+        self._notify()
+
+    def _remove_result(self, job_id: str) -> None:
+        try:
+            os.remove(self._result_path(job_id))
+        except OSError:
+            pass
+
+    def _purge(self) -> None:
+        """Drop finished jobs (and their PDFs) older than result_ttl"""
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        conn = self._connect()
+        try:
+            placeholders = ', '.join('?' for _ in FINISHED)
+            rows = conn.execute(f'SELECT id FROM jobs WHERE status IN ({placeholders}) AND finished < ?',
+                                (*FINISHED, now - self.result_ttl)).fetchall()
+            for row in rows:
+                self._remove_result(row['id'])
+                conn.execute('DELETE FROM jobs WHERE id = ?', (row['id'],))
+        finally:
+            conn.close()
+
+
+# Process-wide queue; worker threads start on first use
+render_jobs = RenderJobQueue()
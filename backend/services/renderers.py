@@ -0,0 +1,525 @@
+"""
+PDF Renderer Registry
+The PDF engines behind one interface: ReportLab (pdf_generator, on the
+render processes), wkhtmltopdf (pdf_from_html, on the warm worker pool) and
+xhtml2pdf. Each engine advertises the sheet features it renders faithfully
+and keeps a latency model fitted to its own measured renders.
+
+For `engine: 'auto'` the dispatcher detects the features of the sheet
+(merges, non-standard fonts, SVG, images, rich text), ranks the available
+engines by the features they would lose and then by estimated latency, and
+falls back to the next engine when one fails. Per-engine counters and
+latency percentiles are kept for the stats endpoint.
+"""
+
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from importlib.util import find_spec
+from io import BytesIO
+from typing import Dict, Any, List, NamedTuple, Optional, FrozenSet, Tuple
+
+from services.html_pdf_pool import WKHTMLTOPDF_BIN, RenderError, RendererBusyError
+from services.msc_parser import MSCSheet
+
+
+RENDERER_COST_DECAY = float(os.environ.get('RENDERER_COST_DECAY', 0.98))
+RENDERER_MAX_FAILURES = int(os.environ.get('RENDERER_MAX_FAILURES', 3))
+RENDERER_COOLDOWN = float(os.environ.get('RENDERER_COOLDOWN', 30))
+LATENCY_SAMPLES = 256  # recent renders kept per engine for percentiles
+
+FEATURES = ('merges', 'fonts', 'svg', 'images', 'richText')
+# Only the client's sheetHTML carries these; server-side HTML renders them as text
+HTML_FEATURES = frozenset({'svg', 'images', 'richText'})
+
+# Font families ReportLab draws with their own metrics (others are substituted)
+STANDARD_FONT_NAMES = frozenset({
+    'arial', 'helvetica', 'sans-serif', 'times', 'times new roman', 'serif',
+    'courier', 'courier new', 'monospace',
+})
+
+_MERGE_RE = re.compile(r'<t[dh][^>]*\b(?:col|row)span\s*=\s*["\']?(?:[2-9]|\d{2,})', re.I)
+_FONT_FAMILY_RE = re.compile(r'font-family\s*:\s*([^;"}]+)', re.I)
+
+
+class RenderRequest(NamedTuple):
+    """One PDF render: the savestr and/or the client's sheetHTML, and what the sheet uses"""
+    savestr: Optional[str]
+    sheet_html: Optional[str]
+    settings: Dict[str, Any]
+    features: FrozenSet[str]
+    cells: int
+
+
+def _nonstandard_family(families: str) -> bool:
+    first = families.split(',')[0].strip().strip('\'"').lower()
+    return bool(first) and first not in STANDARD_FONT_NAMES
+
+
+def sheet_features(sheet: MSCSheet) -> FrozenSet[str]:
+    """Features of a parsed sheet that some engines cannot render"""
+    features = set()
+    for font in sheet.fonts.values():
+        parts = font.split(None, 3)
+        if len(parts) == 4 and parts[3] != '*' and _nonstandard_family(parts[3]):
+            features.add('fonts')
+            break
+    valueformats = sheet.valueformats
+    default_format = valueformats.get(int(sheet.attribs.get('tvf') or 0), '')
+    for cell in sheet.cells.values():
+        if cell.colspan > 1 or cell.rowspan > 1:
+            features.add('merges')
+        if cell.valuetype[:1] != 't':
+            continue
+        fmt = valueformats.get(cell.textvalueformat, '') if cell.textvalueformat else default_format
+        text = str(cell.value)
+        if fmt == 'text-image':
+            features.add('svg' if text.lower().split('?')[0].endswith('.svg') else 'images')
+        elif fmt == 'text-html' or cell.valuetype == 'th':
+            features.add('richText')
+            if '<svg' in text.lower():
+                features.add('svg')
+            if '<img' in text.lower():
+                features.add('images')
+    return frozenset(features)
+
+
+def html_features(sheet_html: str) -> FrozenSet[str]:
+    """Features of CreateSheetHTML() output (when no savestr comes with it)"""
+    lowered = sheet_html.lower()
+    features = set()
+    if _MERGE_RE.search(sheet_html):
+        features.add('merges')
+    if '<svg' in lowered or re.search(r'<img[^>]+\.svg\b', lowered):
+        features.add('svg')
+    if '<img' in lowered:
+        features.add('images')
+    if any(_nonstandard_family(families) for families in _FONT_FAMILY_RE.findall(sheet_html)):
+        features.add('fonts')
+    return frozenset(features)
+
+
+class CostModel:
+    """
+    Render latency estimate `fixed_ms + per_cell_ms * cells`
+
+    Refitted after every render by least squares over the measured renders,
+    older ones weighted down by `decay`. The prior (two virtual renders on
+    the prior line) keeps the fit stable while few sizes have been seen.
+    """
+
+    PRIOR_CELLS = 1000
+
+    def __init__(self, fixed_ms: float, per_cell_ms: float, decay: float = RENDERER_COST_DECAY,
+                 prior_weight: float = 4.0):
+        self.prior = (fixed_ms, per_cell_ms)
+        self.decay = decay
+        half = prior_weight / 2
+        far = fixed_ms + per_cell_ms * self.PRIOR_CELLS
+        # Weighted sums of the prior points: w, x, y, xx, xy
+        self._prior_sums = (prior_weight, half * self.PRIOR_CELLS, half * (fixed_ms + far),
+                            half * self.PRIOR_CELLS ** 2, half * self.PRIOR_CELLS * far)
+        self._sums = [0.0] * 5
+        self.samples = 0
+        self.fixed_ms, self.per_cell_ms = fixed_ms, per_cell_ms
+        self._lock = threading.Lock()
+
+    def estimate(self, cells: int) -> float:
+        return self.fixed_ms + self.per_cell_ms * cells
+
+    def observe(self, cells: int, ms: float) -> None:
+        with self._lock:
+            sums = [value * self.decay for value in self._sums]
+            for index, value in enumerate((1.0, cells, ms, cells * cells, cells * ms)):
+                sums[index] += value
+            self._sums = sums
+            self.samples += 1
+            w, x, y, xx, xy = (observed + prior for observed, prior in zip(sums, self._prior_sums))
+            denominator = w * xx - x * x
+            per_cell = (w * xy - x * y) / denominator if denominator > 0 else self.per_cell_ms
+            self.per_cell_ms = max(0.0, per_cell)
+            self.fixed_ms = max(0.0, (y - self.per_cell_ms * x) / w)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'fixedMs': round(self.fixed_ms, 3),
+            'perCellMs': round(self.per_cell_ms, 5),
+            'samples': self.samples,
+        }
+
+
+class Renderer:
+    """
+    A PDF engine: what it renders, whether it is installed, what it costs
+
+    Subclasses set `name`, `capabilities`, `sources` ('sheet' and/or 'html')
+    and the prior cost, and implement `_render`.
+    """
+
+    name = ''
+    capabilities: FrozenSet[str] = frozenset()
+    sources: FrozenSet[str] = frozenset({'sheet'})
+    prior_cost: Tuple[float, float] = (10.0, 0.1)  # fixed ms, ms per cell
+
+    def __init__(self):
+        self.model = CostModel(*self.prior_cost)
+        self.latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.counters = {'selected': 0, 'rendered': 0, 'cacheHits': 0, 'failed': 0, 'busy': 0,
+                         'fellBack': 0}
+
+    def available(self) -> bool:
+        return True
+
+    def accepts(self, request: RenderRequest) -> bool:
+        return (request.savestr is not None and 'sheet' in self.sources
+                or request.sheet_html is not None and 'html' in self.sources)
+
+    def missing(self, request: RenderRequest) -> FrozenSet[str]:
+        """Features of the request this engine would not render"""
+        capabilities = self.capabilities
+        if request.sheet_html is None:
+            capabilities = capabilities - HTML_FEATURES
+        return request.features - capabilities
+
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def render(self, request: RenderRequest) -> Tuple[bytes, bool]:
+        """PDF bytes and whether they came from a cache; records latency and failures"""
+        start = time.perf_counter()
+        try:
+            pdf_bytes, cached = self._render(request)
+        except RendererBusyError:
+            self.count('busy')
+            raise
+        except ValueError:
+            # Invalid settings are the request's fault, not the engine's
+            raise
+        except Exception:
+            with self._lock:
+                self.counters['failed'] += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= RENDERER_MAX_FAILURES:
+                    self.cooldown_until = time.monotonic() + RENDERER_COOLDOWN
+            raise
+        ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.consecutive_failures = 0
+            self.counters['cacheHits' if cached else 'rendered'] += 1
+            if not cached:
+                self.latencies.append(ms)
+        if not cached:
+            self.model.observe(request.cells, ms)
+        return pdf_bytes, cached
+
+    def _render(self, request: RenderRequest) -> Tuple[bytes, bool]:
+        raise NotImplementedError
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counters[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            counters = dict(self.counters)
+            cooling = self.cooling_down()
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 2)
+
+        return {
+            'available': self.available(),
+            'capabilities': sorted(self.capabilities),
+            'sources': sorted(self.sources),
+            'coolingDown': cooling,
+            'latencyMs': {
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+                'samples': len(latencies),
+            },
+            'cost': self.model.to_dict(),
+            **counters,
+        }
+
+
+def _sheet_document(savestr: str, settings: Dict[str, Any], print_css: str = '') -> str:
+    """The HTML preview of a savestr as a printable document"""
+    from services.html_preview import render_sheet_html
+    from services.sheet_cache import get_parsed_sheet
+    document = render_sheet_html(get_parsed_sheet(savestr), settings)
+    return document.replace('</head>', f'    <style>body {{ padding: 0; }}{print_css}</style>\n</head>', 1)
+
+
+class ReportLabRenderer(Renderer):
+    """In-process ReportLab tables on the render processes (pdf_generator)"""
+
+    name = 'reportlab'
+    capabilities = frozenset({'merges'})
+    prior_cost = (5.0, 0.14)
+
+    def _render(self, request: RenderRequest) -> Tuple[bytes, bool]:
+        from services.render_executor import render_executor
+        return render_executor.render_pdf(request.savestr, request.settings), False
+
+
+class WkhtmltopdfRenderer(Renderer):
+    """wkhtmltopdf on the warm worker pool (pdf_from_html)"""
+
+    name = 'wkhtmltopdf'
+    capabilities = frozenset(FEATURES)
+    sources = frozenset({'sheet', 'html'})
+    prior_cost = (60.0, 0.05)
+
+    def available(self) -> bool:
+        return shutil.which(WKHTMLTOPDF_BIN) is not None
+
+    def _render(self, request: RenderRequest) -> Tuple[bytes, bool]:
+        from services.pdf_from_html import render_sheet_html_pdf, render_document_pdf
+        if request.sheet_html is not None:
+            return render_sheet_html_pdf(request.sheet_html, request.settings)
+        scale = request.settings.get('scale', 100) / 100.0
+        zoom_css = ''
+        if not request.settings.get('fitToPage', False) and scale != 1.0:
+            zoom_css = f' table {{ width: auto; transform: scale({scale}); transform-origin: top left; }}'
+        document = _sheet_document(request.savestr, request.settings, zoom_css)
+        return render_document_pdf(document, request.settings)
+
+
+def xhtml2pdf_convert(document: str) -> bytes:
+    """Convert an HTML document with xhtml2pdf (module-level for the render processes)"""
+    from xhtml2pdf import pisa
+    buffer = BytesIO()
+    status = pisa.CreatePDF(document, dest=buffer, encoding='utf-8')
+    if status.err:
+        raise RenderError(f'xhtml2pdf reported {status.err} error(s)')
+    return buffer.getvalue()
+
+
+class XHTML2PDFRenderer(Renderer):
+    """xhtml2pdf (HTML/CSS on top of ReportLab) on the render processes"""
+
+    name = 'xhtml2pdf'
+    capabilities = frozenset({'merges', 'images', 'richText'})
+    sources = frozenset({'sheet', 'html'})
+    prior_cost = (40.0, 0.6)
+
+    def available(self) -> bool:
+        return find_spec('xhtml2pdf') is not None
+
+    def page_css(self, settings: Dict[str, Any]) -> str:
+        """@page rule for the paper and margins (xhtml2pdf takes them from CSS)"""
+        margins = settings.get('margins') or {}
+        margin = ' '.join(f"{margins.get(side, 20)}mm" for side in ('top', 'right', 'bottom', 'left'))
+        size = f"{settings.get('paperSize', 'a4')} {settings.get('orientation', 'portrait')}"
+        return f' @page {{ size: {size}; margin: {margin}; }}'
+
+    def _render(self, request: RenderRequest) -> Tuple[bytes, bool]:
+        from services.render_executor import render_executor
+        if request.sheet_html is not None:
+            from services.pdf_from_html import build_html_document
+            document = build_html_document(request.sheet_html, request.settings).replace(
+                '</style>', self.page_css(request.settings) + '</style>', 1)
+        else:
+            document = _sheet_document(request.savestr, request.settings, self.page_css(request.settings))
+        if not render_executor.enabled:
+            return xhtml2pdf_convert(document), False
+        return render_executor.result(render_executor.submit(xhtml2pdf_convert, document)), False
+
+
+class RendererRegistry:
+    """Registered engines and the cost-based dispatcher"""
+
+    def __init__(self):
+        self._renderers: Dict[str, Renderer] = {}
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'fallbacks': 0, 'degraded': 0, 'failed': 0}
+
+    def register(self, renderer: Renderer) -> Renderer:
+        with self._lock:
+            self._renderers[renderer.name] = renderer
+        return renderer
+
+    def get(self, name: str) -> Optional[Renderer]:
+        return self._renderers.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._renderers)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.counters[key] += 1
+
+    def candidates(self, request: RenderRequest) -> List[Tuple[Renderer, FrozenSet[str], float]]:
+        """
+        Installed engines that can take the request, best first: fewest
+        unsupported features, then lowest estimated latency; engines that
+        failed repeatedly go last until their cooldown ends
+        """
+        ranked = []
+        for renderer in list(self._renderers.values()):
+            if not renderer.accepts(request) or not renderer.available():
+                continue
+            missing = renderer.missing(request)
+            estimate = renderer.model.estimate(request.cells)
+            ranked.append((renderer.cooling_down(), len(missing), estimate, renderer.name,
+                           renderer, missing))
+        ranked.sort(key=lambda entry: entry[:4])
+        return [(renderer, missing, estimate) for _, _, estimate, _, renderer, missing in ranked]
+
+    def render(self, request: RenderRequest, engine: str = 'auto',
+               fallback: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Render with `engine` ('auto' for the cheapest capable one)
+
+        Args:
+            request: Render request
+            engine: 'auto' or a registered engine name
+            fallback: Try the remaining engines when the chosen one fails
+                      (default: on for 'auto', off for a named engine)
+
+        Returns:
+            Dictionary with success status, the PDF bytes, the engine used and
+            every attempt
+        """
+        self._count('requests')
+        ranked = self.candidates(request)
+        if engine != 'auto':
+            chosen = self.get(engine)
+            if chosen is None:
+                return {'success': False, 'error': f'Unknown renderer: {engine}'}
+            named = [entry for entry in ranked if entry[0] is chosen]
+            if not named:
+                reason = 'is not installed' if chosen.accepts(request) else 'cannot render this input'
+                return {'success': False, 'error': f'Renderer {engine} {reason}'}
+            others = [entry for entry in ranked if entry[0] is not chosen]
+            ranked = named + (others if fallback else [])
+        elif fallback is False:
+            ranked = ranked[:1]
+        if not ranked:
+            return {'success': False, 'error': 'No installed renderer can render this input'}
+
+        attempts = []
+        failed: List[Renderer] = []
+        busy = False
+        ranked[0][0].count('selected')
+        for renderer, missing, estimate in ranked:
+            start = time.perf_counter()
+            try:
+                pdf_bytes, cached = renderer.render(request)
+            except ValueError as e:
+                # Invalid settings fail on every engine: no fallback, not an engine failure
+                return {'success': False, 'error': f'Invalid PDF settings: {str(e)}', 'invalid': True}
+            except Exception as e:
+                busy = busy or isinstance(e, RendererBusyError)
+                print(f"Error rendering with {renderer.name}: {str(e) or e.__class__.__name__}")
+                attempts.append({'engine': renderer.name, 'error': str(e) or e.__class__.__name__})
+                failed.append(renderer)
+                continue
+
+            if failed:
+                self._count('fallbacks')
+                for previous in failed:
+                    previous.count('fellBack')
+            if missing:
+                self._count('degraded')
+            attempts.append({'engine': renderer.name})
+            return {
+                'success': True,
+                'data': {
+                    'pdf': pdf_bytes,
+                    'engine': renderer.name,
+                    'cached': cached,
+                    'features': sorted(request.features),
+                    'missingFeatures': sorted(missing),
+                    'estimatedMs': round(estimate, 2),
+                    'renderMs': round((time.perf_counter() - start) * 1000, 2),
+                    'attempts': attempts,
+                }
+            }
+
+        self._count('failed')
+        return {
+            'success': False,
+            'error': '; '.join(f"{attempt['engine']}: {attempt['error']}" for attempt in attempts),
+            'busy': busy,
+            'data': {'attempts': attempts}
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            'renderers': {name: renderer.stats() for name, renderer in list(self._renderers.items())},
+        }
+
+
+def build_request(sheet_data: Optional[str], settings: Dict[str, Any],
+                  sheet_html: Optional[str] = None) -> RenderRequest:
+    """Render request for sheetData (workbook JSON or MSC) and/or CreateSheetHTML() output"""
+    if sheet_data:
+        from services.msc_parser import extract_savestr
+        from services.sheet_cache import get_parsed_sheet
+        savestr = extract_savestr(sheet_data)
+        sheet = get_parsed_sheet(savestr)
+        features = sheet_features(sheet)
+        if sheet_html is not None:
+            features |= html_features(sheet_html)
+        return RenderRequest(savestr, sheet_html, settings, features, len(sheet.cells))
+    return RenderRequest(None, sheet_html, settings, html_features(sheet_html or ''),
+                         (sheet_html or '').count('<td'))
+
+
+def render_pdf(sheet_data: Optional[str], settings: Dict[str, Any], sheet_html: Optional[str] = None,
+               engine: str = 'auto', fallback: Optional[bool] = None, raw: bool = False) -> Dict[str, Any]:
+    """
+    Generate a PDF with the engine the dispatcher picks (or the one named)
+
+    Args:
+        sheet_data: MSC format string or JSON workbook format (optional when
+                    sheet_html is given)
+        settings: PDF generation settings
+        sheet_html: HTML from SocialCalc's CreateSheetHTML(), for the HTML engines
+        engine: 'auto' or a renderer name (see renderer_registry.names())
+        fallback: See RendererRegistry.render
+        raw: Return the PDF as bytes instead of base64
+
+    Returns:
+        Dictionary with success status, PDF data, the engine used and the attempts
+    """
+    try:
+        request = build_request(sheet_data, settings, sheet_html)
+        result = renderer_registry.render(request, engine, fallback)
+        if result['success']:
+            import base64
+            data = result['data']
+            if not raw:
+                data['pdf'] = base64.b64encode(data['pdf']).decode('utf-8')
+            data['filename'] = (f"spreadsheet_{settings.get('paperSize', 'a4')}_"
+                                f"{settings.get('orientation', 'portrait')}.pdf")
+        return result
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {
+            'success': False,
+            'error': f'Failed to generate PDF: {str(e)}'
+        }
+
+
+# Process-wide registry used by the PDF API
+renderer_registry = RendererRegistry()
+renderer_registry.register(ReportLabRenderer())
+renderer_registry.register(WkhtmltopdfRenderer())
+renderer_registry.register(XHTML2PDFRenderer())
@@ -5,9 +5,11 @@ import time
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from botocore.exceptions import ClientError
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from datetime import datetime
 
+from services.formula_engine import invoice_total
+
 class S3Store:
     def __init__(self):
         # Dual bucket architecture
@@ -338,7 +340,8 @@ class S3Store:
             bill_type: Bill type/footer index
             user_id: User identifier
             invoice_id: Unique invoice ID (generated if not provided)
-            total: Total amount from invoice
+            total: Total amount from the client, used only when the total
+                cannot be recalculated from the content
             invoice_name: Display name for the invoice
             status: Invoice status (draft, sent, paid, etc.)
             invoice_number: User-defined invoice number
@@ -357,6 +360,11 @@ class S3Store:
             
             now = datetime.now().isoformat()
             
+            # Recalculate the total server-side rather than trusting the client
+            computed_total = invoice_total(content)
+            if computed_total is not None:
+                total = computed_total
+            
             # 1. Save invoice metadata
             meta = {
                 'invoice_id': invoice_id,
@@ -526,6 +534,114 @@ class S3Store:
             return json.loads(file_data['content'])
         return None
 
+    def template_thumbnail_location(self, filename: str, bucket_type: str = 'user',
+                                    user_id: str = 'default_user') -> Tuple[str, str]:
+        """
+        Bucket and key of a template's thumbnail, stored next to its metadata:
+        App: templates-metadata/{id}.png
+        User: {user_id}/templates/metadata/{id}.png
+        """
+        template_id = filename[:-5] if filename.endswith('.json') else filename
+        if bucket_type == 'app':
+            return self.app_bucket_name, f"{self.metadata_prefix}{template_id}.png"
+        return self.user_bucket_name, f"{user_id}/{self.user_template_meta_prefix}{template_id}.png"
+
+    def get_template_thumbnail(self, filename: str, bucket_type: str = 'user',
+                               user_id: str = 'default_user') -> Optional[bytes]:
+        """Stored PNG thumbnail of a template, or None if none has been rendered"""
+        bucket, key = self.template_thumbnail_location(filename, bucket_type, user_id)
+        try:
+            response = self.s3_client.get_object(Bucket=bucket, Key=key)
+            return response['Body'].read()
+        except ClientError:
+            return None
+
+    def save_template_thumbnail(self, filename: str, png_bytes: bytes, bucket_type: str = 'user',
+                                user_id: str = 'default_user') -> bool:
+        """Store a rendered PNG thumbnail next to the template metadata"""
+        bucket, key = self.template_thumbnail_location(filename, bucket_type, user_id)
+        try:
+            self.s3_client.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=png_bytes,
+                ContentType='image/png'
+            )
+            return True
+        except ClientError as e:
+            print(f"Error saving thumbnail for template {filename}: {e}")
+            return False
+
+    def copy_template_thumbnail(self, filename: str, target_filename: str,
+                                user_id: str = 'default_user') -> bool:
+        """Copy an app template's stored thumbnail to an imported user template"""
+        src_bucket, src_key = self.template_thumbnail_location(filename, 'app')
+        dest_bucket, dest_key = self.template_thumbnail_location(target_filename, 'user', user_id)
+        try:
+            self.s3_client.copy({'Bucket': src_bucket, 'Key': src_key}, dest_bucket, dest_key)
+            return True
+        except ClientError as e:
+            print(f"Error copying thumbnail for template {filename}: {e}")
+            return False
+
+    def template_meta_location(self, filename: str, bucket_type: str = 'user',
+                               user_id: str = 'default_user') -> Tuple[str, str]:
+        """
+        Bucket and key of a template's metadata:
+        App: templates-metadata/{id}.json
+        User: {user_id}/templates/metadata/{id}.json
+        """
+        clean_filename = filename if filename.endswith('.json') else f"{filename}.json"
+        if bucket_type == 'app':
+            return self.app_bucket_name, f"{self.metadata_prefix}{clean_filename}"
+        return self.user_bucket_name, f"{user_id}/{self.user_template_meta_prefix}{clean_filename}"
+
+    def get_template_meta(self, filename: str, bucket_type: str = 'user',
+                          user_id: str = 'default_user') -> Optional[Dict[str, Any]]:
+        """Template metadata, or None if the template has none"""
+        bucket, key = self.template_meta_location(filename, bucket_type, user_id)
+        file_data = self.get_file(bucket, key)
+        if file_data:
+            return json.loads(file_data['content'])
+        return None
+
+    def set_template_image(self, filename: str, image_key: str, image_hash: str,
+                           bucket_type: str = 'user', user_id: str = 'default_user') -> bool:
+        """
+        Record a stored thumbnail in the template metadata
+
+        Args:
+            filename: Template filename (with or without .json)
+            image_key: Bucket key of the thumbnail (metadata `image`)
+            image_hash: Content hash the thumbnail was rendered from (`imageHash`)
+            bucket_type: 'user' or 'app'
+            user_id: User identifier
+
+        Returns:
+            True if successful, False otherwise
+        """
+        bucket, key = self.template_meta_location(filename, bucket_type, user_id)
+        existing = self.get_file(bucket, key)
+        if not existing:
+            print(f"Template metadata not found: {key}")
+            return False
+        try:
+            meta = json.loads(existing['content'])
+            meta['image'] = image_key
+            meta['imageHash'] = image_hash
+            self.s3_client.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=json.dumps(meta),
+                ContentType='application/json'
+            )
+        except ClientError as e:
+            print(f"Error updating thumbnail of template {filename}: {e}")
+            return False
+
+        self._invalidate_cache("app_templates_all" if bucket_type == 'app' else f"user_templates_{user_id}")
+        return True
+
     def get_file(self, bucket: str, key: str) -> Optional[Dict[str, Any]]:
         """Helper to get file content and metadata from S3"""
         try:
@@ -569,6 +685,18 @@ class S3Store:
             print(f"Error seeding template {filename}: {e}")
             return False
 
+    def save_template(self, filename: str, content: Dict, meta_content: Optional[Dict] = None) -> bool:
+        """Save template data to the App Bucket, keeping (or creating) its metadata"""
+        clean_filename = filename if filename.endswith('.json') else f"{filename}.json"
+        template_id = clean_filename[:-5]
+        meta = self.get_template_meta(clean_filename, 'app') or {'id': template_id, 'name': f"Template {template_id}"}
+        if meta_content:
+            meta.update(meta_content)
+        if self.save_template_seed(clean_filename, meta, content):
+            self._invalidate_cache("app_templates_all")
+            return True
+        return False
+
     def delete_invoice(self, filename: str, user_id: str = 'default_user') -> bool:
         """Delete invoice from User Bucket (both meta and data files)."""
         try:
@@ -0,0 +1,112 @@
+"""
+Parsed Sheet Cache
+Process-wide LRU of parsed MSC sheets keyed by a hash of the normalized savestr,
+so repeated preview/PDF renders of the same sheetData skip parsing entirely.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Tuple
+
+from services.msc_parser import MSCSheet, parse_msc, extract_savestr
+
+
+# Parsed models take roughly 5.5x the savestr size in memory (measured on the
+# template corpus, see benchmarks/bench_sheet_memory.py); the byte budget is
+# charged using this estimate.
+MODEL_SIZE_FACTOR = 6
+
+DEFAULT_MAX_BYTES = int(os.environ.get('SHEET_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+
+def normalize_savestr(msc_data: str) -> str:
+    """Normalize line endings and surrounding whitespace so equivalent savestrs share a key"""
+    if '\r' in msc_data:
+        msc_data = msc_data.replace('\r\n', '\n')
+    return msc_data.strip()
+
+
+def savestr_key(msc_data: str) -> str:
+    """Content hash of an already-normalized savestr"""
+    return hashlib.blake2b(msc_data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ParsedSheetCache:
+    """
+    Byte-budgeted LRU of MSCSheet models
+
+    Cached sheets are shared between requests and threads, so callers must
+    treat them as read-only.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[MSCSheet, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, msc_data: str) -> MSCSheet:
+        """Return the parsed model for a savestr, parsing and caching it on a miss"""
+        normalized = normalize_savestr(msc_data)
+        key = savestr_key(normalized)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Parse outside the lock; a concurrent miss on the same key just parses twice
+        sheet = parse_msc(normalized)
+        size = len(normalized) * MODEL_SIZE_FACTOR
+        if size > self.max_bytes:
+            return sheet
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (sheet, size)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self._bytes -= evicted_size
+                    self.evictions += 1
+        return sheet
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRatio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Process-wide instance shared by the preview and PDF services
+sheet_cache = ParsedSheetCache()
+
+
+def get_parsed_sheet(msc_data: str) -> MSCSheet:
+    """Parsed (and cached) model for a raw savestr"""
+    return sheet_cache.get(msc_data)
+
+
+def load_sheet(sheet_data: str) -> MSCSheet:
+    """Parsed (and cached) model for request sheetData: workbook JSON or raw MSC"""
+    return sheet_cache.get(extract_savestr(sheet_data))
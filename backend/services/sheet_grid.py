@@ -0,0 +1,109 @@
+"""
+Sparse Sheet Grid
+Row-indexed view of an MSCSheet trimmed to the bounding box of populated cells.
+Renderers walk this instead of allocating the (declared rows x declared cols)
+grid from the `sheet:c:..:r:..` header, and hard caps reject oversized sheets
+before any per-cell work is done.
+"""
+
+import os
+from typing import Dict, List, Optional
+
+from services.msc_parser import MSCSheet, MSCCell
+
+
+MAX_GRID_ROWS = int(os.environ.get('GRID_MAX_ROWS', 20000))
+MAX_GRID_COLS = int(os.environ.get('GRID_MAX_COLS', 256))
+MAX_GRID_CELLS = int(os.environ.get('GRID_MAX_CELLS', 2000000))
+
+
+class SheetTooLargeError(ValueError):
+    """Raised when a sheet's used area exceeds the configured render caps"""
+
+
+class SparseGrid:
+    """
+    Populated cells of a sheet, indexed by row then column
+
+    Coordinates stay in sheet space (0-indexed); `first_row`/`first_col`
+    give the origin of the trimmed bounding box so renderers can map a
+    cell to its position in the output table.
+    """
+
+    def __init__(self, sheet: MSCSheet, max_rows: int = None, max_cols: int = None,
+                 max_cells: int = None):
+        self.sheet = sheet
+        self.rows: Dict[int, Dict[int, MSCCell]] = {}
+
+        first_row = first_col = None
+        last_row = last_col = -1
+        for cell in sheet.cells.values():
+            row, col = cell.row, cell.col
+            row_cells = self.rows.get(row)
+            if row_cells is None:
+                row_cells = self.rows[row] = {}
+            row_cells[col] = cell
+
+            if first_row is None or row < first_row:
+                first_row = row
+            if first_col is None or col < first_col:
+                first_col = col
+            end_row = row + cell.rowspan - 1
+            end_col = col + cell.colspan - 1
+            if end_row > last_row:
+                last_row = end_row
+            if end_col > last_col:
+                last_col = end_col
+
+        self.first_row = first_row or 0
+        self.first_col = first_col or 0
+        self.num_rows = last_row - self.first_row + 1 if first_row is not None else 0
+        self.num_cols = last_col - self.first_col + 1 if first_col is not None else 0
+
+        max_rows = MAX_GRID_ROWS if max_rows is None else max_rows
+        max_cols = MAX_GRID_COLS if max_cols is None else max_cols
+        max_cells = MAX_GRID_CELLS if max_cells is None else max_cells
+        if self.num_rows > max_rows:
+            raise SheetTooLargeError(f'Sheet uses {self.num_rows} rows (limit {max_rows})')
+        if self.num_cols > max_cols:
+            raise SheetTooLargeError(f'Sheet uses {self.num_cols} columns (limit {max_cols})')
+        if self.num_rows * self.num_cols > max_cells:
+            raise SheetTooLargeError(
+                f'Sheet area {self.num_rows}x{self.num_cols} exceeds {max_cells} cells')
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.rows
+
+    @property
+    def row_range(self) -> range:
+        return range(self.first_row, self.first_row + self.num_rows)
+
+    @property
+    def col_range(self) -> range:
+        return range(self.first_col, self.first_col + self.num_cols)
+
+    def cell(self, col: int, row: int) -> Optional[MSCCell]:
+        row_cells = self.rows.get(row)
+        return row_cells.get(col) if row_cells else None
+
+    def table_data(self, values: Dict[str, str] = None) -> List[List[str]]:
+        """
+        Cell values as a list of rows covering only the bounding box
+
+        Args:
+            values: Optional {ref: value} overriding saved cell values,
+                    e.g. recalculated formula results
+        """
+        first_row, first_col, num_cols = self.first_row, self.first_col, self.num_cols
+        table = [[''] * num_cols for _ in range(self.num_rows)]
+        for row, row_cells in self.rows.items():
+            row_values = table[row - first_row]
+            for col, cell in row_cells.items():
+                row_values[col - first_col] = cell.value
+        if values:
+            for ref, value in values.items():
+                cell = self.sheet.cells.get(ref)
+                if cell is not None:
+                    table[cell.row - first_row][cell.col - first_col] = value
+        return table
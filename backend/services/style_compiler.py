@@ -0,0 +1,94 @@
+"""
+Table Style Compiler
+Collects per-cell ReportLab TableStyle commands and merges cells that share
+the same command and arguments into the largest rectangular ranges, so
+ReportLab applies a handful of range commands instead of one per cell.
+"""
+
+from typing import Dict, Any, List, Tuple
+
+
+class TableStyleCompiler:
+    """
+    Accumulate per-cell style commands and emit merged range commands
+
+    Each (command, cell) pair holds one value; adding the same command for a
+    cell again replaces the earlier value, so merged ranges never overlap
+    within a command and emission order between ranges does not matter.
+    """
+
+    def __init__(self):
+        self._values: Dict[Tuple[str, int, int], tuple] = {}
+        self.cell_commands = 0
+        self.compiled_commands = 0
+
+    def add(self, command: str, col: int, row: int, *args: Any) -> None:
+        """Queue `command` with `args` for the single cell at (col, row)"""
+        self._values[(command, col, row)] = args
+
+    @property
+    def saved_commands(self) -> int:
+        return self.cell_commands - self.compiled_commands
+
+    def compile(self) -> List[tuple]:
+        """Return TableStyle commands covering every queued cell with merged rectangles"""
+        groups: Dict[Tuple[str, tuple], Dict[int, List[int]]] = {}
+        for (command, col, row), args in self._values.items():
+            rows = groups.setdefault((command, args), {})
+            rows.setdefault(row, []).append(col)
+
+        commands = []
+        for (command, args), rows in groups.items():
+            for (col_start, row_start), (col_end, row_end) in _merge_rectangles(rows):
+                commands.append((command, (col_start, row_start), (col_end, row_end)) + args)
+
+        self.cell_commands = len(self._values)
+        self.compiled_commands = len(commands)
+        return commands
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'cellCommands': self.cell_commands,
+            'compiledCommands': self.compiled_commands,
+            'savedCommands': self.saved_commands,
+        }
+
+
+def _merge_rectangles(rows: Dict[int, List[int]]) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """
+    Cover the given cells ({row: [cols]}) with rectangles
+
+    Each row is split into runs of consecutive columns; a run is extended
+    downwards while the next row has exactly the same run.
+    """
+    rects = []
+    open_runs: Dict[Tuple[int, int], int] = {}  # (col_start, col_end) -> first row
+    prev_row = None
+
+    for row in sorted(rows):
+        runs = []
+        cols = sorted(rows[row])
+        start = end = cols[0]
+        for col in cols[1:]:
+            if col == end + 1:
+                end = col
+            else:
+                runs.append((start, end))
+                start = end = col
+        runs.append((start, end))
+
+        contiguous = prev_row is not None and row == prev_row + 1
+        next_open = {}
+        for run in runs:
+            first_row = open_runs.pop(run, None) if contiguous else None
+            next_open[run] = row if first_row is None else first_row
+
+        # Runs that did not continue into this row are finished
+        for (col_start, col_end), first_row in open_runs.items():
+            rects.append(((col_start, first_row), (col_end, prev_row)))
+        open_runs = next_open
+        prev_row = row
+
+    for (col_start, col_end), first_row in open_runs.items():
+        rects.append(((col_start, first_row), (col_end, prev_row)))
+    return rects
@@ -0,0 +1,136 @@
+"""
+Template Catalog Thumbnails
+Renders the stored thumbnail of templates when they are seeded, imported or
+saved, so the catalog links a ready PNG (metadata `image`) and browsing
+never renders on the server.
+
+Renders run in parallel on the render processes and uploads on a thread
+pool. The content hash a thumbnail was rendered from is kept next to its key
+(metadata `imageHash`); templates whose sheet did not change are skipped.
+"""
+
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from services.thumbnails import submit_thumbnail, template_savestr, thumbnail_key
+
+
+THUMBNAIL_UPLOAD_WORKERS = int(os.environ.get('THUMBNAIL_UPLOAD_WORKERS', 8))
+
+
+def template_image_hash(savestr: str) -> str:
+    """Hash of everything the stored (default size) thumbnail depends on"""
+    return thumbnail_key(savestr, {})
+
+
+def _publish(store, item: Dict[str, Any], result: Dict[str, Any], image_hash: str,
+             render: Future, update_meta: bool) -> None:
+    """Upload one rendered thumbnail and record it (runs on the upload pool)"""
+    filename = item['filename']
+    bucket_type = item.get('bucketType', 'app')
+    user_id = item.get('userId', 'default_user')
+    try:
+        png_bytes = render.result()
+    except Exception as e:
+        result.update({'status': 'failed', 'error': str(e) or e.__class__.__name__})
+        return
+
+    if not store.save_template_thumbnail(filename, png_bytes, bucket_type=bucket_type, user_id=user_id):
+        result.update({'status': 'failed', 'error': 'Thumbnail upload failed'})
+        return
+    _, key = store.template_thumbnail_location(filename, bucket_type, user_id)
+    if update_meta and not store.set_template_image(filename, key, image_hash,
+                                                    bucket_type=bucket_type, user_id=user_id):
+        result.update({'status': 'failed', 'error': 'Metadata update failed'})
+        return
+    result.update({'status': 'rendered', 'image': key, 'imageHash': image_hash, 'bytes': len(png_bytes)})
+
+
+def publish_template_thumbnails(store, items: List[Dict[str, Any]], update_meta: bool = True,
+                                force: bool = False, block: bool = True) -> Dict[str, Any]:
+    """
+    Render and store the thumbnails of several templates
+
+    Args:
+        store: S3Store
+        items: [{'filename', 'template': stored template data, 'bucketType':
+                'app'|'user', 'userId', 'meta': current metadata}]; when
+                'meta' is missing it is read from the bucket
+        update_meta: Record `image`/`imageHash` in the stored metadata
+                     (off when the caller writes the metadata itself)
+        force: Render even when the content hash is unchanged
+        block: Wait for free render slots instead of failing busy items
+
+    Returns:
+        Dict with per-item status ('rendered', 'skipped' or 'failed') and
+        `image`/`imageHash` for every template that has a thumbnail
+    """
+    results: List[Dict[str, Any]] = [{'filename': item['filename']} for item in items]
+    uploads = ThreadPoolExecutor(max_workers=THUMBNAIL_UPLOAD_WORKERS)
+    try:
+        missing = [item for item in items if 'meta' not in item]
+        metas = dict(zip(map(id, missing), uploads.map(
+            lambda item: store.get_template_meta(item['filename'], item.get('bucketType', 'app'),
+                                                 item.get('userId', 'default_user')), missing)))
+
+        published = []
+        for item, result in zip(items, results):
+            meta = item['meta'] if 'meta' in item else metas[id(item)]
+            try:
+                savestr = template_savestr(item['template'])
+                image_hash = template_image_hash(savestr)
+                _, key = store.template_thumbnail_location(
+                    item['filename'], item.get('bucketType', 'app'), item.get('userId', 'default_user'))
+                if not force and meta and meta.get('imageHash') == image_hash and meta.get('image') == key:
+                    result.update({'status': 'skipped', 'image': key, 'imageHash': image_hash})
+                    continue
+                # Renders queue on the render processes; an upload thread waits for each
+                render = submit_thumbnail(savestr, {}, block=block)
+            except Exception as e:
+                result.update({'status': 'failed', 'error': str(e) or e.__class__.__name__})
+                continue
+            published.append(uploads.submit(_publish, store, item, result, image_hash, render, update_meta))
+
+        for future in published:
+            future.result()
+    finally:
+        uploads.shutdown(wait=True)
+
+    counts = {status: sum(1 for result in results if result.get('status') == status)
+              for status in ('rendered', 'skipped', 'failed')}
+    return {
+        'success': not counts['failed'],
+        'data': {'items': results, **counts}
+    }
+
+
+def import_template_thumbnail(store, filename: str, target_filename: Optional[str] = None,
+                              user_id: str = 'default_user') -> Dict[str, Any]:
+    """
+    Give an imported user template its own thumbnail: a bucket copy of the
+    app template's when it has one for the same content, a render otherwise
+    (without waiting for a busy renderer; the thumbnail endpoint fills in
+    later)
+    """
+    target = target_filename or filename
+    meta = store.get_template_meta(target, 'user', user_id)
+    if meta and meta.get('image') and meta.get('imageHash'):
+        _, key = store.template_thumbnail_location(target, 'user', user_id)
+        if store.copy_template_thumbnail(filename, target, user_id) and \
+                store.set_template_image(target, key, meta['imageHash'], 'user', user_id):
+            return {
+                'success': True,
+                'data': {'filename': target, 'status': 'copied', 'image': key, 'imageHash': meta['imageHash']}
+            }
+
+    template = store.get_template(target, bucket_type='user', user_id=user_id)
+    if not template:
+        return {'success': False, 'error': f'Template not found: {target}'}
+    result = publish_template_thumbnails(store, [{
+        'filename': target, 'template': template, 'bucketType': 'user', 'userId': user_id, 'meta': meta,
+    }], block=False)
+    item = result['data']['items'][0]
+    if item.get('status') == 'failed':
+        return {'success': False, 'error': item.get('error', 'Thumbnail render failed')}
+    return {'success': True, 'data': item}
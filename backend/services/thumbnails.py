@@ -0,0 +1,341 @@
+"""
+Sheet Thumbnails
+Rasterizes the first page of a sheet straight to a PNG with Pillow, at a
+requested pixel size. Rows are laid out only until they leave the viewport,
+so a 10,000-row sheet costs no more than a one-page invoice. Finished PNGs
+are cached on disk by a hash of the savestr and the settings that affect the
+image.
+"""
+
+import json
+import os
+from concurrent.futures import Future
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, Any, List, Tuple
+
+import reportlab
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.lib.pagesizes import landscape, portrait
+from reportlab.lib.units import mm
+
+from services.cell_style import StyleResolver, CellStyle, FONT_FAMILIES, parse_length
+from services.formula_engine import get_engine
+from services.msc_parser import MSCSheet, DEFAULT_STYLE
+from services.pdf_cache import RenderedPDFCache, content_key
+from services.page_layout import compute_layout
+from services.pdf_generator import SocialCalcPDFGenerator, LINE_HEIGHT
+from services.sheet_grid import SparseGrid
+from services.value_format import cell_display_text
+
+
+THUMBNAIL_CACHE_DIR = os.environ.get('THUMBNAIL_CACHE_DIR') or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'tmp', 'thumbnail-cache')
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+THUMBNAIL_CACHE_TTL = float(os.environ.get('THUMBNAIL_CACHE_TTL', 7 * 24 * 3600))
+MAX_THUMBNAIL_SIDE = int(os.environ.get('THUMBNAIL_MAX_SIDE', 2000))
+
+# Bump when the rasterizer output changes so cached PNGs are not reused
+THUMBNAIL_VERSION = 2
+
+# Settings that change the image; everything else is left out of the cache key
+THUMBNAIL_SETTINGS = ('width', 'height', 'paperSize', 'orientation', 'margins',
+                      'scale', 'fitToPage', 'fitPages', 'includeGridlines')
+# Settings the fitPages scale also depends on (repeated header rows)
+FIT_PAGES_SETTINGS = ('largeSheet', 'headerRows', 'appMapping')
+
+MIN_TEXT_PX = 4  # below this text is drawn as a grey bar instead of glyphs
+GRIDLINE_COLOR = (192, 192, 192)
+GREEK_COLOR = (170, 170, 170)
+
+# ReportLab ships Bitstream Vera; every base-14 family maps onto it
+FONT_DIR = os.path.join(os.path.dirname(reportlab.__file__), 'fonts')
+VERA_FILES = ('Vera.ttf', 'VeraBd.ttf', 'VeraIt.ttf', 'VeraBI.ttf')
+FONT_FILES = {name: VERA_FILES[i] for names in FONT_FAMILIES.values() for i, name in enumerate(names)}
+
+
+@lru_cache(maxsize=256)
+def _font(name: str, size: int) -> ImageFont.ImageFont:
+    try:
+        return ImageFont.truetype(os.path.join(FONT_DIR, FONT_FILES.get(name, VERA_FILES[0])), size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def _rgb(color) -> Tuple[int, int, int]:
+    return (int(color.red * 255), int(color.green * 255), int(color.blue * 255))
+
+
+def page_size(settings: Dict[str, Any]) -> Tuple[float, float]:
+    """Page width and height in points for the paperSize/orientation settings"""
+    paper = SocialCalcPDFGenerator.PAPER_SIZES.get(settings.get('paperSize', 'a4'),
+                                                    SocialCalcPDFGenerator.PAPER_SIZES['a4'])
+    if settings.get('orientation', 'portrait') == 'landscape':
+        return landscape(paper)
+    return portrait(paper)
+
+
+def thumbnail_size(settings: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Pixel size of the thumbnail
+
+    `width` defaults to half the page width in points; `height` defaults to
+    the page's aspect ratio at that width. Both are capped at
+    MAX_THUMBNAIL_SIDE.
+    """
+    page_width, page_height = page_size(settings)
+    width = int(settings.get('width') or page_width * 0.5)
+    width = max(1, min(width, MAX_THUMBNAIL_SIDE))
+    height = int(settings.get('height') or width * page_height / page_width)
+    return width, max(1, min(height, MAX_THUMBNAIL_SIDE))
+
+
+def rasterize_sheet(sheet: MSCSheet, settings: Dict[str, Any]) -> bytes:
+    """
+    Draw the top of a sheet as it would sit on the first PDF page
+
+    Column widths, scale/fitToPage, margins, merged cells, backgrounds,
+    borders, fonts, alignment and value formats follow the PDF renderer.
+    Rows are laid out until they pass the bottom of the image.
+
+    Args:
+        sheet: Parsed sheet
+        settings: Thumbnail settings
+            - width, height: image size in pixels
+            - paperSize, orientation, margins, scale, fitToPage,
+              includeGridlines: as for PDF generation
+
+    Returns:
+        PNG image as bytes
+    """
+    width, height = thumbnail_size(settings)
+    page_width, _ = page_size(settings)
+    zoom = width / page_width  # pixels per point
+    margins = settings.get('margins') or {}
+    left = margins.get('left', 20) * mm
+    top = margins.get('top', 20) * mm
+    frame_width = page_width - left - margins.get('right', 20) * mm
+
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+
+    generator = SocialCalcPDFGenerator()
+    grid = generator.build_grid(sheet)
+    if grid.is_empty:
+        draw.text((left * zoom, top * zoom), 'No data to display', fill=(0, 0, 0),
+                  font=_font('Helvetica', max(1, round(9 * zoom))))
+        return _encode(image)
+
+    natural_widths = generator.column_widths(grid)
+    scale = generator.layout_scale(sum(natural_widths), frame_width, settings)
+    if settings.get('fitPages'):
+        # The PDF shrinks further to fit the page count
+        scale = compute_layout(sheet, settings).scale
+    resolver = StyleResolver(sheet, scale * zoom)  # resolved sizes are in pixels
+
+    col_x = [left * zoom]
+    for col_width in natural_widths:
+        col_x.append(col_x[-1] + col_width * scale * zoom)
+    last_col = len(natural_widths)
+
+    rows = _layout_rows(sheet, grid, resolver, top * zoom, height)
+    if not rows:
+        return _encode(image)
+    bottoms = {row: y + row_height for row, y, row_height, _ in rows}
+    grid_bottom = min(rows[-1][1] + rows[-1][2], height)
+
+    def cell_box(cell, y):
+        start = cell.col - grid.first_col
+        end = min(start + cell.colspan, last_col)
+        bottom = y
+        for row in range(cell.row, cell.row + cell.rowspan):
+            bottom = bottoms.get(row, height if row > rows[-1][0] else bottom)
+        return col_x[start], y, col_x[end], bottom
+
+    # Backgrounds; merged cells are filled so gridlines do not cross them
+    boxes = []
+    for _, y, _, entries in rows:
+        for cell, style, text in entries:
+            box = cell_box(cell, y)
+            boxes.append((box, style, text))
+            if style.background is not None:
+                draw.rectangle(box, fill=_rgb(style.background))
+            elif cell.colspan > 1 or cell.rowspan > 1:
+                draw.rectangle(box, fill='white')
+
+    if settings.get('includeGridlines', True):
+        grid_top = rows[0][1]
+        for x in col_x:
+            draw.line((x, grid_top, x, grid_bottom), fill=GRIDLINE_COLOR)
+        for _, y, _, _ in rows:
+            draw.line((col_x[0], y, col_x[-1], y), fill=GRIDLINE_COLOR)
+        draw.line((col_x[0], grid_bottom, col_x[-1], grid_bottom), fill=GRIDLINE_COLOR)
+
+    for (x0, y0, x1, y1), style, _ in boxes:
+        top_border, right_border, bottom_border, left_border = style.borders
+        for border, line in ((top_border, (x0, y0, x1, y0)), (right_border, (x1, y0, x1, y1)),
+                             (bottom_border, (x0, y1, x1, y1)), (left_border, (x0, y0, x0, y1))):
+            if border is not None:
+                draw.line(line, fill=_rgb(border.color), width=max(1, round(border.width)))
+
+    for box, style, text in boxes:
+        if text:
+            _draw_text(draw, box, style, text)
+
+    return _encode(image)
+
+
+def _layout_rows(sheet: MSCSheet, grid: SparseGrid, resolver: StyleResolver, y: float,
+                 viewport: float) -> List[Tuple[int, float, float, list]]:
+    """
+    (row, top, height, [(cell, style, text)]) for the visible rows that start
+    above `viewport`, heights in pixels as in SocialCalcPDFGenerator.row_heights
+    """
+    values = get_engine(sheet).values
+    base = resolver.resolve_style(DEFAULT_STYLE)
+    min_height = base.font_size * LINE_HEIGHT + base.padding[0] + base.padding[2]
+    hidden_rows, hidden_cols = sheet.hidden_rows, sheet.hidden_cols
+    covered = set()
+    rows = []
+    for row in grid.row_range:
+        if y >= viewport:
+            break
+        row_cells = grid.rows.get(row, {})
+        for col, cell in row_cells.items():
+            if cell.colspan > 1 or cell.rowspan > 1:
+                covered.update((c, r) for c in range(col, col + cell.colspan)
+                               for r in range(row, row + cell.rowspan) if (c, r) != (col, row))
+        if row in hidden_rows:
+            continue
+
+        row_height = parse_length(sheet.row_heights.get(row, ''))
+        row_height = row_height * resolver.scale if row_height else min_height
+        entries = []
+        for col, cell in row_cells.items():
+            if col in hidden_cols or (col, row) in covered:
+                continue
+            style = resolver.resolve(cell)
+            text = cell_display_text(sheet, cell, values.get(cell.ref))
+            entries.append((cell, style, text))
+            if text and cell.rowspan == 1:
+                needed = ((text.count('\n') + 1) * style.font_size * LINE_HEIGHT
+                          + style.padding[0] + style.padding[2])
+                if needed > row_height:
+                    row_height = needed
+        rows.append((row, y, row_height, entries))
+        y += row_height
+    return rows
+
+
+def _draw_text(draw: ImageDraw.ImageDraw, box: Tuple[float, float, float, float],
+               style: CellStyle, text: str) -> None:
+    x0, y0, x1, y1 = box
+    pad_top, pad_right, pad_bottom, pad_left = style.padding
+    size = style.font_size
+    lines = text.split('\n')
+    line_height = size * LINE_HEIGHT
+    block = line_height * len(lines)
+    if style.valign == 'TOP':
+        y = y0 + pad_top
+    elif style.valign == 'BOTTOM':
+        y = y1 - pad_bottom - block
+    else:
+        y = y0 + (y1 - y0 - block) / 2
+    color = _rgb(style.color) if style.color is not None else (0, 0, 0)
+
+    greek = size < MIN_TEXT_PX
+    font = None if greek else _font(style.font_name, round(size))
+    for line in lines:
+        if line:
+            # Greeked text approximates glyph width from the font size
+            line_width = len(line) * size * 0.55 if greek else font.getlength(line)
+            if style.align == 'RIGHT':
+                x = x1 - pad_right - line_width
+            elif style.align == 'CENTER':
+                x = x0 + (x1 - x0 - line_width) / 2
+            else:
+                x = x0 + pad_left
+            if greek:
+                bar = max(1.0, size * 0.5)
+                middle = y + line_height / 2
+                draw.rectangle((x, middle - bar / 2, x + line_width, middle + bar / 2), fill=GREEK_COLOR)
+            else:
+                draw.text((x, y + (line_height - size) / 2), line, fill=color, font=font)
+        y += line_height
+
+
+def _encode(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def thumbnail_key(savestr: str, settings: Dict[str, Any]) -> str:
+    """Cache key of a thumbnail: savestr plus the image-affecting settings"""
+    relevant = {name: settings.get(name) for name in THUMBNAIL_SETTINGS}
+    if settings.get('fitPages'):
+        relevant.update({name: settings.get(name) for name in FIT_PAGES_SETTINGS})
+    return content_key('thumbnail', THUMBNAIL_VERSION, savestr, relevant)
+
+
+def render_thumbnail(savestr: str, settings: Dict[str, Any]) -> bytes:
+    """
+    PNG thumbnail of a savestr, from the cache or rendered on a render process
+
+    Raises:
+        RendererBusyError: The render processes are saturated
+    """
+    key = thumbnail_key(savestr, settings)
+    png_bytes = thumbnail_cache.get(key)
+    if png_bytes is not None:
+        return png_bytes
+
+    from services.render_executor import render_executor
+    png_bytes = render_executor.render_preview(savestr, settings)
+    try:
+        thumbnail_cache.put(key, png_bytes)
+    except OSError as e:
+        print(f"Error writing thumbnail cache entry: {str(e)}")
+    return png_bytes
+
+
+def submit_thumbnail(savestr: str, settings: Dict[str, Any], block: bool = False) -> Future:
+    """
+    Thumbnail as a future: already resolved on a cache hit, otherwise queued
+    on the render processes and cached when it finishes, so callers can keep
+    many renders in flight
+
+    Raises:
+        RendererBusyError: The render processes are saturated (block=False)
+    """
+    key = thumbnail_key(savestr, settings)
+    png_bytes = thumbnail_cache.get(key)
+    if png_bytes is not None:
+        future: Future = Future()
+        future.set_result(png_bytes)
+        return future
+
+    def cache(done: Future) -> None:
+        if done.cancelled() or done.exception() is not None:
+            return
+        try:
+            thumbnail_cache.put(key, done.result())
+        except OSError as e:
+            print(f"Error writing thumbnail cache entry: {str(e)}")
+
+    from services.render_executor import render_executor
+    future = render_executor.submit_preview(savestr, settings, block=block)
+    future.add_done_callback(cache)
+    return future
+
+
+def template_savestr(template: Dict[str, Any]) -> str:
+    """Savestr of the current sheet of a stored template ({"msc": {"sheetArr": ...}, ...})"""
+    from services.msc_parser import extract_savestr
+    workbook = template.get('msc', template)
+    return extract_savestr(json.dumps(workbook) if isinstance(workbook, dict) else workbook)
+
+
+# Process-wide PNG cache in front of the preview renderers
+thumbnail_cache = RenderedPDFCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES,
+                                   THUMBNAIL_CACHE_TTL, suffix='.png')
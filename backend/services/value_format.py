@@ -0,0 +1,328 @@
+"""
+Value Formatting
+Renders cell values with SocialCalc valueformat definitions ('$#,##0.00',
+'0.0%', 'm/d/yyyy', 'text-html', ...) so server-side renderers show the same
+text as the spreadsheet instead of raw saved values.
+"""
+
+import datetime
+import html
+import math
+import re
+from typing import Any, List, Tuple, Union
+
+from services.formula_engine import FormulaError
+from services.msc_parser import MSCSheet, MSCCell
+
+
+# Formats SocialCalc applies to typed numbers when the cell has no explicit format
+DEFAULT_NUMBER_FORMATS = {
+    'n$': '$#,##0.00',
+    'n%': '#,##0.0%',
+    'nd': 'd-mmm-yyyy',
+    'nt': 'h:mm:ss',
+    'ndt': 'd-mmm-yyyy h:mm:ss',
+}
+
+_SERIAL_EPOCH = datetime.datetime(1899, 12, 30)
+_MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+           'August', 'September', 'October', 'November', 'December']
+_DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+_TOKEN_RE = re.compile(
+    r'"([^"]*)"'                 # quoted literal
+    r'|\\(.)'                    # escaped character
+    r'|_(.)'                     # space the width of a character
+    r'|\*(.)'                    # repeat-to-fill (not applied)
+    r'|\[[^\]]*\]'               # [Red], [$-409] ... (ignored)
+    r'|(AM/PM|am/pm|A/P|a/p)'    # 12-hour clock marker
+    r'|(y+|m+|d+|h+|s+)'         # date/time part
+    r'|([0#?])'                  # digit placeholder
+    r'|(.)',                     # anything else: separators and literal text
+    re.S,
+)
+_HTML_TAG_RE = re.compile(r'<[^>]*>')
+
+Token = Tuple[str, str]
+
+_parsed_formats = {}
+
+
+def _tokenize_section(section: str) -> List[Token]:
+    tokens = []
+    for match in _TOKEN_RE.finditer(section):
+        quoted, escaped, space, fill, ampm, datepart, digit, other = match.groups()
+        if quoted is not None:
+            tokens.append(('lit', quoted))
+        elif escaped is not None:
+            tokens.append(('lit', escaped))
+        elif space is not None:
+            tokens.append(('lit', ' '))
+        elif fill is not None:
+            continue
+        elif ampm is not None:
+            tokens.append(('ampm', ampm))
+        elif datepart is not None:
+            tokens.append(('date', datepart.lower()))
+        elif digit is not None:
+            tokens.append(('digit', digit))
+        elif other is not None:
+            tokens.append(('op' if other in '.,%' else 'lit', other))
+    return tokens
+
+
+def _parse_format(fmt: str) -> List[List[Token]]:
+    sections = _parsed_formats.get(fmt)
+    if sections is None:
+        # Split on ';' outside quotes
+        parts, current, quoted = [], '', False
+        for ch in fmt:
+            if ch == '"':
+                quoted = not quoted
+            if ch == ';' and not quoted:
+                parts.append(current)
+                current = ''
+            else:
+                current += ch
+        parts.append(current)
+        sections = [_tokenize_section(part) for part in parts]
+        if len(_parsed_formats) < 1024:
+            _parsed_formats[fmt] = sections
+    return sections
+
+
+def format_general(number: float) -> str:
+    """Default display: integers without decimals, otherwise up to 15 significant digits"""
+    if not math.isfinite(number):
+        # NaN and infinities are out-of-range results in a spreadsheet
+        return '#NUM!'
+    if number.is_integer() and abs(number) < 1e15:
+        return str(int(number))
+    return f'{number:.15g}'
+
+
+def _format_date(number: float, tokens: List[Token]) -> str:
+    try:
+        when = _SERIAL_EPOCH + datetime.timedelta(days=number)
+    except OverflowError:
+        return format_general(number)
+    when = when + datetime.timedelta(microseconds=500000)  # round to the second
+    twelve_hour = any(kind == 'ampm' for kind, _ in tokens)
+
+    out = []
+    for i, (kind, text) in enumerate(tokens):
+        if kind == 'date':
+            code = text[0]
+            if code == 'm':
+                # 'm' right after hours or right before seconds means minutes
+                prev = next((t for k, t in reversed(tokens[:i]) if k == 'date'), '')
+                nxt = next((t for k, t in tokens[i + 1:] if k == 'date'), '')
+                if prev.startswith('h') or nxt.startswith('s'):
+                    out.append(f'{when.minute:02d}' if len(text) > 1 else str(when.minute))
+                elif len(text) >= 4:
+                    out.append(_MONTHS[when.month - 1])
+                elif len(text) == 3:
+                    out.append(_MONTHS[when.month - 1][:3])
+                else:
+                    out.append(f'{when.month:0{len(text)}d}')
+            elif code == 'd':
+                if len(text) >= 4:
+                    out.append(_DAYS[when.weekday()])
+                elif len(text) == 3:
+                    out.append(_DAYS[when.weekday()][:3])
+                else:
+                    out.append(f'{when.day:0{len(text)}d}')
+            elif code == 'y':
+                out.append(str(when.year) if len(text) > 2 else f'{when.year % 100:02d}')
+            elif code == 'h':
+                hour = when.hour % 12 or 12 if twelve_hour else when.hour
+                out.append(f'{hour:0{min(len(text), 2)}d}')
+            elif code == 's':
+                out.append(f'{when.second:0{min(len(text), 2)}d}')
+        elif kind == 'ampm':
+            pm = when.hour >= 12
+            if text.upper() == 'AM/PM':
+                marker = 'PM' if pm else 'AM'
+            else:
+                marker = 'P' if pm else 'A'
+            out.append(marker if text[0].isupper() else marker.lower())
+        else:
+            out.append(text)
+    return ''.join(out)
+
+
+def _format_number(number: float, tokens: List[Token]) -> str:
+    """Apply one numeric section; `number` is already sign-adjusted by the caller"""
+    percent = sum(1 for kind, text in tokens if kind == 'op' and text == '%')
+    number *= 100 ** percent
+
+    # Split placeholders into integer and fraction parts
+    point = next((i for i, (kind, text) in enumerate(tokens) if kind == 'op' and text == '.'), None)
+    int_tokens = tokens if point is None else tokens[:point]
+    frac_tokens = [] if point is None else tokens[point + 1:]
+    decimals = sum(1 for kind, _ in frac_tokens if kind == 'digit')
+    int_places = [i for i, (kind, _) in enumerate(int_tokens) if kind == 'digit']
+    thousands = False
+    if int_places:
+        first, last = int_places[0], int_places[-1]
+        thousands = any(kind == 'op' and text == ',' for kind, text in int_tokens[first:last + 1])
+    # Trailing commas scale by thousands
+    if int_places:
+        trailing = int_tokens[int_places[-1] + 1:]
+        for kind, text in trailing:
+            if kind == 'op' and text == ',':
+                number /= 1000
+            else:
+                break
+
+    rounded = f'{abs(number):.{decimals}f}'
+    int_digits, _, frac_digits = rounded.partition('.')
+    negative = number < 0 and float(rounded) != 0
+
+    # Fraction: '0' always shows, '#' drops trailing zeros
+    keep = len(frac_digits)
+    frac_codes = [text for kind, text in frac_tokens if kind == 'digit']
+    while keep > 0 and frac_codes[keep - 1] == '#' and frac_digits[keep - 1] == '0':
+        keep -= 1
+
+    # Integer: digits fill placeholders from the right; extra digits go in the first one
+    min_digits = sum(1 for i in int_places if int_tokens[i][1] == '0')
+    if int_digits == '0' and min_digits == 0:
+        int_digits = ''
+    int_digits = int_digits.rjust(min_digits, '0')
+
+    out = []
+    if int_places and (thousands or _contiguous(int_tokens, int_places)):
+        digits = _group(int_digits) if thousands else int_digits
+        for i, (kind, text) in enumerate(int_tokens):
+            if i == int_places[0]:
+                out.append(digits)
+            elif int_places[0] < i <= int_places[-1]:
+                if kind not in ('digit', 'op'):
+                    out.append(text)
+            elif kind == 'op' and text == ',':
+                continue
+            else:
+                out.append(text)
+    else:
+        remaining = list(int_digits)
+        filled = {}
+        for i in reversed(int_places):
+            filled[i] = remaining.pop() if remaining else ('0' if int_tokens[i][1] == '0' else '')
+        if int_places and remaining:
+            filled[int_places[0]] = ''.join(remaining) + filled[int_places[0]]
+        for i, (kind, text) in enumerate(int_tokens):
+            if i in filled:
+                out.append(filled[i])
+            elif kind == 'op' and text == ',':
+                continue
+            else:
+                out.append(text)
+
+    if point is not None:
+        if keep or any(code == '0' for code in frac_codes):
+            out.append('.')
+        digit_index = 0
+        for kind, text in frac_tokens:
+            if kind == 'digit':
+                if digit_index < keep:
+                    out.append(frac_digits[digit_index])
+                digit_index += 1
+            elif not (kind == 'op' and text in '.,'):
+                out.append(text)
+
+    text = ''.join(out)
+    return f'-{text}' if negative else text
+
+
+def _contiguous(tokens: List[Token], places: List[int]) -> bool:
+    return places[-1] - places[0] + 1 == len(places)
+
+
+def _group(digits: str) -> str:
+    head = len(digits) % 3 or 3
+    groups = [digits[:head]] + [digits[i:i + 3] for i in range(head, len(digits), 3)]
+    return ','.join(group for group in groups if group)
+
+
+def format_number_value(number: float, fmt: str = '') -> str:
+    """
+    Format a number with a SocialCalc/Excel-style number format
+
+    Sections are 'positive;negative;zero'. Supports digit placeholders
+    (0 and #), thousands separators, percent, quoted literals and date/time
+    codes (dates are serial days since 1899-12-30).
+    """
+    if not fmt or fmt.lower() == 'general' or not math.isfinite(number):
+        return format_general(number)
+
+    sections = _parse_format(fmt)
+    if number < 0 and len(sections) > 1:
+        tokens, number = sections[1], -number
+    elif number == 0 and len(sections) > 2:
+        tokens = sections[2]
+    else:
+        tokens = sections[0]
+
+    if not any(kind in ('digit', 'date') for kind, _ in tokens):
+        # Literal-only section such as '-' or '"$ "-'
+        return ''.join(text for kind, text in tokens if kind != 'ampm')
+    if any(kind == 'date' for kind, _ in tokens) and not any(kind == 'digit' for kind, _ in tokens):
+        return _format_date(number, tokens)
+    return _format_number(number, tokens)
+
+
+def format_text_value(text: str, fmt: str = '') -> str:
+    """Format a text value with a text valueformat ('text-plain', 'text-html', 'hidden', ...)"""
+    if fmt == 'hidden' or fmt == 'text-image':
+        return ''
+    if fmt == 'text-html':
+        return html.unescape(_HTML_TAG_RE.sub('', text.replace('<br>', '\n')))
+    return text
+
+
+def format_cell_value(value: Union[float, str, bool, FormulaError, None], valuetype: str,
+                      fmt: str = '') -> str:
+    """
+    Display text for an (evaluated) cell value
+
+    Args:
+        value: Number, text, boolean, formula error or None
+        valuetype: SocialCalc value type of the cell ('n', 'n$', 'nd', 't', ...)
+        fmt: Value format definition for the cell ('' for the default)
+    """
+    if value is None:
+        return ''
+    if isinstance(value, FormulaError):
+        return value.code
+    if value.__class__ is bool:
+        return 'TRUE' if value else 'FALSE'
+    if value.__class__ is float:
+        if fmt == 'hidden':
+            return ''
+        if (not fmt or fmt.lower() == 'general') and valuetype in DEFAULT_NUMBER_FORMATS:
+            fmt = DEFAULT_NUMBER_FORMATS[valuetype]
+        if fmt.startswith('text-'):
+            return format_general(value)
+        return format_number_value(value, fmt)
+    if not fmt and valuetype == 'th':
+        fmt = 'text-html'
+    return format_text_value(value, fmt)
+
+
+def cell_display_text(sheet: MSCSheet, cell: MSCCell, value: Any) -> str:
+    """
+    Display text for a cell, using its value format or the sheet default
+    (sheet:ntvf for numbers, sheet:tvf for text)
+
+    Args:
+        sheet: Sheet the cell belongs to
+        cell: The cell
+        value: Evaluated value of the cell (see FormulaEngine.values)
+    """
+    if value.__class__ is str:
+        index = cell.textvalueformat or sheet.attribs.get('tvf', '')
+    else:
+        index = cell.nontextvalueformat or sheet.attribs.get('ntvf', '')
+    fmt = sheet.valueformats.get(int(index), '') if index and str(index).isdigit() else ''
+    return format_cell_value(value, cell.valuetype, fmt)
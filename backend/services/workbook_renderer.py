@@ -0,0 +1,196 @@
+"""
+Workbook Renderer
+Renders every visible sheet of a multi-sheet workbook in one request: each
+sheet is queued on the ReportLab render processes (see render_executor), so
+sheets render in parallel without contending for the GIL and within the
+executor's queue limits; the results are assembled in workbook order into a
+single multi-page PDF (one bookmark per sheet) or a list of previews. PNG
+previews go through the thumbnail cache. Per-sheet timings are returned
+alongside the output.
+"""
+
+import base64
+import time
+from concurrent.futures import Future
+from io import BytesIO
+from typing import Dict, Any, List, Callable, Tuple
+
+from services.msc_parser import WorkbookSheet, extract_workbook_sheets
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def visible_sheets(sheet_data: str) -> List[WorkbookSheet]:
+    """Workbook sheets to render; hidden sheets are skipped unless all are hidden"""
+    sheets = extract_workbook_sheets(sheet_data)
+    return [s for s in sheets if not s.hidden] or sheets
+
+
+def _render_all(sheets: List[WorkbookSheet], submit: Callable[[str], Future]) -> List[Tuple[Any, Dict, str]]:
+    """
+    Queue every sheet with `submit(savestr)` and collect the results in
+    workbook order; each sheet's renderMs runs from its own submission to
+    its own completion
+
+    Returns:
+        (result, timings, error) per sheet; result is None when error is set
+    """
+    from services.render_executor import render_executor
+
+    pending = []
+    for sheet in sheets:
+        submitted = time.perf_counter()
+        try:
+            future = submit(sheet.savestr)
+        except Exception as e:
+            pending.append((e, submitted, None))
+            continue
+        finished: List[float] = []
+        future.add_done_callback(lambda done, finished=finished: finished.append(time.perf_counter()))
+        pending.append((future, submitted, finished))
+
+    results = []
+    for future, submitted, finished in pending:
+        if isinstance(future, Exception):
+            results.append((None, {}, str(future) or future.__class__.__name__))
+            continue
+        try:
+            result = render_executor.result(future)
+            # result() can return just before the done callback has run
+            done = finished[0] if finished else time.perf_counter()
+            results.append((result, {'renderMs': _ms(done - submitted)}, None))
+        except Exception as e:
+            results.append((None, {}, str(e) or e.__class__.__name__))
+    return results
+
+
+def _sheet_info(sheet: WorkbookSheet, timings: Dict[str, float]) -> Dict[str, Any]:
+    return {'id': sheet.id, 'name': sheet.name, 'timings': timings}
+
+
+def render_workbook_pdf(sheet_data: str, settings: Dict[str, Any], raw: bool = False) -> Dict[str, Any]:
+    """
+    Render all visible sheets of a workbook into one multi-page PDF
+
+    Sheets render in parallel on the render processes; their PDFs are then
+    merged in workbook order, each sheet starting on a new page.
+
+    Args:
+        sheet_data: JSON workbook (raw MSC renders as a single sheet)
+        settings: PDF generation settings
+        raw: Return the PDF as bytes instead of base64
+
+    Returns:
+        Dictionary with success status, PDF data and per-sheet timings
+    """
+    from services.batch_render import merge_pdfs
+    from services.render_executor import render_executor
+
+    try:
+        start = time.perf_counter()
+        sheets = visible_sheets(sheet_data)
+
+        results = _render_all(
+            sheets, lambda savestr: render_executor.submit_pdf(savestr, settings, block=True))
+        for sheet, (_, _, error) in zip(sheets, results):
+            if error:
+                raise ValueError(f'Sheet {sheet.name}: {error}')
+
+        merge_start = time.perf_counter()
+        pdf_bytes, errors = merge_pdfs([pdf for pdf, _, _ in results], [sheet.name for sheet in sheets])
+        if errors:
+            index, error = next(iter(errors.items()))
+            raise ValueError(f'Sheet {sheets[index].name}: {error}')
+        from pypdf import PdfReader
+        pages = len(PdfReader(BytesIO(pdf_bytes)).pages)
+        done = time.perf_counter()
+
+        filename = f"workbook_{settings.get('paperSize', 'a4')}_{settings.get('orientation', 'portrait')}.pdf"
+
+        return {
+            'success': True,
+            'data': {
+                'pdf': pdf_bytes if raw else base64.b64encode(pdf_bytes).decode('utf-8'),
+                'filename': filename,
+                'pages': pages,
+                'sheets': [_sheet_info(sheet, timings) for sheet, (_, timings, _) in zip(sheets, results)],
+                'timings': {'mergeMs': _ms(done - merge_start), 'totalMs': _ms(done - start)},
+            }
+        }
+
+    except Exception as e:
+        return {
+            'success': False,
+            'error': f'Failed to generate PDF: {str(e)}'
+        }
+
+
+def render_workbook_previews(sheet_data: str, settings: Dict[str, Any],
+                             preview_type: str = 'html') -> Dict[str, Any]:
+    """
+    Render a preview for every visible sheet of a workbook
+
+    A sheet that fails to render is reported with its error instead of
+    failing the whole workbook.
+
+    Args:
+        sheet_data: JSON workbook (raw MSC renders as a single sheet)
+        settings: Preview generation settings
+        preview_type: 'html' or 'image' (PNG)
+
+    Returns:
+        Dictionary with success status and a preview per sheet
+    """
+    if preview_type == 'image':
+        from services.thumbnails import submit_thumbnail
+        submit = lambda savestr: submit_thumbnail(savestr, settings, block=True)
+    else:
+        from services.html_preview import render_sheet_html
+        from services.sheet_cache import get_parsed_sheet
+
+        def submit(savestr: str) -> Future:
+            # HTML previews are cheap string building; they run here
+            future: Future = Future()
+            try:
+                future.set_result(render_sheet_html(get_parsed_sheet(savestr), settings).encode('utf-8'))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+    try:
+        start = time.perf_counter()
+        sheets = visible_sheets(sheet_data)
+        results = _render_all(sheets, submit)
+
+        previews = []
+        for sheet, (output, timings, error) in zip(sheets, results):
+            entry = _sheet_info(sheet, timings)
+            if error:
+                entry.update({'success': False, 'error': error})
+            else:
+                entry.update({
+                    'success': True,
+                    'preview': base64.b64encode(output).decode('utf-8'),
+                    'type': preview_type,
+                })
+            previews.append(entry)
+
+        succeeded = any(p['success'] for p in previews)
+        result = {
+            'success': succeeded,
+            'data': {
+                'sheets': previews,
+                'timings': {'totalMs': _ms(time.perf_counter() - start)},
+            }
+        }
+        if not succeeded:
+            result['error'] = 'Failed to generate preview for every sheet'
+        return result
+
+    except Exception as e:
+        return {
+            'success': False,
+            'error': f'Failed to generate preview: {str(e)}'
+        }